@@ -53,7 +53,19 @@ class Settings(BaseSettings):
     llm_api_base: str = "https://api.openai.com/v1"
     llm_model: str = "gpt-4"
     llm_max_concurrent: int = 20
+    llm_rpm_limit: Optional[int] = None  # 每分钟请求数上限（None=不限制）
+    llm_tpm_limit: Optional[int] = None  # 每分钟token数上限（None=不限制）
+    llm_adaptive_concurrency: bool = False  # AIMD自适应并发（上限为llm_max_concurrent）
+    llm_min_concurrent: int = 1  # 自适应并发下限
+    llm_endpoints: Optional[str] = None  # 多端点配置（JSON字符串或文件路径）
+    llm_stream: bool = False  # 流式生成推文（SCENE完成即终止）
+    llm_hedge: bool = False  # 超过p95时发出对冲请求
+    llm_hedge_budget: float = 0.05  # 最多允许对冲的请求比例
+    llm_cache_path: Optional[str] = None  # 本地LLM响应缓存路径（None=不启用）
+    llm_cache_ttl: Optional[float] = None  # 缓存有效期（秒，None=永久）
+    llm_cache_max_mb: int = 512  # 缓存大小上限（LRU淘汰）
     llm_temperature: float = 1.0
+    persona_window: int = 0  # 批量人设同时生成的数量（0=按llm_max_concurrent自动）
 
     # ===== 天气API配置 =====
     weather_api_key: Optional[str] = None
@@ -0,0 +1,231 @@
+"""
+离线批量提交 - OpenAI Batch API 格式的请求/结果 JSONL
+用于隔夜的大批量内容池生成：先把所有计划好的请求渲染成批量文件提交，
+拿到结果文件后再解析、检查长度、组装成与 generate_pool 相同的内容池文件
+"""
+import json
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import sys
+import logging
+
+# 添加路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.content_planner import ContentPlanner
+from core.tweet_generator import StandaloneTweetGenerator, BatchTweetGenerator
+
+logger = logging.getLogger(__name__)
+
+BATCH_URL = "/v1/chat/completions"
+
+
+def make_custom_id(run_id: str, persona_key: str, index: int) -> str:
+    """请求ID：运行ID + 人设文件名 + 计划内序号（同一批次内唯一且稳定）"""
+    return f"{run_id}-{persona_key}-{index:06d}"
+
+
+def persona_key_for(persona_file: str) -> str:
+    """manifest中的人设key（人设文件名，同一批次内必须唯一）"""
+    return Path(persona_file).stem
+
+
+def manifest_path_for(batch_file: str) -> Path:
+    """批量请求文件对应的manifest路径（xxx.jsonl -> xxx.manifest.json）"""
+    path = Path(batch_file)
+    return path.with_name(f"{path.stem}.manifest.json")
+
+
+def render_batch_file(
+    generator: StandaloneTweetGenerator,
+    personas: List[Tuple[str, Dict, int]],
+    batch_file: str,
+    model: str,
+    temperature: float = 1.0,
+    run_id: Optional[str] = None,
+    plan_strategy: str = "random"
+) -> Dict:
+    """
+    把所有人设的内容计划渲染成批量请求JSONL，并写出manifest（custom_id -> spec）
+
+    Args:
+        generator: 推文生成器（只用于构建prompt，不调用LLM）
+        personas: [(人设文件路径, 人设JSON, 推文数量)]
+        batch_file: 输出的批量请求JSONL路径
+        model: 请求体中的模型名称
+        temperature: 温度参数
+        run_id: 运行ID（默认随机生成）
+        plan_strategy: 内容计划的规划策略（见 ContentPlanner.STRATEGIES）
+
+    Returns:
+        manifest字典
+    """
+    # 人设key决定 custom_id 和输出文件名，不同目录下的同名人设文件会互相覆盖
+    seen: Dict[str, str] = {}
+    for persona_file, _, _ in personas:
+        persona_key = persona_key_for(persona_file)
+        if persona_key in seen:
+            raise ValueError(f"人设文件名重复: {seen[persona_key]} 与 {persona_file}（批量模式按文件名区分人设）")
+        seen[persona_key] = str(persona_file)
+
+    run_id = run_id or uuid.uuid4().hex[:8]
+    manifest = {
+        "run_id": run_id,
+        "created_at": datetime.now().isoformat(),
+        "model": model,
+        "temperature": temperature,
+        "batch_file": str(batch_file),
+        "personas": {}
+    }
+
+    Path(batch_file).parent.mkdir(parents=True, exist_ok=True)
+    total = 0
+    with open(batch_file, 'w', encoding='utf-8') as f:
+        for persona_file, persona, count in personas:
+            persona_key = persona_key_for(persona_file)
+            explicit_nudity_allowed = persona.get('data', {}).get('nsfw_level') == 'enabled'
+
+            planner = ContentPlanner(strategy=plan_strategy)
+            plan = planner.create_content_plan(persona, total_count=count)
+
+            entries = []
+            for specs in plan['detailed_plan'].values():
+                for spec in specs:
+                    custom_id = make_custom_id(run_id, persona_key, len(entries))
+                    request = {
+                        "custom_id": custom_id,
+                        "method": "POST",
+                        "url": BATCH_URL,
+                        "body": {
+                            "model": model,
+                            "messages": generator.build_spec_messages(persona, spec, explicit_nudity_allowed),
+                            "temperature": temperature,
+                            "max_tokens": generator.MAX_TOKENS
+                        }
+                    }
+                    f.write(json.dumps(request, ensure_ascii=False) + "\n")
+                    entries.append({"custom_id": custom_id, "spec": spec})
+
+            manifest["personas"][persona_key] = {
+                "persona_file": str(persona_file),
+                "plan": {
+                    "archetype": plan['archetype'],
+                    "total_count": plan['total_count'],
+                    "distribution": plan['distribution']
+                },
+                "diversity_stats": planner.get_diversity_report(),
+                "requests": entries
+            }
+            total += len(entries)
+            logger.info(f"  {persona_key}: {len(entries)} 个请求")
+
+    with open(manifest_path_for(batch_file), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    logger.info(f"批量请求文件: {batch_file} ({total} 个请求, run_id={run_id})")
+    return manifest
+
+
+def load_batch_results(results_file: str) -> Dict[str, Optional[str]]:
+    """
+    读取批量结果JSONL
+
+    Returns:
+        {custom_id: 响应文本}，失败的请求值为None
+    """
+    results: Dict[str, Optional[str]] = {}
+    with open(results_file, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"结果文件第{line_no}行不是合法JSON，跳过: {e}")
+                continue
+
+            custom_id = record.get("custom_id")
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                logger.warning(f"{custom_id}: 请求失败 {record.get('error') or response.get('status_code')}")
+                results[custom_id] = None
+                continue
+
+            try:
+                results[custom_id] = response["body"]["choices"][0]["message"]["content"]
+            except (KeyError, IndexError, TypeError):
+                logger.warning(f"{custom_id}: 响应缺少 choices[0].message.content")
+                results[custom_id] = None
+    return results
+
+
+async def ingest_batch_results(
+    generator: StandaloneTweetGenerator,
+    manifest_file: str,
+    results_file: str,
+    output_dir: str
+) -> List[Path]:
+    """
+    解析批量结果：_parse_response + 长度/规则检查（不合格的通过LLM改写）+ 组装内容池文件
+
+    Args:
+        generator: 推文生成器（超长推文改写时调用LLM）
+        manifest_file: render_batch_file 写出的manifest
+        results_file: 批量结果JSONL
+        output_dir: 内容池文件输出目录
+
+    Returns:
+        写出的内容池文件路径列表
+    """
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    results = load_batch_results(results_file)
+
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    written = []
+
+    for persona_key, entry in manifest["personas"].items():
+        with open(entry["persona_file"], 'r', encoding='utf-8') as f:
+            persona = json.load(f)
+
+        tweets = []
+        failed_count = 0
+        for request in entry["requests"]:
+            response = results.get(request["custom_id"])
+            if not response:
+                failed_count += 1
+                continue
+            spec = request["spec"]
+            result = generator._parse_response(response, spec, persona)
+            generator._add_spec_fields(result, spec)
+            tweets.append(result)
+
+        # 超长/违规推文：本地缩短 + 批量改写（经过LLM池，遵守并发/限流）
+        rewritten, violations, repair_stats = await generator.repair_tweets(
+            [tweet.get("tweet_text", "") for tweet in tweets], persona
+        )
+        for tweet, tweet_text, remaining in zip(tweets, rewritten, violations):
+            generator.apply_repair(tweet, tweet_text, remaining)
+        if repair_stats["overlong"] or repair_stats["violations"]:
+            logger.info(
+                f"  {persona_key}: 超长 {repair_stats['overlong']} 条, 违规 {repair_stats['violations']} 条, "
+                f"本地缩短 {repair_stats['local_fixed']} 条, 节省改写调用 {repair_stats['llm_calls_avoided']} 次"
+            )
+
+        pool = BatchTweetGenerator.build_pool_result(
+            persona, entry["plan"], entry["diversity_stats"], tweets
+        )
+        # 文件名带人设key和run_id：同名人设、同一秒内写出的文件互不覆盖；
+        # 以人设名开头，补量模式（按 "{人设名}_*.json" 查找已有内容池）仍能找到
+        persona_name = persona["data"]["name"]
+        output_file = output_path / f"{persona_name}_{persona_key}_{manifest['run_id']}.json"
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(pool, f, ensure_ascii=False, indent=2)
+
+        logger.info(f"  {persona_key}: 成功 {len(tweets)} 条, 失败 {failed_count} 条 -> {output_file}")
+        written.append(output_file)
+
+    return written
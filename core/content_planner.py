@@ -2,9 +2,13 @@
 内容计划生成器
 根据persona的archetype和配置生成详细的内容生成计划
 """
+import base64
+import json
+import os
 import random
-from typing import Dict, List, Any, Tuple
-from collections import defaultdict
+import zlib
+from typing import Dict, Iterable, List, Any, Optional, Tuple
+from collections import Counter, defaultdict
 from pathlib import Path
 import sys
 
@@ -15,78 +19,421 @@ sys.path.insert(0, str(PROJECT_ROOT))
 from utils.config_loader import get_config_loader
 
 
+class VariationSpace:
+    """
+    单个 (content_type, subtype) 的变化组合空间
+
+    把各维度的选项看作混合进制数的各位，组合 <-> 整数下标 [0, size)；
+    用惰性 Fisher-Yates 洗牌做不放回抽样（只记录被交换过的位置），每次抽取 O(1)，
+    空间用尽前保证不重复。
+    """
+
+    def __init__(self, variations: Dict[str, List[str]]):
+        self.dims = list(variations)
+        self.options = [list(variations[dim]) for dim in self.dims]
+        self._positions = [{value: i for i, value in enumerate(opts)} for opts in self.options]
+        self.size = 1
+        for opts in self.options:
+            self.size *= len(opts)
+
+        self.used = set()  # 已使用的组合下标（本轮）
+        self._swaps: Dict[int, int] = {}  # 惰性排列中被交换过的位置
+        self._drawn = 0  # 排列中已抽取的位置数
+        self.rounds = 0  # 已用尽的轮数
+        # 维度和选项的指纹：配置变化后旧的下标不再对应同一组合
+        self.fingerprint = zlib.crc32(json.dumps([self.dims, self.options], ensure_ascii=False).encode("utf-8"))
+
+    def encode(self, combo: Dict[str, str]) -> Optional[int]:
+        """组合 -> 下标（含空间外的维度或选项时返回None）"""
+        index = 0
+        for dim, opts, positions in zip(self.dims, self.options, self._positions):
+            position = positions.get(combo.get(dim))
+            if position is None:
+                return None
+            index = index * len(opts) + position
+        return index
+
+    def decode(self, index: int) -> Dict[str, str]:
+        """下标 -> 组合"""
+        values = []
+        for opts in reversed(self.options):
+            index, position = divmod(index, len(opts))
+            values.append(opts[position])
+        return dict(zip(self.dims, reversed(values)))
+
+    def _next_index(self) -> int:
+        """惰性排列的下一个位置"""
+        j = random.randrange(self._drawn, self.size)
+        value = self._swaps.get(j, j)
+        self._swaps[j] = self._swaps.pop(self._drawn, self._drawn)
+        self._drawn += 1
+        return value
+
+    def draw(self) -> Tuple[int, bool]:
+        """
+        抽取一个本轮未使用的组合下标
+
+        Returns:
+            (下标, 是否开始了新一轮)：空间用尽后清空本轮记录重新洗牌，之后的组合与之前的轮次重复
+        """
+        new_round = False
+        while True:
+            if self._drawn >= self.size or len(self.used) >= self.size:
+                self.start_round()
+                new_round = True
+            index = self._next_index()
+            # 预先登记（mark）过的下标在排列中遇到时跳过，每个最多跳过一次
+            if index not in self.used:
+                self.used.add(index)
+                return index, new_round
+
+    def start_round(self) -> None:
+        """空间用尽：清空本轮记录，重新洗牌"""
+        self.used.clear()
+        self._swaps.clear()
+        self._drawn = 0
+        self.rounds += 1
+
+    def claim(self, index: int) -> bool:
+        """把指定下标登记为本轮已使用（已被使用时返回False）"""
+        if index in self.used:
+            return False
+        self.used.add(index)
+        return True
+
+    @property
+    def remaining(self) -> int:
+        """本轮剩余未使用的组合数"""
+        return self.size - len(self.used)
+
+    def to_state(self) -> Dict[str, Any]:
+        """持久化状态：已使用的下标存为位图（base64）"""
+        bits = bytearray((self.size + 7) // 8)
+        for index in self.used:
+            bits[index >> 3] |= 1 << (index & 7)
+        return {
+            "fingerprint": self.fingerprint,
+            "size": self.size,
+            "rounds": self.rounds,
+            "used": base64.b64encode(bytes(bits)).decode("ascii")
+        }
+
+    def load_state(self, state: Dict[str, Any]) -> bool:
+        """恢复 to_state 的状态（指纹不一致时忽略并返回False）"""
+        if state.get("fingerprint") != self.fingerprint or state.get("size") != self.size:
+            return False
+        bits = base64.b64decode(state["used"])
+        self.used = {
+            (i << 3) | bit
+            for i, byte in enumerate(bits) if byte
+            for bit in range(8) if byte >> bit & 1
+        }
+        self.rounds = state.get("rounds", 0)
+        return True
+
+
 class DiversityTracker:
-    """多样性跟踪器 - 避免重复的变化组合"""
+    """多样性跟踪器 - 避免重复的变化组合（每个subtype的组合空间不放回抽样）"""
+
+    COUNTERS = ("feature_counts", "generated_counts", "unique_counts", "exhausted")
 
     def __init__(self):
-        self.used_combinations = set()
+        self.spaces: Dict[Tuple[str, str], VariationSpace] = {}
+        self._pending: Dict[Tuple[str, str], Dict[Tuple, Dict[str, str]]] = defaultdict(dict)
         self.feature_counts = defaultdict(int)
+        # 增量维护的统计计数
+        self.generated_counts = defaultdict(int)  # content_type -> 生成/登记的组合数
+        self.unique_counts = defaultdict(int)  # content_type -> 不重复的组合数
+        self.exhausted = defaultdict(int)  # content_type -> 组合空间用尽的次数
+        # 从持久化状态加载、本次还没用到的组合空间（用到时才解码位图）
+        self._saved: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # 之前运行累计的统计计数（不计入本次运行的统计，保存时合并）
+        self.history: Dict[str, Dict[str, int]] = {}
+
+    def _space(self, content_type: str, subtype: str, variations: Dict[str, List[str]]) -> VariationSpace:
+        key = (content_type, subtype)
+        space = self.spaces.get(key)
+        if space is None:
+            space = self.spaces[key] = VariationSpace(variations)
+            saved = self._saved.pop(key, None)
+            if saved is not None and not space.load_state(saved):
+                print(f"⚠️  {content_type}/{subtype} 的变化维度配置已变化，忽略已保存的组合记录")
+            # 空间建立前登记的组合（如历史内容池）补记为已使用
+            for combo in self._pending.pop(key, {}).values():
+                index = space.encode(combo)
+                if index is not None:
+                    space.used.add(index)
+        return space
+
+    def _record(self, content_type: str, combo: Dict[str, str], unique: bool) -> None:
+        self.generated_counts[content_type] += 1
+        if unique:
+            self.unique_counts[content_type] += 1
+        for dim, value in combo.items():
+            self.feature_counts[f"{content_type}:{dim}:{value}"] += 1
 
     def get_unique_variation(
         self,
         content_type: str,
         subtype: str,
-        variations: Dict[str, List[str]],
-        max_attempts: int = 100
+        variations: Dict[str, List[str]]
     ) -> Dict[str, str]:
         """
-        获取一个尚未使用的变化组合
+        获取一个尚未使用的变化组合（O(1)；组合空间用尽后才会重复，并给出警告）
 
         Args:
             content_type: 内容类型 (e.g., "gym_workout")
             subtype: 子类型 (e.g., "squat_rack")
             variations: 变化维度字典 {"camera_angle": [...], "clothing": [...]}
-            max_attempts: 最大尝试次数
 
         Returns:
             变化组合字典
         """
-        for attempt in range(max_attempts):
-            # 从每个维度随机选择
-            combo = {
-                dim: random.choice(options)
-                for dim, options in variations.items()
-            }
+        space = self._space(content_type, subtype, variations)
+        index, new_round = space.draw()
+        if new_round:
+            self._on_exhausted(content_type, subtype, space)
 
-            # 创建可哈希的key
-            combo_key = (
-                content_type,
-                subtype,
-                tuple(sorted(combo.items()))
-            )
+        combo = space.decode(index)
+        self._record(content_type, combo, unique=space.rounds == 0)
+        return combo
+
+    def _on_exhausted(self, content_type: str, subtype: str, space: VariationSpace) -> None:
+        self.exhausted[content_type] += 1
+        if space.rounds == 1:
+            print(f"⚠️  {content_type}/{subtype} 的变化组合已用尽（{space.size} 种），开始新一轮")
+
+    def allocate_stratified(
+        self,
+        content_type: str,
+        subtype: str,
+        variations: Dict[str, List[str]],
+        count: int,
+        repair_attempts: int = 8
+    ) -> List[Dict[str, str]]:
+        """
+        分层分配 count 个变化组合：每个维度的各选项出现次数尽量相等
+        （除不尽的名额给该content_type中目前用得最少的选项），组合在空间用尽前仍不重复
 
-            # 检查是否用过
-            if combo_key not in self.used_combinations:
-                self.used_combinations.add(combo_key)
+        本轮剩余组合不够时先整体用掉剩余组合并开始新一轮（整轮枚举天然均衡）；
+        不足一轮的部分，每个维度生成一列均衡的选项并各自打乱（拉丁超立方式）逐行组合，
+        与已用组合冲突时和后面的某一行交换一个维度的取值（不改变各列的选项分布），
+        多次交换仍冲突才退回不放回随机抽取。
 
-                # 记录特征使用次数
-                for dim, value in combo.items():
-                    self.feature_counts[f"{content_type}:{dim}:{value}"] += 1
+        Args:
+            content_type: 内容类型
+            subtype: 子类型
+            variations: 变化维度字典
+            count: 组合数量
+            repair_attempts: 冲突时的交换次数上限
 
-                return combo
+        Returns:
+            变化组合列表
+        """
+        space = self._space(content_type, subtype, variations)
+        if count <= 0:
+            return []
+        if space.size == 0 or not space.dims:
+            return [{} for _ in range(count)]
+
+        radices = [len(opts) for opts in space.options]
+        multipliers = [1] * len(radices)
+        for d in range(len(radices) - 2, -1, -1):
+            multipliers[d] = multipliers[d + 1] * radices[d + 1]
+
+        indices: List[int] = []
+        unique = 0
+        need = count
+
+        # 1. 需要的数量不少于本轮剩余：整体取用剩余组合（必要时开始新一轮）
+        while need >= space.remaining:
+            rest = [i for i in range(space.size) if i not in space.used]
+            random.shuffle(rest)
+            space.used.update(rest)
+            indices.extend(rest)
+            if space.rounds == 0:
+                unique += len(rest)
+            need -= len(rest)
+            if not need:
+                break
+            space.start_round()
+            self._on_exhausted(content_type, subtype, space)
+
+        # 2. 不足一轮的部分：各维度均衡的列，逐行组合
+        if need:
+            columns = []
+            for dim, opts, radix in zip(space.dims, space.options, radices):
+                # 用得少的选项排前面（同样少的随机排），循环铺满need个位置后打乱
+                usage = [self.feature_counts.get(f"{content_type}:{dim}:{value}", 0) for value in opts]
+                order = sorted(range(radix), key=lambda p: (usage[p], random.random()))
+                column = (order * (need // radix + 1))[:need]
+                random.shuffle(column)
+                columns.append(column)
+
+            row_indices = [0] * need
+            for column, multiplier in zip(columns, multipliers):
+                row_indices = [i + p * multiplier for i, p in zip(row_indices, column)]
+
+            dims = len(columns)
+            used = space.used
+            for j in range(need):
+                index = row_indices[j]
+                attempt = 0
+                while index in used and attempt < repair_attempts:
+                    # 与后面的某一行交换一个维度的取值（两行的下标同步调整）
+                    attempt += 1
+                    t = random.randrange(j, need)
+                    d = random.randrange(dims)
+                    column, multiplier = columns[d], multipliers[d]
+                    delta = (column[t] - column[j]) * multiplier
+                    column[j], column[t] = column[t], column[j]
+                    row_indices[t] -= delta
+                    index = row_indices[j] = row_indices[j] + delta
+                if index in used:
+                    index, _ = space.draw()
+                else:
+                    used.add(index)
+                indices.append(index)
+            if space.rounds == 0:
+                unique += need
+
+        # 3. 解码并批量更新统计（按列计数，不逐条拼接特征key）
+        combos = [{} for _ in indices]
+        for dim, opts, radix, multiplier in zip(space.dims, space.options, radices, multipliers):
+            digits = [(index // multiplier) % radix for index in indices]
+            for combo, digit in zip(combos, digits):
+                combo[dim] = opts[digit]
+            for digit, n in Counter(digits).items():
+                self.feature_counts[f"{content_type}:{dim}:{opts[digit]}"] += n
+        self.generated_counts[content_type] += len(combos)
+        self.unique_counts[content_type] += unique
+        return combos
+
+    def mark_used(
+        self,
+        content_type: str,
+        subtype: str,
+        combo: Dict[str, str],
+        variations: Optional[Dict[str, List[str]]] = None
+    ) -> None:
+        """
+        登记一个已经生成过的变化组合（如历史内容池中的），之后不会再被选中
 
-        # 所有组合都用过了，允许重复但给警告
-        print(f"⚠️  {content_type}/{subtype} 的变化组合已用尽，开始重复")
-        return combo
+        Args:
+            variations: 该content_type的变化维度（提供时立即建立组合空间，否则等首次抽取时再登记）
+        """
+        key = (content_type, subtype)
+        space = self._space(content_type, subtype, variations) if variations else self.spaces.get(key)
+        if space is None:
+            combo_key = tuple(sorted(combo.items()))
+            if combo_key in self._pending[key]:
+                return
+            self._pending[key][combo_key] = combo
+        else:
+            index = space.encode(combo)
+            if index is not None:
+                if index in space.used:
+                    return
+                space.used.add(index)
+        self._record(content_type, combo, unique=True)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """持久化状态（各组合空间的已用位图 + 统计计数）"""
+        spaces = {f"{ct}/{subtype}": state for (ct, subtype), state in self._saved.items()}
+        for (ct, subtype), space in self.spaces.items():
+            spaces[f"{ct}/{subtype}"] = space.to_state()
+
+        data = {"version": 1, "spaces": spaces}
+        for name in self.COUNTERS:
+            merged = dict(self.history.get(name, {}))
+            for key, value in getattr(self, name).items():
+                merged[key] = merged.get(key, 0) + value
+            data[name] = merged
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DiversityTracker":
+        """从 to_dict 的结果恢复（位图在组合空间首次用到时才解码）"""
+        tracker = cls()
+        for key, state in data.get("spaces", {}).items():
+            content_type, _, subtype = key.partition("/")
+            tracker._saved[(content_type, subtype)] = state
+        tracker.history = {name: data.get(name, {}) for name in cls.COUNTERS}
+        return tracker
+
+    @classmethod
+    def load(cls, state_file: str) -> "DiversityTracker":
+        """从状态文件加载（文件不存在时返回空的跟踪器）"""
+        if not os.path.exists(state_file):
+            return cls()
+        with open(state_file, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, state_file: str) -> None:
+        """原子写入状态文件"""
+        path = Path(state_file)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
 
     def get_diversity_stats(self, content_type: str) -> Dict[str, float]:
-        """获取指定content_type的多样性统计"""
-        total = len([k for k in self.used_combinations if k[0] == content_type])
+        """
+        获取指定content_type的多样性统计（来自增量计数，不扫描已用组合）
 
+        feature_coverage: 出现过至少一次的 (维度, 选项) 占全部选项的比例
+        min_feature_count: 出现最少的选项的次数
+        feature_balance: 各维度内最少与最多选项的次数之比，取最差的维度（1为完全均衡）
+        """
         stats = {
-            "total_generated": total,
-            "unique_combinations": len([k for k in self.used_combinations if k[0] == content_type])
+            "total_generated": self.generated_counts[content_type],
+            "unique_combinations": self.unique_counts[content_type],
+            "exhausted_subtypes": self.exhausted[content_type]
         }
 
+        dims: Dict[str, set] = defaultdict(set)
+        for (ct, _), space in self.spaces.items():
+            if ct == content_type:
+                for dim, opts in zip(space.dims, space.options):
+                    dims[dim].update(opts)
+        if dims:
+            covered = total = 0
+            min_count = None
+            balance = 1.0
+            for dim, values in dims.items():
+                counts = [self.feature_counts.get(f"{content_type}:{dim}:{value}", 0) for value in values]
+                covered += sum(1 for c in counts if c)
+                total += len(counts)
+                min_count = min(counts) if min_count is None else min(min_count, min(counts))
+                balance = min(balance, min(counts) / max(counts) if max(counts) else 0.0)
+            stats["feature_coverage"] = round(covered / total, 4)
+            stats["min_feature_count"] = min_count
+            stats["feature_balance"] = round(balance, 4)
         return stats
 
 
 class ContentPlanner:
     """内容计划生成器"""
 
-    def __init__(self):
+    # random: 各维度独立随机抽取、mood按权重随机
+    # stratified: 各维度选项与mood按配额分层分配，少量spec也能覆盖全部选项
+    STRATEGIES = ("random", "stratified")
+
+    def __init__(self, state_file: Optional[str] = None, strategy: str = "random"):
+        """
+        Args:
+            state_file: 人设的持久化多样性状态文件（提供时加载，之前运行用过的组合不会再被选中）
+            strategy: 变化组合与mood的分配策略（见 STRATEGIES）
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"未知的规划策略: {strategy}（可选: {', '.join(self.STRATEGIES)}）")
         self.config_loader = get_config_loader()
-        self.diversity_tracker = DiversityTracker()
+        self.state_file = state_file
+        self.strategy = strategy
+        self.diversity_tracker = DiversityTracker.load(state_file) if state_file else DiversityTracker()
+        self.mood_counts: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.mood_weights: Dict[str, float] = {}
 
     def create_content_plan(
         self,
@@ -103,6 +450,136 @@ class ContentPlanner:
         Returns:
             内容计划字典
         """
+        archetype_name, archetype, content_plan = self._compute_distribution(persona, total_count)
+
+        # 为每种类型生成详细计划
+        detailed_plan = {}
+        for content_type, count in content_plan.items():
+            detailed_plan[content_type] = self._plan_content_type(
+                content_type,
+                count,
+                archetype.get('mood_weights', {})
+            )
+
+        return {
+            "persona_name": persona.get('data', {}).get('name', 'Unknown'),
+            "archetype": archetype_name,
+            "total_count": total_count,
+            "distribution": content_plan,
+            "detailed_plan": detailed_plan,
+            "mood_weights": archetype.get('mood_weights', {})
+        }
+
+    def create_topup_plan(
+        self,
+        persona: Dict[str, Any],
+        target_count: int,
+        existing_tweets: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        为已有内容池创建补量计划：只规划与 create_content_plan 目标分布相比缺少的部分
+
+        按 content_type -> subtype -> mood 逐级对比已有数量和目标数量，只为不足的
+        content_type 生成spec，subtype 和 mood 优先补缺口最大的；已有推文中记录的
+        变化组合会先登记到 DiversityTracker，补量的组合不会与之重复。
+
+        Args:
+            persona: Persona JSON数据
+            target_count: 目标总数
+            existing_tweets: 已有内容池中的推文
+
+        Returns:
+            与 create_content_plan 结构相同的计划（total_count/distribution 为补量部分），
+            另含 existing / targets 两个 {content_type: 数量} 直方图
+        """
+        archetype_name, archetype, targets = self._compute_distribution(persona, target_count)
+        mood_weights = archetype.get('mood_weights', {})
+
+        # 已有内容的直方图，并登记用过的变化组合
+        type_counts = defaultdict(int)
+        subtype_counts = defaultdict(int)
+        mood_counts = defaultdict(int)
+        for tweet in existing_tweets:
+            content_type = tweet.get('content_type', '')
+            subtype = tweet.get('subtype', '')
+            type_counts[content_type] += 1
+            subtype_counts[(content_type, subtype)] += 1
+            mood_counts[(content_type, tweet.get('mood', ''))] += 1
+            if tweet.get('variations'):
+                self.diversity_tracker.mark_used(content_type, subtype, tweet['variations'])
+
+        distribution = {}
+        detailed_plan = {}
+        for content_type, target in targets.items():
+            deficit = target - type_counts[content_type]
+            if deficit <= 0:
+                continue
+
+            type_config = self.config_loader.get_content_type(content_type)
+            subtypes = type_config['subtypes']
+
+            # subtype / mood 的剩余缺口（按该content_type的目标数量计算）
+            subtype_gaps = {
+                name: count - subtype_counts[(content_type, name)]
+                for name, count in self._subtype_counts(subtypes, target).items()
+            }
+            total_mood_weight = sum(mood_weights.values())
+            mood_gaps = {
+                mood: target * weight / total_mood_weight - mood_counts[(content_type, mood)]
+                for mood, weight in mood_weights.items()
+            }
+
+            generation_specs = []
+            for _ in range(deficit):
+                subtype_name = max(subtype_gaps, key=subtype_gaps.get)
+                subtype_gaps[subtype_name] -= 1
+                if mood_gaps:
+                    mood = max(mood_gaps, key=mood_gaps.get)
+                    mood_gaps[mood] -= 1
+                else:
+                    mood = "confident"  # 默认mood
+
+                generation_specs.append({
+                    "content_type": content_type,
+                    "subtype": subtype_name,
+                    "subtype_description": subtypes[subtype_name]['description'],
+                    "variations": self.diversity_tracker.get_unique_variation(
+                        content_type=content_type,
+                        subtype=subtype_name,
+                        variations=type_config['variations']
+                    ),
+                    "mood": mood
+                })
+
+            random.shuffle(generation_specs)
+            for i, spec in enumerate(generation_specs):
+                spec["spec_id"] = f"{content_type}-topup-{i:05d}"
+
+            distribution[content_type] = deficit
+            detailed_plan[content_type] = generation_specs
+
+        return {
+            "persona_name": persona.get('data', {}).get('name', 'Unknown'),
+            "archetype": archetype_name,
+            "total_count": sum(distribution.values()),
+            "distribution": distribution,
+            "detailed_plan": detailed_plan,
+            "mood_weights": mood_weights,
+            "existing": {k: v for k, v in type_counts.items() if v},
+            "targets": targets
+        }
+
+    def _compute_distribution(
+        self,
+        persona: Dict[str, Any],
+        total_count: int
+    ) -> Tuple[str, Dict[str, Any], Dict[str, int]]:
+        """
+        按archetype和persona的content_strategy计算每种content_type的目标数量
+
+        Returns:
+            (archetype名称, archetype配置, {content_type: 数量})
+        """
         # 1. 获取persona的content_strategy
         extensions = persona.get('data', {}).get('extensions', {})
         strategy = extensions.get('content_strategy', {})
@@ -145,23 +622,7 @@ class ContentPlanner:
             max_type = max(distribution.items(), key=lambda x: x[1])[0]
             content_plan[max_type] += remaining
 
-        # 9. 为每种类型生成详细计划
-        detailed_plan = {}
-        for content_type, count in content_plan.items():
-            detailed_plan[content_type] = self._plan_content_type(
-                content_type,
-                count,
-                archetype.get('mood_weights', {})
-            )
-
-        return {
-            "persona_name": persona.get('data', {}).get('name', 'Unknown'),
-            "archetype": archetype_name,
-            "total_count": total_count,
-            "distribution": content_plan,
-            "detailed_plan": detailed_plan,
-            "mood_weights": archetype.get('mood_weights', {})
-        }
+        return archetype_name, archetype, content_plan
 
     def _plan_content_type(
         self,
@@ -182,37 +643,46 @@ class ContentPlanner:
         variations = type_config['variations']
 
         # 计算每个subtype的数量
-        subtype_counts = {}
-        for subtype_name, subtype_data in subtypes.items():
-            weight = subtype_data['weight']
-            subtype_counts[subtype_name] = int(count * weight)
+        subtype_counts = self._subtype_counts(subtypes, count)
 
-        # 分配剩余
-        remaining = count - sum(subtype_counts.values())
-        if remaining > 0:
-            max_subtype = max(subtypes.items(), key=lambda x: x[1]['weight'])[0]
-            subtype_counts[max_subtype] += remaining
+        # mood：分层策略按权重配额分配（打乱后逐个取用），否则逐个随机
+        self.mood_weights = mood_weights
+        spec_count = sum(subtype_counts.values())
+        if self.strategy == "stratified":
+            moods = iter(self._allocate_moods(mood_weights, spec_count))
+        else:
+            moods = (self._weighted_random_choice(mood_weights) for _ in range(spec_count))
+        mood_counts = self.mood_counts[content_type]
 
         # 为每个要生成的内容创建spec
         generation_specs = []
 
         for subtype_name, subtype_count in subtype_counts.items():
-            for i in range(subtype_count):
-                # 获取唯一的变化组合
-                variation_combo = self.diversity_tracker.get_unique_variation(
-                    content_type=content_type,
-                    subtype=subtype_name,
-                    variations=variations
+            # 获取唯一的变化组合
+            if self.strategy == "stratified":
+                combos = self.diversity_tracker.allocate_stratified(
+                    content_type, subtype_name, variations, subtype_count
                 )
-
-                # 随机选择mood
-                mood = self._weighted_random_choice(mood_weights)
+            else:
+                combos = [
+                    self.diversity_tracker.get_unique_variation(
+                        content_type=content_type,
+                        subtype=subtype_name,
+                        variations=variations
+                    )
+                    for _ in range(subtype_count)
+                ]
+
+            description = subtypes[subtype_name]['description']
+            for variation_combo in combos:
+                mood = next(moods)
+                mood_counts[mood] += 1
 
                 # 创建生成spec
                 spec = {
                     "content_type": content_type,
                     "subtype": subtype_name,
-                    "subtype_description": subtypes[subtype_name]['description'],
+                    "subtype_description": description,
                     "variations": variation_combo,
                     "mood": mood
                 }
@@ -222,8 +692,44 @@ class ContentPlanner:
         # 打乱顺序（避免同类型连续）
         random.shuffle(generation_specs)
 
+        # 稳定的spec ID（计划内唯一，用于检查点/断点续跑）
+        for i, spec in enumerate(generation_specs):
+            spec["spec_id"] = f"{content_type}-{i:05d}"
+
         return generation_specs
 
+    @staticmethod
+    def _subtype_counts(subtypes: Dict[str, Any], count: int) -> Dict[str, int]:
+        """按subtype权重分配数量（取整剩余分给权重最大的subtype）"""
+        subtype_counts = {}
+        for subtype_name, subtype_data in subtypes.items():
+            weight = subtype_data['weight']
+            subtype_counts[subtype_name] = int(count * weight)
+
+        # 分配剩余
+        remaining = count - sum(subtype_counts.values())
+        if remaining > 0:
+            max_subtype = max(subtypes.items(), key=lambda x: x[1]['weight'])[0]
+            subtype_counts[max_subtype] += remaining
+
+        return subtype_counts
+
+    @staticmethod
+    def _allocate_moods(weights: Dict[str, float], count: int) -> List[str]:
+        """按权重把count个名额分给各mood（最大余数法，每个mood与期望相差不到1），打乱顺序"""
+        total = sum(weights.values()) if weights else 0
+        if total <= 0:
+            return ["confident"] * count  # 默认mood
+        quotas = {mood: count * weight / total for mood, weight in weights.items()}
+        allocation = {mood: int(quota) for mood, quota in quotas.items()}
+        leftover = count - sum(allocation.values())
+        for mood in sorted(quotas, key=lambda m: quotas[m] - allocation[m], reverse=True)[:leftover]:
+            allocation[mood] += 1
+
+        moods = [mood for mood, n in allocation.items() for _ in range(n)]
+        random.shuffle(moods)
+        return moods
+
     def _weighted_random_choice(self, weights: Dict[str, float]) -> str:
         """根据权重随机选择"""
         if not weights:
@@ -234,14 +740,41 @@ class ContentPlanner:
 
         return random.choices(items, weights=weights_list, k=1)[0]
 
+    def record_generated(self, tweets: Iterable[Dict[str, Any]]) -> int:
+        """
+        把实际生成的推文的变化组合登记为已使用并保存到 state_file
+        （用运行开始前的状态新建planner再调用，只记录真正生成了的组合）
+
+        Returns:
+            登记的推文数
+        """
+        recorded = 0
+        for tweet in tweets:
+            content_type = tweet.get("content_type")
+            if not content_type or not tweet.get("variations"):
+                continue
+            try:
+                variations = self.config_loader.get_content_type(content_type)['variations']
+            except (KeyError, ValueError, TypeError):
+                continue
+            self.diversity_tracker.mark_used(content_type, tweet.get("subtype", ""), tweet["variations"], variations)
+            recorded += 1
+        if self.state_file:
+            self.diversity_tracker.save(self.state_file)
+        return recorded
+
     def get_diversity_report(self) -> Dict[str, Any]:
         """获取多样性报告"""
-        all_content_types = set(k[0] for k in self.diversity_tracker.used_combinations)
-
         report = {}
-        for content_type in all_content_types:
+        for content_type in self.diversity_tracker.generated_counts:
             report[content_type] = self.diversity_tracker.get_diversity_stats(content_type)
 
+            # mood覆盖率：出现过的mood占有权重的mood的比例
+            moods = [mood for mood, weight in self.mood_weights.items() if weight > 0]
+            if moods and content_type in self.mood_counts:
+                counts = self.mood_counts[content_type]
+                report[content_type]["mood_coverage"] = round(sum(1 for m in moods if counts.get(m)) / len(moods), 4)
+
         return report
 
 
@@ -2,19 +2,18 @@
 Standalone Persona Generator
 独立人设生成器 - 完全复制ComfyUI精调逻辑
 """
-import asyncio
+import copy
 import json
-import base64
-import io
 from pathlib import Path
-from typing import Dict, Optional
-from PIL import Image
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Union
 import sys
 
 # 添加路径
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from utils.llm_client import AsyncLLMClient
+from utils.llm_client import AsyncLLMClient, LLMClientPool
+from utils.stage_graph import Stage, StageCheckpoint, StageGraph
+from utils.image_preprocess import ImagePreprocessor
 from utils.json_parser import parse_llm_json_response
 from prompts.core_generation_prompt import (
     get_core_generation_system_prompt,
@@ -22,14 +21,215 @@ from prompts.core_generation_prompt import (
 )
 
 
+# 各阶段默认参数（与 config/generation.py 的 PersonaGenerationConfig 默认值一致，
+# 配置包不可用时使用）
+DEFAULT_STAGE_SETTINGS = {
+    "stage1_core_persona": {"temperature": 0.85, "max_tokens": 4000},
+    "stage2_tweet_strategy": {"temperature": 0.85, "max_tokens": 8000},
+    "stage3_example_tweets": {"temperature": 0.9, "max_tokens": 8000},
+    "stage4_social_network": {"temperature": 0.85, "max_tokens": 4000},
+    "stage5_authenticity": {"temperature": 0.8, "max_tokens": 3000},
+    "stage6_visual_profile": {"temperature": 0.8, "max_tokens": 2000},
+    "stage7_character_book": {"temperature": 0.8, "max_tokens": 5000},
+    "num_example_tweets": 8,
+    "num_character_entries": 6
+}
+
+
+def _default_persona_config():
+    """
+    全局生成配置中的人设部分
+
+    导入配置包会构建 Settings()（需要 LLM_API_KEY 等API服务配置），命令行环境下可能失败；
+    任何加载失败都返回None，使用内置默认值
+    """
+    try:
+        from config import generation_config
+        return generation_config.persona
+    except Exception:
+        return None
+
+
+# 阶段编号 -> StageGraph 中的阶段名（--stages 使用编号）
+STAGE_NAMES = {
+    1: "core_persona",
+    2: "strategy",
+    3: "tweets",
+    4: "social_data",
+    5: "authenticity",
+    6: "visual_profile",
+    7: "character_book"
+}
+
+# 可选阶段的输出必须包含的字段（缺失视为失败，触发重试）
+_STAGE_OUTPUT_KEYS = {
+    "social_data": "social_circle",
+    "authenticity": "language_authenticity",
+    "visual_profile": "visual_profile",
+    "character_book": "character_book"
+}
+
+# 合并后的人设中由 Stage 3-7 写入的字段（原地重新生成时从核心人设中剔除）
+_STAGE_OUTPUT_FIELDS = (
+    "twitter_persona", "social_circle", "language_authenticity",
+    "strategic_flaws", "visual_profile", "character_book"
+)
+
+
+def missing_stages(persona: Dict) -> List[int]:
+    """人设中输出缺失的阶段编号（Stage 3-7，对应字段不存在或为空）"""
+    data = persona.get("data", {})
+    fields = {3: "twitter_persona", 4: "social_circle", 5: "language_authenticity",
+              6: "visual_profile", 7: "character_book"}
+    return [number for number, field in fields.items() if not data.get(field)]
+
+
 class PersonaGenerator:
     """
     完整的人设生成器
     完全保留ComfyUI的多阶段生成流程和精调prompts
+
+    各阶段按依赖关系调度（StageGraph）：Stage 2→3 与 Stage 4-7 都只依赖 Stage 1，
+    Stage 1 完成后同时开始，总耗时约为 1 + max(2→3, 4..7)
+
+    设置 checkpoint_dir 后每个成功阶段的输出按 "图片内容哈希 + 阶段参数 + 上游输出" 保存，
+    同一图片重跑时从第一个缺失或失败的阶段继续
     """
 
-    def __init__(self, llm_client: AsyncLLMClient):
+    def __init__(
+        self,
+        llm_client: Union[LLMClientPool, AsyncLLMClient],
+        config=None,
+        stage_retries: int = 1,
+        checkpoint_dir: Optional[str] = None,
+        image_preprocessor: Optional[ImagePreprocessor] = None
+    ):
+        """
+        Args:
+            llm_client: LLM调用入口（推荐传入LLMClientPool，与推文生成共享并发上限）
+            config: PersonaGenerationConfig（各阶段 temperature/max_tokens），None则使用全局生成配置
+            stage_retries: 每个阶段失败（调用出错或JSON无法解析）后的重试次数
+            checkpoint_dir: 阶段检查点目录（每张图片一个子目录，None则不保存）
+            image_preprocessor: 图片预处理器（缩放/编码/缓存，None则使用默认参数；
+                传入的预处理器由调用方关闭，默认创建的由 close() 关闭）
+        """
         self.llm = llm_client
+        self.config = config if config is not None else _default_persona_config()
+        self.stage_retries = stage_retries
+        self.checkpoint_dir = Path(checkpoint_dir) if checkpoint_dir else None
+        self._owns_images = image_preprocessor is None
+        self.images = image_preprocessor or ImagePreprocessor()
+        self.last_stage_report: Dict[str, Dict] = {}
+
+    def close(self) -> None:
+        """关闭自己创建的图片预处理线程池（共享的预处理器不关闭）"""
+        if self._owns_images:
+            self.images.close()
+
+    def _setting(self, key: str):
+        """读取配置项（阶段配置统一转成 {temperature, max_tokens}）"""
+        if self.config is None:
+            return DEFAULT_STAGE_SETTINGS[key]
+        value = getattr(self.config, key)
+        if hasattr(value, "temperature"):
+            return {"temperature": value.temperature, "max_tokens": value.max_tokens}
+        return value
+
+    def _stage_params(self, key: str, temperature: Optional[float] = None) -> Dict:
+        """阶段的 temperature/max_tokens（temperature 不为None时覆盖配置）"""
+        params = dict(self._setting(key))
+        if temperature is not None:
+            params["temperature"] = temperature
+        return params
+
+    def _build_stage_graph(
+        self,
+        core_stage: Optional[Stage],
+        temperature: Optional[float],
+        checkpoint: Optional[StageCheckpoint] = None,
+        only: Optional[Set[str]] = None
+    ) -> StageGraph:
+        """
+        构建 Stage 1-7 的依赖图
+
+        Args:
+            core_stage: Stage 1（None表示核心人设作为初始输入 core_persona 提供）
+            temperature: Stage 2 的温度覆盖
+            checkpoint: 阶段检查点
+            only: 只包含这些 Stage 2-7 阶段（None为全部）
+        """
+        retries = self.stage_retries
+
+        def optional(name: str, generate: Callable[..., Awaitable[Dict]]):
+            """可选阶段：输出缺少应有字段时视为失败"""
+            async def run(core_persona):
+                output = await generate(core_persona)
+                if _STAGE_OUTPUT_KEYS[name] not in output:
+                    raise ValueError(f"输出缺少字段 {_STAGE_OUTPUT_KEYS[name]}")
+                return output
+            return run
+
+        # Stage 2: Tweet Strategy Generation（推文策略生成）
+        strategy_params = self._stage_params("stage2_tweet_strategy", temperature)
+
+        async def strategy(core_persona):
+            return await self._generate_tweet_strategy(core_persona, **strategy_params)
+
+        # Stage 3: Example Tweets Generation（示例推文生成）
+        tweets_params = dict(
+            self._stage_params("stage3_example_tweets"),
+            num_tweets=self._setting("num_example_tweets")
+        )
+
+        async def tweets(core_persona, strategy):
+            return await self._generate_example_tweets(core_persona, strategy, **tweets_params)
+
+        # Stage 4-7: 只依赖core_persona，与 Stage 2→3 并发；失败时该部分为空（与原逻辑一致）
+        social_params = self._stage_params("stage4_social_network")
+        authenticity_params = self._stage_params("stage5_authenticity")
+        visual_params = self._stage_params("stage6_visual_profile")
+        book_params = dict(
+            self._stage_params("stage7_character_book"),
+            num_entries=self._setting("num_character_entries")
+        )
+
+        stages = [
+            Stage("strategy", strategy, deps=["core_persona"], retries=retries, params=strategy_params),
+            Stage("tweets", tweets, deps=["core_persona", "strategy"], retries=retries, params=tweets_params),
+            Stage(
+                "social_data",
+                optional("social_data", lambda core: self._generate_social_network(core, **social_params)),
+                deps=["core_persona"], required=False, retries=retries, default={}, params=social_params
+            ),
+            Stage(
+                "authenticity",
+                optional("authenticity", lambda core: self._generate_authenticity(core, **authenticity_params)),
+                deps=["core_persona"], required=False, retries=retries, default={}, params=authenticity_params
+            ),
+            Stage(
+                "visual_profile",
+                optional("visual_profile", lambda core: self._extract_visual_profile(core, **visual_params)),
+                deps=["core_persona"], required=False, retries=retries, default={}, params=visual_params
+            ),
+            Stage(
+                "character_book",
+                optional("character_book", lambda core: self._generate_character_book(core, **book_params)),
+                deps=["core_persona"], required=False, retries=retries, default={}, params=book_params
+            ),
+        ]
+        if only is not None:
+            stages = [stage for stage in stages if stage.name in only]
+        if core_stage is not None:
+            stages.insert(0, core_stage)
+        return StageGraph(stages, checkpoint=checkpoint)
+
+    async def _run_graph(self, graph: StageGraph, **kwargs) -> Dict:
+        """运行依赖图，记录并打印各阶段报告"""
+        try:
+            return await graph.run(**kwargs)
+        finally:
+            self.last_stage_report = graph.report
+            self._print_stage_report(graph)
 
     async def generate_from_image(
         self,
@@ -39,7 +239,8 @@ class PersonaGenerator:
         location: str = "",
         business_goal: str = "",
         custom_instructions: str = "",
-        temperature: float = 0.85
+        temperature: Optional[float] = None,
+        refresh: bool = False
     ) -> Dict:
         """
         从图片生成完整人设（多阶段流程）
@@ -52,7 +253,8 @@ class PersonaGenerator:
             location: 地理位置（留空自动生成）
             business_goal: 业务目标
             custom_instructions: 自定义控制词
-            temperature: 温度参数
+            temperature: Stage 1/2 的温度（None则使用各阶段配置）
+            refresh: 忽略阶段检查点，所有阶段重新生成（新输出仍会保存）
 
         Returns:
             完整的人设JSON（SillyTavern Character Card V2格式）
@@ -63,58 +265,39 @@ class PersonaGenerator:
         print(f"{'='*70}\n")
 
         # Stage 1: Core Persona Generation（核心人设生成）
-        print("📍 Stage 1: Generating core persona...")
-        core_persona = await self._generate_core_persona(
-            image_path, nsfw_level, language, location,
-            business_goal, custom_instructions, temperature
-        )
-
-        # Stage 2: Tweet Strategy Generation（推文策略生成）
-        print("\n📍 Stage 2: Generating tweet strategy...")
-        strategy = await self._generate_tweet_strategy(core_persona, temperature)
-
-        # Stage 3: Example Tweets Generation（示例推文生成）
-        print("\n📍 Stage 3: Generating example tweets...")
-        tweets = await self._generate_example_tweets(
-            core_persona, strategy, num_tweets=8, temperature=0.9
-        )
-
-        # ⚡ Stage 4-7: 并发生成（这些阶段只依赖core_persona，互相独立）
-        print("\n⚡ Stage 4-7: Parallel generation (social, authenticity, visual, knowledge)...")
-
-        # 创建并发任务
-        stage_4_task = self._generate_social_network(core_persona, temperature=0.85)
-        stage_5_task = self._generate_authenticity(core_persona, temperature=0.8)
-        stage_6_task = self._extract_visual_profile(core_persona, temperature=0.8)
-        stage_7_task = self._generate_character_book(core_persona, num_entries=6, temperature=0.8)
-
-        # 🚀 并发执行 Stage 4-7
-        results = await asyncio.gather(
-            stage_4_task,
-            stage_5_task,
-            stage_6_task,
-            stage_7_task,
-            return_exceptions=True
-        )
-
-        # 解包结果
-        social_data = results[0] if not isinstance(results[0], Exception) else {}
-        authenticity = results[1] if not isinstance(results[1], Exception) else {}
-        visual_profile = results[2] if not isinstance(results[2], Exception) else {}
-        character_book = results[3] if not isinstance(results[3], Exception) else {}
-
-        # 检查错误
-        for i, result in enumerate(results, start=4):
-            if isinstance(result, Exception):
-                print(f"  ⚠️  Stage {i} failed: {result}")
-
-        print("  ✓ Parallel stages completed")
+        core_params = self._stage_params("stage1_core_persona", temperature)
+
+        async def core_persona():
+            return await self._generate_core_persona(
+                image_path, nsfw_level, language, location,
+                business_goal, custom_instructions, **core_params
+            )
+
+        checkpoint = None
+        core_key = None
+        if self.checkpoint_dir is not None:
+            image_hash = await self.images.source_hash(image_path)
+            checkpoint = StageCheckpoint(str(self.checkpoint_dir / image_hash[:32]))
+            core_key = dict(
+                core_params, image=image_hash,
+                image_encoding=[self.images.max_side, self.images.image_format, self.images.quality],
+                nsfw_level=nsfw_level, language=language,
+                location=location, business_goal=business_goal,
+                custom_instructions=custom_instructions
+            )
+
+        core_stage = Stage("core_persona", core_persona, retries=self.stage_retries, params=core_key)
+        graph = self._build_stage_graph(core_stage, temperature, checkpoint)
+        print("⚡ Stage 1 → (Stage 2→3 | Stage 4-7) dependency-driven generation...")
+        results = await self._run_graph(graph, refresh=graph.stages if refresh else ())
+        if all(entry["status"] == "cached" for entry in graph.report.values()):
+            print("\n♻️  All stages restored from checkpoint (no LLM calls); use refresh to generate a new variant")
 
         # Final Stage: Merge All Components（合并所有组件）
         print("\n📍 Final Stage: Merging all components...")
         complete_persona = self._merge_persona_components(
-            core_persona, tweets, social_data, authenticity,
-            visual_profile, character_book
+            results["core_persona"], results["tweets"], results["social_data"],
+            results["authenticity"], results["visual_profile"], results["character_book"]
         )
 
         print(f"\n✅ Persona generation complete!")
@@ -124,13 +307,66 @@ class PersonaGenerator:
 
         return complete_persona
 
-    def _image_to_base64(self, image_path: str) -> str:
-        """将图片转换为base64"""
-        with Image.open(image_path) as img:
-            buffered = io.BytesIO()
-            img.save(buffered, format="PNG")
-            img_bytes = buffered.getvalue()
-            return base64.b64encode(img_bytes).decode('utf-8')
+    async def regenerate_stages(
+        self,
+        persona: Dict,
+        stages: Iterable[int],
+        temperature: Optional[float] = None
+    ) -> Dict:
+        """
+        重新生成已有人设中的指定阶段（Stage 2-7），其余内容保持不变
+
+        核心人设取自已有人设（剔除 Stage 3-7 写入的字段）；Stage 3 需要的推文策略
+        不保存在人设中，选择 Stage 2 或 3 时两者一起重新生成
+
+        Args:
+            persona: 已有的完整人设
+            stages: 阶段编号，如 [4, 7]
+            temperature: Stage 2 的温度覆盖
+
+        Returns:
+            更新后的人设（新的对象）；重新生成失败的阶段保留原内容，见 last_stage_report
+        """
+        selected = set(stages)
+        invalid = sorted(number for number in selected if number not in STAGE_NAMES or number == 1)
+        if invalid:
+            raise ValueError(f"只能重新生成 Stage 2-7（Stage 1 需要原图，请重新生成整个人设）: {invalid}")
+        if selected & {2, 3}:
+            selected |= {2, 3}
+        names = {STAGE_NAMES[number] for number in selected}
+
+        core = copy.deepcopy(persona)
+        for field in _STAGE_OUTPUT_FIELDS:
+            core.get("data", {}).pop(field, None)
+
+        graph = self._build_stage_graph(None, temperature, only=names)
+
+        print(f"🔧 Regenerating stages {sorted(selected)} for {persona.get('data', {}).get('name', 'Unknown')}...")
+        results = await self._run_graph(graph, inputs={"core_persona": core})
+        return self._merge_persona_components(
+            persona,
+            results.get("tweets", {}), results.get("social_data", {}),
+            results.get("authenticity", {}), results.get("visual_profile", {}),
+            results.get("character_book", {})
+        )
+
+    @staticmethod
+    def _print_stage_report(graph: StageGraph) -> None:
+        """打印各阶段的开始时间、耗时和重试情况"""
+        icons = {"ok": "✓", "cached": "💾", "skipped": "⚠️ ", "failed": "❌", "cancelled": "⏹️ ", "running": "…"}
+        print(f"\n📊 Stage timings (total {graph.total_seconds:.1f}s):")
+        for name, entry in graph.report.items():
+            line = (
+                f"  {icons.get(entry['status'], '?')} {name:<15} "
+                f"start +{entry['started_at']:.1f}s  {entry['seconds']:.1f}s"
+            )
+            if entry["status"] == "cached":
+                line += "  (checkpoint)"
+            if entry["attempts"] > 1:
+                line += f"  (attempts: {entry['attempts']})"
+            if entry["status"] != "ok" and entry.get("error"):
+                line += f"  {entry['error'][:120]}"
+            print(line)
 
     async def _generate_core_persona(
         self,
@@ -140,15 +376,15 @@ class PersonaGenerator:
         location: str,
         business_goal: str,
         custom_instructions: str,
-        temperature: float
+        temperature: float,
+        max_tokens: int
     ) -> Dict:
         """
         Stage 1: 核心人设生成
         完全保留ComfyUI PersonaCoreGenerator的prompt逻辑
         """
-        # 转换图像为base64
-        base64_image = self._image_to_base64(image_path)
-        image_url = f"data:image/png;base64,{base64_image}"
+        # 缩放并编码图像（线程池中执行，按原图哈希缓存）
+        image_url = await self.images.data_url(image_path)
 
         # 构建base_params（完全保留ComfyUI逻辑）
         base_params = {
@@ -179,7 +415,7 @@ class PersonaGenerator:
         response = await self.llm.generate(
             messages=messages,
             temperature=temperature,
-            max_tokens=4000
+            max_tokens=max_tokens
         )
 
         # 解析JSON（完全保留ComfyUI的解析逻辑）
@@ -190,7 +426,8 @@ class PersonaGenerator:
     async def _generate_tweet_strategy(
         self,
         core_persona: Dict,
-        temperature: float
+        temperature: float,
+        max_tokens: int
     ) -> Dict:
         """
         Stage 2: 推文策略生成
@@ -246,7 +483,7 @@ CRITICAL GUIDELINES:
         response = await self.llm.generate(
             messages=messages,
             temperature=temperature,
-            max_tokens=8000
+            max_tokens=max_tokens
         )
 
         return self._parse_json_response(response)
@@ -256,7 +493,8 @@ CRITICAL GUIDELINES:
         core_persona: Dict,
         strategy: Dict,
         num_tweets: int,
-        temperature: float
+        temperature: float,
+        max_tokens: int
     ) -> Dict:
         """
         Stage 3: 生成示例推文
@@ -283,7 +521,7 @@ CRITICAL GUIDELINES:
         response = await self.llm.generate(
             messages=messages,
             temperature=temperature,
-            max_tokens=8000
+            max_tokens=max_tokens
         )
 
         # 解析tweets array
@@ -299,7 +537,8 @@ CRITICAL GUIDELINES:
     async def _generate_social_network(
         self,
         core_persona: Dict,
-        temperature: float
+        temperature: float,
+        max_tokens: int
     ) -> Dict:
         """
         Stage 4: 社交关系生成
@@ -353,7 +592,7 @@ Each person needs: name, age, relation, personality, backstory, current_status,
         response = await self.llm.generate(
             messages=messages,
             temperature=temperature,
-            max_tokens=4000
+            max_tokens=max_tokens
         )
 
         return self._parse_json_response(response)
@@ -361,7 +600,8 @@ Each person needs: name, age, relation, personality, backstory, current_status,
     async def _generate_authenticity(
         self,
         core_persona: Dict,
-        temperature: float
+        temperature: float,
+        max_tokens: int
     ) -> Dict:
         """
         Stage 5: 真实感系统生成
@@ -409,7 +649,7 @@ OUTPUT:
         response = await self.llm.generate(
             messages=messages,
             temperature=temperature,
-            max_tokens=3000
+            max_tokens=max_tokens
         )
 
         return self._parse_json_response(response)
@@ -417,7 +657,8 @@ OUTPUT:
     async def _extract_visual_profile(
         self,
         core_persona: Dict,
-        temperature: float
+        temperature: float,
+        max_tokens: int
     ) -> Dict:
         """
         Stage 6: 视觉档案提取
@@ -458,7 +699,7 @@ OUTPUT:
         response = await self.llm.generate(
             messages=messages,
             temperature=temperature,
-            max_tokens=2000
+            max_tokens=max_tokens
         )
 
         return self._parse_json_response(response)
@@ -467,7 +708,8 @@ OUTPUT:
         self,
         core_persona: Dict,
         num_entries: int,
-        temperature: float
+        temperature: float,
+        max_tokens: int
     ) -> Dict:
         """
         Stage 7: 知识库生成
@@ -511,7 +753,7 @@ OUTPUT:
         response = await self.llm.generate(
             messages=messages,
             temperature=temperature,
-            max_tokens=5000
+            max_tokens=max_tokens
         )
 
         return self._parse_json_response(response)
@@ -530,7 +772,6 @@ OUTPUT:
         完全保留ComfyUI PersonaMerger的逻辑
         """
         # 深拷贝core_persona
-        import copy
         merged = copy.deepcopy(core_persona)
 
         # 合并twitter_persona
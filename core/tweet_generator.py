@@ -3,9 +3,12 @@
 直接调用LLM API，不依赖ComfyUI节点
 """
 import asyncio
+import hashlib
+import itertools
 import json
+from collections import OrderedDict, defaultdict
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, Union
 from datetime import datetime
 import sys
 import logging
@@ -14,27 +17,214 @@ import logging
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from utils.llm_client import AsyncLLMClient, LLMClientPool
+from utils.pool_file import (
+    PENDING_REPAIR, JsonlSidecar, PoolCheckpoint, iter_pool_tweets, pending_repair_records,
+    sidecar_path_for, write_pool_file
+)
+from utils.tweet_length import MAX_TWEET_LENGTH, shorten_locally
+from utils.content_rules import get_rule_scanner
+from utils.near_dup import NearDuplicateIndex
 from prompts.tweet_generation_prompt import _select_diverse_examples
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 内容池结束时每次从sidecar读出修复的待修复推文数（内存占用与待修复总数无关）
+REPAIR_CHUNK_SIZE = 200
+
+
+class TweetStreamParser:
+    """
+    流式响应的增量解析器（TWEET / SCENE）
+
+    行规则与 StandaloneTweetGenerator._parse_response 一致：SCENE 之后遇到空行或
+    新的 TWEET 行即视为 SCENE 结束，此时可以终止流，截断后的文本解析结果不变
+    （模型输出多组时保留第一组）。
+    """
+
+    def __init__(self, max_length: int = 270):
+        """
+        Args:
+            max_length: 推文长度上限，TWEET 行超过时立即标记 overlong
+        """
+        self.max_length = max_length
+        self.tweet_text: Optional[str] = None  # TWEET 行结束后才确定
+        self.overlong = False
+        self.scene_complete = False
+        self._consumed = 0  # 已处理的完整行的字符偏移
+        self._in_scene = False
+
+    def reset(self) -> None:
+        """重置状态（客户端重试时累计文本会从头开始）"""
+        self.__init__(self.max_length)
+
+    def feed(self, text: str) -> bool:
+        """
+        处理当前累计文本
+
+        Args:
+            text: 到目前为止收到的完整响应文本
+
+        Returns:
+            SCENE 是否已完整（True 时可终止流）
+        """
+        if len(text) < self._consumed:
+            self.reset()
+
+        while not self.scene_complete:
+            end = text.find('\n', self._consumed)
+            if end < 0:
+                break
+            self._feed_line(text[self._consumed:end])
+            self._consumed = end + 1
+
+        # 未结束的 TWEET 行一旦超长就标记
+        partial = text[self._consumed:]
+        if (not self.scene_complete and partial.startswith("TWEET:")
+                and len(partial.replace("TWEET:", "").strip()) > self.max_length):
+            self.overlong = True
+
+        return self.scene_complete
+
+    def _feed_line(self, line: str) -> None:
+        """处理一个完整行"""
+        if self._in_scene:
+            if line.startswith("TWEET") or not line.strip():
+                self.scene_complete = True
+        elif line.startswith("TWEET:"):
+            self.tweet_text = line.replace("TWEET:", "").strip()
+            self.overlong = len(self.tweet_text) > self.max_length
+        elif line.startswith("SCENE:"):
+            self._in_scene = True
+
+
+def _format_examples(examples: List[Dict]) -> str:
+    """把示例推文渲染为prompt中的 Example 段落"""
+    examples_text = ""
+    for i, example in enumerate(examples, 1):
+        examples_text += f"\n**Example {i}** ({example.get('mood', '')}):\n"
+        examples_text += f"TWEET: {example.get('text', '')}\n"
+        examples_text += f"SCENE: {example.get('scene_hint', '')}\n"
+    return examples_text
+
+
+def _persona_fingerprint(persona: Dict) -> str:
+    """人设中影响prompt的字段（名字/system_prompt/示例）的指纹"""
+    persona_data = persona.get("data", {})
+    payload = json.dumps(
+        [
+            persona_data.get("name", ""),
+            persona_data.get("system_prompt", ""),
+            persona_data.get("twitter_persona", {}).get("tweet_examples", [])
+        ],
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class CompiledPersonaPrompt:
+    """
+    人设prompt预编译结果，同一 (人设, explicit_nudity_allowed) 的所有推文共用
+
+    - system_prompt: 完整系统prompt（只拼接一次）
+    - 示例轮换：示例只评分排序一次，取前 ROTATION_POOL 个按窗口轮换，
+      第一个窗口与 _select_diverse_examples(max_examples=3) 的结果一致
+    """
+
+    EXAMPLES_PER_PROMPT = 3
+    ROTATION_POOL = 6
+
+    def __init__(self, persona: Dict, system_prompt: str, fingerprint: str):
+        """
+        Args:
+            persona: 人设JSON（用于快速判断是否同一个对象）
+            system_prompt: 已构建的系统prompt
+            fingerprint: 人设指纹（人设文件内容变化时失效）
+        """
+        self.persona = persona
+        self.system_prompt = system_prompt
+        self.fingerprint = fingerprint
+
+        tweet_examples = persona.get("data", {}).get("twitter_persona", {}).get("tweet_examples", [])
+        ranked = _select_diverse_examples(tweet_examples, max_examples=self.ROTATION_POOL)
+
+        if len(ranked) <= self.EXAMPLES_PER_PROMPT:
+            windows = [ranked]
+        else:
+            windows = [
+                [ranked[(start + i) % len(ranked)] for i in range(self.EXAMPLES_PER_PROMPT)]
+                for start in range(len(ranked))
+            ]
+        self._example_blocks = [_format_examples(window) for window in windows]
+        self._cursor = 0
+
+    def next_examples_text(self) -> str:
+        """按轮换顺序返回下一组示例文本"""
+        block = self._example_blocks[self._cursor % len(self._example_blocks)]
+        self._cursor += 1
+        return block
+
 
 class StandaloneTweetGenerator:
     """独立推文生成器"""
 
-    def __init__(self, llm_client: AsyncLLMClient):
+    MAX_COMPILED_PROMPTS = 128
+    MAX_TOKENS = 2000  # 单条推文请求的max_tokens
+    MULTI_MAX_TOKENS_PER_TWEET = 700  # 多条生成时每条推文预留的输出token
+    REWRITE_BATCH_SIZE = 8  # 批量改写时每次调用的推文数
+    REWRITE_MAX_TOKENS_PER_TWEET = 200  # 批量改写时每条推文预留的输出token
+
+    def __init__(
+        self,
+        llm_client: Union[LLMClientPool, AsyncLLMClient],
+        stream: bool = False
+    ):
+        """
+        Args:
+            llm_client: LLM调用入口（推荐传入LLMClientPool，使并发/限流统一生效）
+            stream: 流式生成：SCENE 完整即终止响应，TWEET 超长时在响应结束前就开始改写
+        """
         self.llm = llm_client
+        self.stream = stream
+        self._compiled_prompts: "OrderedDict[tuple, CompiledPersonaPrompt]" = OrderedDict()
+
+    def _get_compiled_prompt(self, persona: Dict, explicit_nudity_allowed: bool) -> CompiledPersonaPrompt:
+        """
+        获取人设的预编译prompt（同一个persona对象直接命中；
+        重新加载的人设按内容指纹判断，文件内容变化时重新编译）
+        """
+        key = (persona.get("data", {}).get("name", ""), explicit_nudity_allowed)
+        compiled = self._compiled_prompts.get(key)
+        if compiled is not None and compiled.persona is persona:
+            self._compiled_prompts.move_to_end(key)
+            return compiled
+
+        fingerprint = _persona_fingerprint(persona)
+        if compiled is None or compiled.fingerprint != fingerprint:
+            compiled = CompiledPersonaPrompt(
+                persona,
+                self._build_system_prompt(persona, explicit_nudity_allowed),
+                fingerprint
+            )
+        else:
+            compiled.persona = persona
+
+        self._compiled_prompts[key] = compiled
+        self._compiled_prompts.move_to_end(key)
+        while len(self._compiled_prompts) > self.MAX_COMPILED_PROMPTS:
+            self._compiled_prompts.popitem(last=False)
+        return compiled
 
     async def _ensure_tweet_length(
         self,
         tweet_text: str,
         persona: Dict,
-        max_length: int = 270,
+        max_length: int = MAX_TWEET_LENGTH,
         max_retries: int = 3
     ) -> str:
         """
-        确保推文长度在限制内,必要时自动改写
+        确保推文长度在限制内：先本地规则缩短，不够再逐条LLM改写
 
         Args:
             tweet_text: 原始推文文本
@@ -45,6 +235,25 @@ class StandaloneTweetGenerator:
         Returns:
             符合长度要求的推文文本
         """
+        if len(tweet_text) <= max_length:
+            return tweet_text
+        tweet_text = shorten_locally(tweet_text, max_length)
+        tweet_text, _ = await self._rewrite_until_fits(tweet_text, persona, max_length, max_retries)
+        return tweet_text
+
+    async def _rewrite_until_fits(
+        self,
+        tweet_text: str,
+        persona: Dict,
+        max_length: int = MAX_TWEET_LENGTH,
+        max_retries: int = 3
+    ) -> Tuple[str, int]:
+        """
+        逐条LLM改写直到长度达标
+
+        Returns:
+            (改写后的推文, LLM调用次数)
+        """
         retry_count = 0
 
         while len(tweet_text) > max_length and retry_count < max_retries:
@@ -61,7 +270,266 @@ class StandaloneTweetGenerator:
                 f"({len(tweet_text)}字符)"
             )
 
-        return tweet_text
+        return tweet_text, retry_count
+
+    async def repair_tweets(
+        self,
+        tweet_texts: List[str],
+        persona: Dict,
+        max_length: int = MAX_TWEET_LENGTH
+    ) -> Tuple[List[str], List[List[str]], Dict[str, int]]:
+        """
+        两级修复（用于整个内容池收集到的超长/违规推文）：
+        1. 超长的先用本地规则缩短（空白、重复分句、末尾emoji），不调用LLM
+        2. 仍超长或含禁用内容（config/content_rules.yaml）的按 REWRITE_BATCH_SIZE 条一组
+           批量改写，每条附带要修正的问题；批量结果缺失或仍不合格的回退为逐条改写
+
+        Args:
+            tweet_texts: 推文文本列表
+            persona: 人设JSON
+            max_length: 最大长度限制
+
+        Returns:
+            (与输入一一对应的推文文本, 每条仍存在的违规列表, 统计 {overlong, violations,
+             local_fixed, batch_calls, batch_fixed, single_calls, llm_calls_avoided})
+        """
+        scanner = get_rule_scanner()
+        results = list(tweet_texts)
+        violations = [scanner.scan(tweet_text) for tweet_text in results]
+        stats = {
+            "overlong": 0, "violations": 0, "local_fixed": 0,
+            "batch_calls": 0, "batch_fixed": 0, "single_calls": 0
+        }
+
+        pending = []
+        for index, tweet_text in enumerate(results):
+            overlong = len(tweet_text) > max_length
+            stats["overlong"] += overlong
+            stats["violations"] += bool(violations[index])
+            if not overlong and not violations[index]:
+                continue
+            if overlong:
+                results[index] = shorten_locally(tweet_text, max_length)
+                violations[index] = scanner.scan(results[index])
+                if len(results[index]) <= max_length and not violations[index]:
+                    stats["local_fixed"] += 1
+                    continue
+            pending.append(index)
+        flagged = stats["local_fixed"] + len(pending)
+
+        def problems(index: int) -> List[str]:
+            issues = []
+            if len(results[index]) > max_length:
+                issues.append(f"too long ({len(results[index])} characters, must be under {max_length})")
+            for violation in violations[index]:
+                rule, _, found = violation.partition(":")
+                issues.append(f'remove the banned {rule.replace("_", " ")} "{found}"')
+            return issues
+
+        def accept(index: int, tweet_text: str) -> bool:
+            """改写结果不超长且没有违规时采用"""
+            if len(tweet_text) > max_length or scanner.scan(tweet_text):
+                return False
+            results[index] = tweet_text
+            violations[index] = []
+            return True
+
+        # 批量改写（只剩1条时直接逐条改写，单条prompt更短）
+        async def rewrite_chunk(chunk: List[int]) -> None:
+            if len(chunk) < 2:
+                return
+            stats["batch_calls"] += 1
+            try:
+                rewritten = await self._rewrite_tweets_batch(
+                    [(results[i], problems(i)) for i in chunk], persona, max_length
+                )
+            except Exception as e:
+                logger.warning(f"批量改写失败，{len(chunk)} 条回退为逐条改写: {e}")
+                return
+            for position, index in enumerate(chunk):
+                if position in rewritten and accept(index, rewritten[position]):
+                    stats["batch_fixed"] += 1
+
+        size = self.REWRITE_BATCH_SIZE
+        await asyncio.gather(*[
+            rewrite_chunk(pending[start:start + size]) for start in range(0, len(pending), size)
+        ])
+
+        # 逐条回退：含禁用内容的单独改写一次，仍超长的走逐条改写循环
+        async def rewrite_single(index: int) -> None:
+            if violations[index]:
+                stats["single_calls"] += 1
+                try:
+                    rewritten = await self._rewrite_tweets_batch(
+                        [(results[index], problems(index))], persona, max_length
+                    )
+                except Exception as e:
+                    logger.warning(f"违规推文改写失败: {e}")
+                    return
+                if 0 not in rewritten or accept(index, rewritten[0]) or scanner.scan(rewritten[0]):
+                    return
+                results[index] = rewritten[0]  # 违规已去掉，只剩超长
+                violations[index] = []
+            results[index], calls = await self._rewrite_until_fits(results[index], persona, max_length)
+            stats["single_calls"] += calls
+            violations[index] = scanner.scan(results[index])
+
+        await asyncio.gather(*[
+            rewrite_single(i) for i in pending
+            if len(results[i]) > max_length or violations[i]
+        ])
+
+        # 逐条改写时每条待修复推文至少调用一次LLM
+        stats["llm_calls_avoided"] = max(0, flagged - stats["batch_calls"] - stats["single_calls"])
+        return results, violations, stats
+
+    async def _rewrite_tweets_batch(
+        self,
+        items: List[Tuple[str, List[str]]],
+        persona: Dict,
+        max_length: int = MAX_TWEET_LENGTH
+    ) -> Dict[int, str]:
+        """
+        一次LLM调用改写多条推文
+
+        Args:
+            items: [(推文, 要修正的问题列表)]
+            persona: 人设JSON
+            max_length: 最大长度限制
+
+        Returns:
+            {输入下标: 改写后的推文}，缺失或格式错误的下标不包含
+        """
+        from utils.json_parser import clean_markdown_json
+
+        persona_data = persona.get("data", {})
+        items_text = "\n".join(
+            json.dumps({"id": i, "tweet": text, "fix": issues}, ensure_ascii=False)
+            for i, (text, issues) in enumerate(items, 1)
+        )
+        rewrite_prompt = f"""You are {persona_data.get('name', 'Unknown')}.
+
+These {len(items)} tweets of yours break the posting rules. "fix" lists what is wrong with each one:
+{items_text}
+
+**Task**: Rewrite EACH tweet so it fixes everything in its "fix" list and stays UNDER {max_length} characters, while:
+1. **Preserving the core meaning and emotion** - keep the same vibe and message
+2. **Maintaining your authentic voice** - same tone, same style
+3. **Keeping the physical/sensory details** - don't lose the visceral quality
+4. **Cutting unnecessary words** - remove filler, redundancy, over-description
+5. **No timestamps, weekdays, dates, holidays or poetic phrases** - describe states, not when it happens
+
+Rewrite every tweet independently - do not merge them or reuse wording between them.
+
+**Output ONLY a JSON array** with exactly {len(items)} objects, no markdown and no explanations:
+[{{"id": 1, "tweet": "rewritten tweet"}}, ...]
+"""
+
+        response = await self.llm.generate(
+            messages=[{"role": "user", "content": rewrite_prompt}],
+            temperature=0.7,  # 稍低温度保持一致性
+            max_tokens=max(500, self.REWRITE_MAX_TOKENS_PER_TWEET * len(items))
+        )
+
+        data = json.loads(clean_markdown_json(response))
+        if not isinstance(data, list):
+            raise ValueError(f"批量改写响应不是JSON数组: {type(data).__name__}")
+
+        rewritten: Dict[int, str] = {}
+        for item in data:
+            if not isinstance(item, dict):
+                continue
+            item_id = item.get("id")
+            tweet_text = item.get("tweet")
+            if (not isinstance(item_id, int) or isinstance(item_id, bool)
+                    or not 1 <= item_id <= len(items)):
+                continue
+            if not isinstance(tweet_text, str) or not tweet_text.strip():
+                continue
+            rewritten[item_id - 1] = tweet_text.strip()
+        return rewritten
+
+    async def _call_llm(
+        self,
+        messages: List[Dict],
+        temperature: float,
+        persona: Dict,
+        early_rewrite_enabled: bool = True
+    ) -> Tuple[str, Optional[Tuple[str, asyncio.Task]]]:
+        """
+        调用LLM生成推文响应
+
+        流式模式下 SCENE 完整即终止流；TWEET 行结束且超长时立即启动改写任务
+        （early_rewrite_enabled=False 时不启动），与 SCENE 的剩余输出并行。
+
+        Returns:
+            (响应文本, (触发改写的原推文, 改写任务) 或 None)
+        """
+        if not self.stream:
+            response = await self.llm.generate(
+                messages=messages,
+                temperature=temperature,
+                max_tokens=self.MAX_TOKENS
+            )
+            return response, None
+
+        parser = TweetStreamParser()
+        early_rewrite: Optional[Tuple[str, asyncio.Task]] = None
+
+        def on_text(text: str) -> bool:
+            nonlocal early_rewrite
+            done = parser.feed(text)
+            if early_rewrite_enabled and parser.overlong and parser.tweet_text and early_rewrite is None:
+                logger.info(f"流式: TWEET超长 ({len(parser.tweet_text)}字符)，提前开始改写")
+                early_rewrite = (
+                    parser.tweet_text,
+                    asyncio.create_task(self._ensure_tweet_length(parser.tweet_text, persona))
+                )
+            return done
+
+        try:
+            response = await self.llm.generate(
+                messages=messages,
+                temperature=temperature,
+                max_tokens=self.MAX_TOKENS,
+                on_text=on_text
+            )
+        except BaseException:
+            if early_rewrite is not None:
+                early_rewrite[1].cancel()
+            raise
+
+        return response, early_rewrite
+
+    async def _finalize_tweet_length(
+        self,
+        tweet_text: str,
+        persona: Dict,
+        early_rewrite: Optional[Tuple[str, asyncio.Task]]
+    ) -> str:
+        """使用提前启动的改写结果（原推文一致时），否则按常规检查长度"""
+        if early_rewrite is not None:
+            original, task = early_rewrite
+            if original == tweet_text:
+                return await task
+            task.cancel()
+        return await self._ensure_tweet_length(tweet_text, persona)
+
+    async def _finalize_result(
+        self,
+        result: Dict,
+        persona: Dict,
+        early_rewrite: Optional[Tuple[str, asyncio.Task]] = None
+    ) -> None:
+        """
+        逐条返回的推文在返回前修复超长/违规（与内容池相同的 repair_tweets 路径），
+        rule_violations 按最终文本重新记录
+        """
+        tweet_text = result.get("tweet_text", "")
+        if early_rewrite is not None:
+            tweet_text = await self._finalize_tweet_length(tweet_text, persona, early_rewrite)
+        texts, violations, _ = await self.repair_tweets([tweet_text], persona)
+        self.apply_repair(result, texts[0], violations[0])
 
     async def generate_single_tweet(
         self,
@@ -85,7 +553,7 @@ class StandaloneTweetGenerator:
             推文结果 {"tweet_text": ..., "scene_hint": ...}
         """
         # 构建prompt
-        system_prompt = self._build_system_prompt(persona, explicit_nudity_allowed)
+        system_prompt = self._get_compiled_prompt(persona, explicit_nudity_allowed).system_prompt
         user_prompt = self._build_user_prompt(persona, calendar_plan, context)
 
         messages = [
@@ -94,20 +562,13 @@ class StandaloneTweetGenerator:
         ]
 
         # 调用LLM
-        response = await self.llm.generate(
-            messages=messages,
-            temperature=temperature,
-            max_tokens=2000
-        )
+        response, early_rewrite = await self._call_llm(messages, temperature, persona)
 
         # 解析结果
         result = self._parse_response(response, calendar_plan, persona)
 
-        # 检查推文长度并自动改写
-        result["tweet_text"] = await self._ensure_tweet_length(
-            result.get("tweet_text", ""),
-            persona
-        )
+        # 修复超长/违规推文
+        await self._finalize_result(result, persona, early_rewrite)
 
         return result
 
@@ -116,7 +577,8 @@ class StandaloneTweetGenerator:
         persona: Dict,
         generation_spec: Dict,
         temperature: float = 1.0,
-        explicit_nudity_allowed: bool = False
+        explicit_nudity_allowed: bool = False,
+        enforce_length: bool = True
     ) -> Dict:
         """
         从generation_spec生成推文（新版，用于pool generation）
@@ -126,41 +588,182 @@ class StandaloneTweetGenerator:
             generation_spec: 生成规格（来自ContentPlanner）
             temperature: 温度参数
             explicit_nudity_allowed: 是否允许裸露内容
+            enforce_length: 是否在返回前处理超长/违规推文（False时由调用方统一批量处理）
 
         Returns:
             推文结果 {"tweet_text": ..., "scene_hint": ..., "content_type": ..., "subtype": ...}
         """
         # 构建prompt
-        system_prompt = self._build_system_prompt(persona, explicit_nudity_allowed)
-        user_prompt = self._build_user_prompt_from_spec(persona, generation_spec)
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+        messages = self.build_spec_messages(persona, generation_spec, explicit_nudity_allowed)
 
         # 调用LLM
-        response = await self.llm.generate(
-            messages=messages,
-            temperature=temperature,
-            max_tokens=2000
-        )
+        response, early_rewrite = await self._call_llm(messages, temperature, persona, enforce_length)
 
         # 解析结果
         result = self._parse_response(response, generation_spec, persona)
 
         # 添加generation_spec信息到结果
+        self._add_spec_fields(result, generation_spec)
+        if not enforce_length:
+            return result
+
+        # 修复超长/违规推文
+        await self._finalize_result(result, persona, early_rewrite)
+
+        return result
+
+    def build_spec_messages(
+        self,
+        persona: Dict,
+        generation_spec: Dict,
+        explicit_nudity_allowed: bool = False
+    ) -> List[Dict]:
+        """构建单条spec的请求消息（交互调用和离线批量文件共用）"""
+        compiled = self._get_compiled_prompt(persona, explicit_nudity_allowed)
+        user_prompt = self._build_user_prompt_from_spec(
+            persona, generation_spec, compiled.next_examples_text()
+        )
+        return [
+            {"role": "system", "content": compiled.system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    async def generate_from_specs(
+        self,
+        persona: Dict,
+        generation_specs: List[Dict],
+        temperature: float = 1.0,
+        explicit_nudity_allowed: bool = False,
+        enforce_length: bool = True
+    ) -> List[Union[Dict, Exception]]:
+        """
+        一次LLM调用生成多条推文（共用同一份系统prompt，摊薄重复的prompt前缀）
+
+        响应要求为 [{"id": 1, "tweet": ..., "scene": ...}, ...] 的JSON数组并严格校验；
+        缺失或格式不对的条目单独回退到 generate_from_spec。
+
+        Args:
+            persona: 人设JSON
+            generation_specs: 一组兼容的生成规格（建议同一content_type）
+            temperature: 温度参数
+            explicit_nudity_allowed: 是否允许裸露内容
+            enforce_length: 是否在返回前处理超长/违规推文（False时由调用方统一批量处理）
+
+        Returns:
+            与 generation_specs 一一对应的推文结果（失败的位置为异常，同 gather(return_exceptions=True)）
+        """
+        if len(generation_specs) == 1:
+            results = await asyncio.gather(
+                self.generate_from_spec(
+                    persona, generation_specs[0], temperature, explicit_nudity_allowed, enforce_length
+                ),
+                return_exceptions=True
+            )
+            return list(results)
+
+        compiled = self._get_compiled_prompt(persona, explicit_nudity_allowed)
+        messages = [
+            {"role": "system", "content": compiled.system_prompt},
+            {"role": "user", "content": self._build_multi_user_prompt_from_specs(
+                persona, generation_specs, compiled.next_examples_text()
+            )}
+        ]
+
+        try:
+            response = await self.llm.generate(
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max(self.MAX_TOKENS, self.MULTI_MAX_TOKENS_PER_TWEET * len(generation_specs))
+            )
+            items = self._parse_multi_response(response, len(generation_specs))
+        except Exception as e:
+            logger.warning(f"多条生成调用失败，{len(generation_specs)} 条全部回退为单条调用: {e}")
+            items = {}
+
+        missing = [i for i in range(len(generation_specs)) if i not in items]
+        if missing:
+            logger.info(f"多条生成: {len(missing)}/{len(generation_specs)} 条缺失或格式错误，回退为单条调用")
+
+        async def finalize(index: int) -> Dict:
+            spec = generation_specs[index]
+            if index not in items:
+                return await self.generate_from_spec(
+                    persona, spec, temperature, explicit_nudity_allowed, enforce_length
+                )
+
+            tweet_text, scene_hint = items[index]
+            result = self._build_result(tweet_text, scene_hint, spec, persona)
+            self._add_spec_fields(result, spec)
+            if enforce_length:
+                await self._finalize_result(result, persona)
+            return result
+
+        results = await asyncio.gather(
+            *[finalize(i) for i in range(len(generation_specs))],
+            return_exceptions=True
+        )
+        return list(results)
+
+    @staticmethod
+    def _add_spec_fields(result: Dict, generation_spec: Dict) -> None:
+        """把generation_spec的类型信息写入推文结果"""
         result["content_type"] = generation_spec.get("content_type", "")
         result["subtype"] = generation_spec.get("subtype", "")
         result["mood"] = generation_spec.get("mood", "")
+        # 记录变化组合，补量时据此避免重复
+        if generation_spec.get("variations"):
+            result["variations"] = generation_spec["variations"]
+
+    @staticmethod
+    def apply_repair(result: Dict, tweet_text: str, violations: List[str]) -> None:
+        """写回 repair_tweets 的结果（违规已修正时去掉 rule_violations）"""
+        result["tweet_text"] = tweet_text
+        if violations:
+            result["rule_violations"] = violations
+        else:
+            result.pop("rule_violations", None)
 
-        # 检查推文长度并自动改写
-        result["tweet_text"] = await self._ensure_tweet_length(
-            result.get("tweet_text", ""),
-            persona
-        )
+    @staticmethod
+    def _parse_multi_response(response: str, expected: int) -> Dict[int, Tuple[str, str]]:
+        """
+        严格解析多条生成的JSON数组响应
 
-        return result
+        只接受 id 在 1..expected 范围内、tweet/scene 均为非空字符串的对象；
+        重复的 id 视为格式错误（两条都丢弃）。
+
+        Returns:
+            {spec下标: (tweet_text, scene_hint)}，未包含的下标需要单独回退
+        """
+        from utils.json_parser import clean_markdown_json
+
+        data = json.loads(clean_markdown_json(response))
+        if not isinstance(data, list):
+            raise ValueError(f"多条生成响应不是JSON数组: {type(data).__name__}")
+
+        items: Dict[int, Tuple[str, str]] = {}
+        duplicated = set()
+        for item in data:
+            if not isinstance(item, dict):
+                continue
+            item_id = item.get("id")
+            tweet_text = item.get("tweet")
+            scene_hint = item.get("scene")
+            if (not isinstance(item_id, int) or isinstance(item_id, bool)
+                    or not 1 <= item_id <= expected):
+                continue
+            if not isinstance(tweet_text, str) or not tweet_text.strip():
+                continue
+            if not isinstance(scene_hint, str) or not scene_hint.strip():
+                continue
+
+            index = item_id - 1
+            if index in items:
+                duplicated.add(index)
+            items[index] = (tweet_text.strip(), " ".join(scene_hint.split()))
+
+        for index in duplicated:
+            del items[index]
+        return items
 
     def _build_system_prompt(self, persona: Dict, explicit_nudity_allowed: bool) -> str:
         """构建系统prompt - 完全保留原有逻辑"""
@@ -507,13 +1110,7 @@ Do NOT use poetic language. Do NOT use metaphors. Do NOT make it "pretty". Make
 
         # 智能选择示例（类型多样性、心情多样性、质量优先）
         selected_examples = _select_diverse_examples(tweet_examples, max_examples=3)
-
-        examples_text = ""
-        if selected_examples:
-            for i, example in enumerate(selected_examples, 1):
-                examples_text += f"\n**Example {i}** ({example.get('mood', '')}):\n"
-                examples_text += f"TWEET: {example.get('text', '')}\n"
-                examples_text += f"SCENE: {example.get('scene_hint', '')}\n"
+        examples_text = _format_examples(selected_examples)
 
         # ⭐ 构建上下文（使用完整的context格式）
         context_text = ""
@@ -562,7 +1159,8 @@ Now create a new post that feels like it came from the same person, but explores
     def _build_user_prompt_from_spec(
         self,
         persona: Dict,
-        generation_spec: Dict
+        generation_spec: Dict,
+        examples_text: Optional[str] = None
     ) -> str:
         """
         从generation_spec构建用户prompt（新版，pool generation）
@@ -575,38 +1173,19 @@ Now create a new post that feels like it came from the same person, but explores
                 - subtype_description: 子类型描述
                 - variations: 变化维度字典
                 - mood: 心情
+            examples_text: 预渲染的示例文本（来自CompiledPersonaPrompt；None时现场选择）
         """
         persona_data = persona.get("data", {})
 
         # 获取示例推文
-        tweet_examples = persona_data.get("twitter_persona", {}).get("tweet_examples", [])
-        selected_examples = _select_diverse_examples(tweet_examples, max_examples=3)
-
-        examples_text = ""
-        if selected_examples:
-            for i, example in enumerate(selected_examples, 1):
-                examples_text += f"\n**Example {i}** ({example.get('mood', '')}):\n"
-                examples_text += f"TWEET: {example.get('text', '')}\n"
-                examples_text += f"SCENE: {example.get('scene_hint', '')}\n"
+        if examples_text is None:
+            tweet_examples = persona_data.get("twitter_persona", {}).get("tweet_examples", [])
+            examples_text = _format_examples(_select_diverse_examples(tweet_examples, max_examples=3))
 
-        # 提取generation_spec信息
-        content_type = generation_spec.get('content_type', 'casual_selfie')
-        subtype = generation_spec.get('subtype', '')
-        subtype_desc = generation_spec.get('subtype_description', '')
-        variations = generation_spec.get('variations', {})
         mood = generation_spec.get('mood', 'confident')
 
         # 构建详细的场景指导
-        scene_guidance = f"""
-**Content Type**: {content_type.replace('_', ' ').title()}
-**Specific Scene**: {subtype.replace('_', ' ').title()} - {subtype_desc}
-**Mood**: {mood}
-
-**Scene Requirements**:"""
-
-        for dim, value in variations.items():
-            dim_name = dim.replace('_', ' ').title()
-            scene_guidance += f"\n- {dim_name}: {value}"
+        scene_guidance = self._format_scene_guidance(generation_spec)
 
         prompt = f"""You are {persona_data.get('name', 'Unknown')}, creating alluring social media content.
 
@@ -653,6 +1232,81 @@ SCENE: [Detailed camera-ready description following ALL requirements above]"""
 
         return prompt
 
+    @staticmethod
+    def _format_scene_guidance(generation_spec: Dict) -> str:
+        """渲染generation_spec的场景指导（内容类型、子类型、心情、变化维度）"""
+        content_type = generation_spec.get('content_type', 'casual_selfie')
+        subtype = generation_spec.get('subtype', '')
+        subtype_desc = generation_spec.get('subtype_description', '')
+        variations = generation_spec.get('variations', {})
+        mood = generation_spec.get('mood', 'confident')
+
+        scene_guidance = f"""
+**Content Type**: {content_type.replace('_', ' ').title()}
+**Specific Scene**: {subtype.replace('_', ' ').title()} - {subtype_desc}
+**Mood**: {mood}
+
+**Scene Requirements**:"""
+
+        for dim, value in variations.items():
+            dim_name = dim.replace('_', ' ').title()
+            scene_guidance += f"\n- {dim_name}: {value}"
+
+        return scene_guidance
+
+    def _build_multi_user_prompt_from_specs(
+        self,
+        persona: Dict,
+        generation_specs: List[Dict],
+        examples_text: str
+    ) -> str:
+        """
+        多条生成的用户prompt：规则和示例只出现一次，每条spec单独列出场景要求，
+        输出为JSON数组
+        """
+        persona_data = persona.get("data", {})
+
+        posts_text = ""
+        for post_id, spec in enumerate(generation_specs, 1):
+            posts_text += f"\n### Post {post_id}\n{self._format_scene_guidance(spec)}\n"
+
+        return f"""You are {persona_data.get('name', 'Unknown')}, creating alluring social media content.
+
+Create {len(generation_specs)} separate posts. Each post has its own scene requirements:
+{posts_text}
+## CRITICAL: Content Creation Rules
+
+1. **NO Timestamps or Dates**: This content will be published later
+   - ❌ NEVER: "2:17am", "Monday", "tonight", "this morning"
+   - ✅ ALWAYS: General states like "late night", "can't sleep", "feeling restless"
+
+2. **Create Standalone Content**: Every post should work ANY day, ANY time
+   - Write about a **mood** or **physical state**, not a specific moment in time
+   - Focus on sensations, desires, visual details - not temporal references
+
+3. **Follow Scene Requirements EXACTLY**:
+   - Each post MUST incorporate ALL of its own scene requirements
+   - Don't deviate from the specified camera angle, clothing, lighting, etc.
+   - Posts must not reuse each other's wording - each one is a different moment
+
+4. **Match Your Authentic Voice**:
+{examples_text}
+
+5. **Visual Description Must Include**:
+   - Exact camera position and angle (as specified)
+   - Precise clothing description (as specified)
+   - Specific body position and pose
+   - Lighting details (as specified)
+   - Your facial expression matching that post's mood
+   - 2-4 realistic photography modifiers (Raw photo, candid, etc.)
+
+## Output Format (overrides the TWEET/SCENE format)
+
+Output ONLY a JSON array with exactly {len(generation_specs)} objects, one per post, no markdown and no explanations:
+[{{"id": 1, "tweet": "140-280 characters, raw physical sensations, in that post's mood", "scene": "Detailed camera-ready description following ALL of that post's requirements"}}, ...]
+
+"id" is the post number above."""
+
     async def _rewrite_tweet(self, original_tweet: str, persona: Dict) -> str:
         """
         改写超长推文，保持原意但缩短长度
@@ -708,6 +1362,12 @@ Your previous tweet is TOO LONG ({len(original_tweet)} characters) and exceeds T
 
     def _parse_response(self, response: str, calendar_plan: Dict, persona: Dict) -> Dict:
         """解析LLM响应"""
+        tweet_text, scene_hint = self._extract_tweet_scene(response)
+        return self._build_result(tweet_text, scene_hint, calendar_plan, persona)
+
+    @staticmethod
+    def _extract_tweet_scene(response: str) -> Tuple[str, str]:
+        """从 TWEET:/SCENE: 格式的响应中提取推文和场景描述"""
         # 提取TWEET和SCENE
         lines = response.strip().split('\n')
 
@@ -726,6 +1386,16 @@ Your previous tweet is TOO LONG ({len(original_tweet)} characters) and exceeds T
                     else:
                         break
 
+        return tweet_text, scene_hint
+
+    def _build_result(
+        self,
+        tweet_text: str,
+        scene_hint: str,
+        calendar_plan: Dict,
+        persona: Dict
+    ) -> Dict:
+        """由推文和场景描述组装输出结构（图片生成参数、LoRA等）"""
         # ⭐ LLM已经在scene_hint中包含了真实感词汇，直接使用
         # 不再需要PromptEnhancer的死规则处理
         positive_prompt = scene_hint
@@ -768,7 +1438,7 @@ Your previous tweet is TOO LONG ({len(original_tweet)} characters) and exceeds T
                 "cfg": 1.0
             }
 
-        return {
+        result = {
             "slot": calendar_plan.get("slot", 1),
             "time_segment": calendar_plan.get("recommended_time", ""),
             "topic_type": calendar_plan.get("topic_type", ""),
@@ -782,13 +1452,67 @@ Your previous tweet is TOO LONG ({len(original_tweet)} characters) and exceeds T
             }
         }
 
+        # 禁用短语/时间戳等规则检查（逐条返回时由 _finalize_result 修复，内容池模式下与超长推文一起批量改写）
+        violations = get_rule_scanner().scan(tweet_text)
+        if violations:
+            result["rule_violations"] = violations
+        return result
+
+
+async def run_bounded(
+    jobs: Iterator,
+    run_job: Callable[[object], Awaitable],
+    window: int,
+    on_done: Callable[[object], None]
+) -> None:
+    """
+    有界窗口的生产者/消费者：按需从迭代器取任务，同时在途不超过 window 个，
+    完成一个补一个（不会预先为全部任务创建协程）
+
+    Args:
+        jobs: 任务迭代器（惰性消费）
+        run_job: 执行单个任务的协程函数
+        window: 同时在途的任务数上限
+        on_done: 每个任务完成时以其结果调用（任务按完成顺序回调）
+    """
+    jobs = iter(jobs)
+    pending = set()
+    exhausted = False
+
+    try:
+        while True:
+            while not exhausted and len(pending) < window:
+                job = next(jobs, None)
+                if job is None:
+                    exhausted = True
+                    break
+                pending.add(asyncio.ensure_future(run_job(job)))
+
+            if not pending:
+                return
+
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                on_done(task.result())
+    finally:
+        for task in pending:
+            task.cancel()
+
 
 class BatchTweetGenerator:
     """批量推文生成器"""
 
-    def __init__(self, llm_pool: LLMClientPool):
+    def __init__(self, llm_pool: LLMClientPool, stream: bool = False, plan_strategy: str = "random"):
+        """
+        Args:
+            llm_pool: 全局LLM调度池
+            stream: 是否使用流式生成（见 StandaloneTweetGenerator）
+            plan_strategy: 内容池的规划策略（见 ContentPlanner.STRATEGIES）
+        """
         self.llm_pool = llm_pool
-        self.generator = StandaloneTweetGenerator(llm_pool.client)
+        self.plan_strategy = plan_strategy
+        # 通过池调用，而非裸client，保证并发上限和限流真正生效
+        self.generator = StandaloneTweetGenerator(llm_pool, stream=stream)
 
     async def generate_batch(
         self,
@@ -861,7 +1585,13 @@ class BatchTweetGenerator:
         persona: Dict,
         count: int = 365,
         temperature: float = 1.0,
-        explicit_nudity_allowed: bool = False
+        explicit_nudity_allowed: bool = False,
+        tweets_per_call: int = 1,
+        output_file: Optional[str] = None,
+        window: Optional[int] = None,
+        checkpoint: Optional[PoolCheckpoint] = None,
+        plan: Optional[Dict] = None,
+        diversity_state_file: Optional[str] = None
     ) -> Dict:
         """
         生成内容池（新版，基于archetype和content_types配置）
@@ -871,15 +1601,51 @@ class BatchTweetGenerator:
             count: 生成数量
             temperature: 温度参数
             explicit_nudity_allowed: 是否允许裸露内容
+            tweets_per_call: 每次LLM调用生成的推文数（>1时同一content_type的spec
+                合并请求，系统prompt只发送一次；缺失/格式错误的条目回退为单条调用）
+            output_file: 内容池输出路径。提供时每条推文完成即追加到 sidecar
+                (xxx.partial.jsonl)，结束后从 sidecar 流式写出最终文件，内存占用不随数量增长
+            window: 同时在途的生成任务数上限（默认 LLM并发上限×2）
+            checkpoint: 运行检查点（需要output_file）。不存在时保存计划；已存在时沿用
+                原计划和输出路径，只生成 sidecar 中还没有的spec
+            plan: 预先计算好的内容计划（如 ContentPlanner.create_topup_plan 的补量计划，
+                多样性报告取 plan["diversity_stats"]）；提供时忽略count
+            diversity_state_file: 人设的持久化多样性状态。规划时避开之前运行已生成过的变化组合，
+                结束后把本次实际生成的组合写回
 
         Returns:
-            tweets_pool JSON
+            tweets_pool JSON（提供output_file时不含 tweets，改为 tweet_count / output_file）
         """
         from core.content_planner import ContentPlanner
 
-        # 1. 创建内容计划
-        planner = ContentPlanner()
-        plan = planner.create_content_plan(persona, total_count=count)
+        # 1. 创建内容计划（从检查点恢复时沿用原计划）
+        completed_ids = set()
+        if checkpoint is not None and checkpoint.exists():
+            state = checkpoint.load()
+            plan = state["plan"]
+            diversity_report = state["diversity_report"]
+            output_file = state["output_file"]
+            completed_ids = PoolCheckpoint.completed_spec_ids(sidecar_path_for(output_file))
+            print(f"\n♻️  从检查点恢复: {checkpoint.run_id} (已完成 {len(completed_ids)}/{plan['total_count']} 条)")
+        else:
+            if plan is not None:
+                diversity_report = plan.get("diversity_stats", {})
+            else:
+                planner = ContentPlanner(diversity_state_file, strategy=self.plan_strategy)
+                plan = planner.create_content_plan(persona, total_count=count)
+                diversity_report = planner.get_diversity_report()
+            if checkpoint is not None:
+                checkpoint.save({
+                    "run_id": checkpoint.run_id,
+                    "status": "running",
+                    **checkpoint.meta,
+                    "output_file": str(output_file),
+                    "temperature": temperature,
+                    "explicit_nudity_allowed": explicit_nudity_allowed,
+                    "tweets_per_call": tweets_per_call,
+                    "plan": plan,
+                    "diversity_report": diversity_report
+                })
 
         print(f"\n📋 内容生成计划:")
         print(f"   Persona: {plan['persona_name']}")
@@ -891,53 +1657,396 @@ class BatchTweetGenerator:
             print(f"   {content_type}: {type_count} 条")
         print()
 
-        # 2. 收集所有generation specs
-        all_specs = []
-        for content_type, specs in plan['detailed_plan'].items():
-            all_specs.extend(specs)
+        # 2. 按需从计划中取尚未完成的spec（同一content_type按tweets_per_call分组，每组一次调用）
+        def iter_jobs():
+            for specs in plan['detailed_plan'].values():
+                remaining = [spec for spec in specs if spec["spec_id"] not in completed_ids]
+                for start in range(0, len(remaining), tweets_per_call):
+                    yield remaining[start:start + tweets_per_call]
 
-        print(f"🚀 开始生成 {len(all_specs)} 条推文...\n")
+        print(f"🚀 开始生成 {plan['total_count'] - len(completed_ids)} 条推文...\n")
+        if tweets_per_call > 1:
+            print(f"   多条生成: 每次调用最多 {tweets_per_call} 条\n")
 
-        # 3. 并发生成
-        tasks = []
-        for spec in all_specs:
-            task = self.generator.generate_from_spec(
+        # 3. 有界窗口并发生成：完成一个补一个，结果立即追加到sidecar
+        window = window or self.llm_pool.max_concurrent * 2
+        successful_tweets: List[Dict] = []
+        failed_count = 0
+        sidecar = JsonlSidecar(str(sidecar_path_for(output_file))) if output_file else None
+
+        # 超长/违规推文全部生成完后统一修复（本地缩短 + 批量改写）：有sidecar时立即标记写入，
+        # 结束时从sidecar分块读出修复（内存不随数量增长，中断后恢复时继续修复）；否则先收集在内存中
+        needs_repair: List[Tuple[Dict, Dict]] = []
+        repaired_count = 0
+
+        def keep(spec, tweet, pending_repair=False):
+            if sidecar is not None:
+                record = {"spec_id": spec["spec_id"], "tweet": tweet}
+                if pending_repair:
+                    record[PENDING_REPAIR] = True
+                sidecar.append(record)
+            elif pending_repair:
+                needs_repair.append((spec, tweet))
+            else:
+                successful_tweets.append(tweet)
+
+        async def repair_chunk(chunk: List[Tuple[Dict, Dict]]) -> Dict[str, int]:
+            nonlocal repaired_count
+            texts, violations, chunk_stats = await self.generator.repair_tweets(
+                [tweet["tweet_text"] for _, tweet in chunk], persona
+            )
+            for (spec, tweet), tweet_text, remaining in zip(chunk, texts, violations):
+                self.generator.apply_repair(tweet, tweet_text, remaining)
+                keep(spec, tweet)
+            repaired_count += len(chunk) if sidecar is not None else 0
+            return chunk_stats
+
+        async def run_job(group):
+            results = await self.generator.generate_from_specs(
                 persona=persona,
-                generation_spec=spec,
+                generation_specs=group,
                 temperature=temperature,
-                explicit_nudity_allowed=explicit_nudity_allowed
+                explicit_nudity_allowed=explicit_nudity_allowed,
+                enforce_length=False
             )
-            tasks.append(task)
-
-        # 等待所有任务完成
-        tweets = await asyncio.gather(*tasks, return_exceptions=True)
-
-        # 4. 过滤错误
-        successful_tweets = []
-        failed_count = 0
-
-        for i, tweet in enumerate(tweets):
-            if isinstance(tweet, Exception):
-                print(f"❌ 第 {i+1} 条生成失败: {str(tweet)}")
-                failed_count += 1
+            return group, results
+
+        def on_done(job_result):
+            nonlocal failed_count
+            group, results = job_result
+            for spec, tweet in zip(group, results):
+                if isinstance(tweet, Exception):
+                    print(f"❌ {spec['spec_id']} 生成失败: {str(tweet)}")
+                    failed_count += 1
+                else:
+                    pending_repair = (
+                        len(tweet.get("tweet_text", "")) > MAX_TWEET_LENGTH or bool(tweet.get("rule_violations"))
+                    )
+                    keep(spec, tweet, pending_repair)
+
+        repair_stats = None
+        try:
+            await run_bounded(iter_jobs(), run_job, window, on_done)
+
+            # 修复待修复的推文（包括恢复运行时上次中断前标记的）
+            if sidecar is not None:
+                pending = (
+                    ({"spec_id": record["spec_id"]}, record["tweet"])
+                    for record in pending_repair_records(str(sidecar.path))
+                )
             else:
-                successful_tweets.append(tweet)
+                pending = iter(needs_repair)
+            while True:
+                chunk = list(itertools.islice(pending, REPAIR_CHUNK_SIZE))
+                if not chunk:
+                    break
+                chunk_stats = await repair_chunk(chunk)
+                repair_stats = chunk_stats if repair_stats is None else {
+                    key: repair_stats[key] + value for key, value in chunk_stats.items()
+                }
+        finally:
+            if sidecar is not None:
+                sidecar.close()
+
+        # 修复结果以同一spec_id追加到sidecar，不重复计数
+        success_count = len(completed_ids) + (
+            sidecar.count - repaired_count if sidecar is not None else len(successful_tweets)
+        )
 
         print(f"\n✅ 生成完成:")
-        print(f"   成功: {len(successful_tweets)} 条")
+        print(f"   成功: {success_count} 条")
         print(f"   失败: {failed_count} 条")
+        stats = self.llm_pool.get_stats()
+        print(f"   LLM并发峰值: {stats['peak_in_flight']}/{stats['max_concurrent']}")
+        if stats['adaptive']:
+            print(f"   自适应并发: 当前上限 {stats['current_limit']} "
+                  f"(上调{stats['limit_increases']}次, 下调{stats['limit_decreases']}次, 429共{stats['rate_limited']}次)")
+        print(f"   限流等待: {stats['throttle_wait_seconds']}秒")
+        if stats['cache']:
+            print(f"   LLM缓存: 命中 {stats['cache']['hits']} 次, 未命中 {stats['cache']['misses']} 次")
+        if stats['hedged']:
+            print(f"   对冲请求: {stats['hedged']} 次, 其中 {stats['hedge_wins']} 次对冲先返回")
+        if repair_stats:
+            print(f"   待修复推文: 超长 {repair_stats['overlong']} 条, 违规 {repair_stats['violations']} 条 "
+                  f"(本地缩短 {repair_stats['local_fixed']} 条, "
+                  f"批量改写 {repair_stats['batch_fixed']} 条/{repair_stats['batch_calls']} 次调用, "
+                  f"逐条改写 {repair_stats['single_calls']} 次调用)")
+            print(f"   节省改写调用: {repair_stats['llm_calls_avoided']} 次")
         print()
 
         # 5. 多样性报告
-        diversity_report = planner.get_diversity_report()
         print("📈 多样性报告:")
         for content_type, stats in diversity_report.items():
             print(f"   {content_type}:")
             print(f"     生成: {stats['total_generated']} 条")
             print(f"     唯一组合: {stats['unique_combinations']}")
+            if "feature_coverage" in stats:
+                print(f"     选项覆盖: {stats['feature_coverage']:.0%} (最少 {stats['min_feature_count']} 次, "
+                      f"均衡度 {stats['feature_balance']:.2f})")
         print()
 
-        # 6. 构建结果
+        # 6. 登记本次生成的变化组合（从运行前的状态重新加载，未生成的计划组合不记录）
+        if diversity_state_file:
+            generated = successful_tweets if sidecar is None else iter_pool_tweets(str(sidecar.path))
+            recorded = ContentPlanner(diversity_state_file).record_generated(generated)
+            print(f"💾 多样性状态: 登记 {recorded} 个变化组合 -> {diversity_state_file}\n")
+
+        # 7. 构建结果
+        result = self.build_pool_result(persona, plan, diversity_report, successful_tweets)
+        if sidecar is None:
+            return result
+
+        # 从sidecar流式组装最终文件，返回的结果不含推文列表（避免整池常驻内存）
+        del result["tweets"]
+        write_pool_file(result, iter_pool_tweets(str(sidecar.path)), output_file)
+        result["tweet_count"] = success_count
+        result["output_file"] = str(output_file)
+
+        if failed_count > 0 and checkpoint is not None:
+            # 保留sidecar，之后可用同一run_id只补生成失败的spec
+            checkpoint.update(status="incomplete", failed=failed_count)
+            print(f"⚠️  {failed_count} 条失败，可用 --resume {checkpoint.run_id} 补生成\n")
+            return result
+
+        # 全部成功，或没有检查点（无法恢复，如补量）时sidecar已无用
+        sidecar.path.unlink()
+        if checkpoint is not None:
+            checkpoint.update(status="completed")
+        return result
+
+    async def topup_pool(
+        self,
+        persona: Dict,
+        existing_files: List[str],
+        target_count: int,
+        output_file: str,
+        temperature: float = 1.0,
+        explicit_nudity_allowed: bool = False,
+        tweets_per_call: int = 1,
+        window: Optional[int] = None,
+        diversity_state_file: Optional[str] = None
+    ) -> Dict:
+        """
+        按分布补量：对比已有内容池与目标分布，只生成缺少的 content_type/subtype/mood，
+        然后与已有推文合并写出一个完整的内容池
+
+        Args:
+            persona: 人设JSON
+            existing_files: 已有的内容池文件（可多个，合并计算）
+            target_count: 补量后的目标总数
+            output_file: 合并后的内容池输出路径
+            temperature: 温度参数
+            explicit_nudity_allowed: 是否允许裸露内容
+            tweets_per_call: 每次LLM调用生成的推文数
+            window: 同时在途的生成任务数上限
+            diversity_state_file: 人设的持久化多样性状态（见 generate_pool）
+
+        Returns:
+            合并后的内容池信息（不含 tweets，含 tweet_count / output_file / added）
+        """
+        from core.content_planner import ContentPlanner
+
+        existing_tweets: List[Dict] = []
+        for pool_file in existing_files:
+            with open(pool_file, 'r', encoding='utf-8') as f:
+                existing_tweets.extend(json.load(f).get("tweets", []))
+
+        planner = ContentPlanner(diversity_state_file)
+        plan = planner.create_topup_plan(persona, target_count, existing_tweets)
+
+        print(f"\n🧮 补量分析: 已有 {len(existing_tweets)} 条 (来自 {len(existing_files)} 个文件), 目标 {target_count} 条")
+        for content_type, target in plan['targets'].items():
+            have = plan['existing'].get(content_type, 0)
+            need = plan['distribution'].get(content_type, 0)
+            mark = f"补 {need}" if need else "已满"
+            print(f"   {content_type}: {have}/{target} ({mark})")
+        for content_type in set(plan['existing']) - set(plan['targets']):
+            print(f"   {content_type}: {plan['existing'][content_type]}/0 (不在当前目标分布中)")
+
+        new_tweets: List[Dict] = []
+        if plan['total_count'] > 0:
+            plan["diversity_stats"] = planner.get_diversity_report()
+            new_result = await self.generate_pool(
+                persona=persona,
+                temperature=temperature,
+                explicit_nudity_allowed=explicit_nudity_allowed,
+                tweets_per_call=tweets_per_call,
+                output_file=output_file,
+                window=window,
+                plan=plan,
+                diversity_state_file=diversity_state_file
+            )
+            with open(new_result["output_file"], 'r', encoding='utf-8') as f:
+                new_tweets = json.load(f)["tweets"]
+        else:
+            print("✅ 各content_type均已达到目标，无需补量\n")
+
+        # 合并写出：分布为合并后的实际数量
+        final_distribution: Dict[str, int] = defaultdict(int)
+        for tweet in existing_tweets + new_tweets:
+            final_distribution[tweet.get("content_type", "")] += 1
+        merged_plan = {
+            "archetype": plan['archetype'],
+            "total_count": target_count,
+            "distribution": dict(final_distribution)
+        }
+        result = self.build_pool_result(persona, merged_plan, planner.get_diversity_report(), [])
+        del result["tweets"]
+        result["topup"] = {
+            "source_files": [str(path) for path in existing_files],
+            "existing_count": len(existing_tweets),
+            "added": len(new_tweets)
+        }
+        tweet_count = write_pool_file(result, iter(existing_tweets + new_tweets), output_file)
+        result["tweet_count"] = tweet_count
+        result["output_file"] = str(output_file)
+
+        print(f"📦 合并内容池: {len(existing_tweets)} + {len(new_tweets)} = {tweet_count} 条 -> {output_file}\n")
+        return result
+
+    async def dedup_pool(
+        self,
+        persona: Dict,
+        output_file: str,
+        index: NearDuplicateIndex,
+        history_files: List[str],
+        regenerate: bool = False,
+        temperature: float = 1.0,
+        explicit_nudity_allowed: bool = False,
+        max_rounds: int = 2,
+        diversity_state_file: Optional[str] = None
+    ) -> Dict:
+        """
+        近似重复检查：新内容池的每条推文与该人设历史内容池（及本池中排在前面的推文）
+        比较 tweet_text / scene_hint，重复的推文标记 near_duplicate；可选自动重新生成。
+
+        Args:
+            persona: 人设JSON
+            output_file: 新生成的内容池文件（原地更新）
+            index: 该人设的近似重复索引（增量同步历史文件后查询，结束时保存）
+            history_files: 该人设的历史内容池文件（不含output_file）
+            regenerate: 是否为重复的推文换一个变化组合重新生成
+            temperature: 温度参数
+            explicit_nudity_allowed: 是否允许裸露内容
+            max_rounds: 重新生成的最大轮数（每轮只重试仍然重复的推文）
+            diversity_state_file: 人设的持久化多样性状态（重新生成时避开之前运行用过的组合，
+                采用的替换推文登记进去）
+
+        Returns:
+            {"checked", "flagged", "regenerated", "hashed"} 统计
+        """
+        from core.content_planner import ContentPlanner
+
+        indexed = index.sync(history_files)
+        print(f"\n🔍 近似重复检查: 历史内容池 {len(history_files)} 个 (新索引 {indexed} 条)")
+
+        with open(output_file, 'r', encoding='utf-8') as f:
+            pool = json.load(f)
+        tweets = pool.pop("tweets")
+        file_key = Path(output_file).name
+
+        # 历史 + 本池前面的推文（本池的推文查完即加入索引）
+        flagged: Dict[int, Dict] = {}
+        for i, tweet in enumerate(tweets):
+            sigs = index.signatures_for(tweet)
+            match = index.query(sigs)
+            if match:
+                flagged[i] = match
+            else:
+                index.add(f"{file_key}#{i}", sigs)
+        flagged_count = len(flagged)
+
+        # 重新生成：换一个未用过的变化组合，重新检查，仍重复的进入下一轮
+        regenerated = 0
+        replacements = []
+        if regenerate and flagged:
+            planner = ContentPlanner(diversity_state_file)
+            for tweet in tweets:
+                if tweet.get("variations") and tweet.get("content_type"):
+                    planner.diversity_tracker.mark_used(tweet["content_type"], tweet.get("subtype", ""), tweet["variations"])
+
+            for round_no in range(1, max_rounds + 1):
+                specs = {}
+                for i in flagged:
+                    spec = self._respec(planner, tweets[i], f"dedup-{round_no}-{i:05d}")
+                    if spec is not None:
+                        specs[i] = spec
+                if not specs:
+                    break
+                print(f"   第{round_no}轮: 重新生成 {len(specs)} 条重复推文")
+
+                results = await asyncio.gather(*[
+                    self.generator.generate_from_spec(
+                        persona, spec, temperature, explicit_nudity_allowed, enforce_length=False
+                    )
+                    for spec in specs.values()
+                ], return_exceptions=True)
+                candidates = [
+                    (i, tweet) for i, tweet in zip(specs, results) if not isinstance(tweet, Exception)
+                ]
+
+                # 超长/违规的替换推文与内容池走同一批量修复，修复后的文本再做重复检查
+                texts, violations, _ = await self.generator.repair_tweets(
+                    [tweet.get("tweet_text", "") for _, tweet in candidates], persona
+                )
+                for (i, tweet), tweet_text, remaining in zip(candidates, texts, violations):
+                    self.generator.apply_repair(tweet, tweet_text, remaining)
+                    sigs = index.signatures_for(tweet)
+                    if index.query(sigs) is None:
+                        tweets[i] = tweet
+                        index.add(f"{file_key}#{i}", sigs)
+                        del flagged[i]
+                        replacements.append(tweet)
+                        regenerated += 1
+
+            if diversity_state_file and replacements:
+                ContentPlanner(diversity_state_file).record_generated(replacements)
+
+        for i, match in flagged.items():
+            tweets[i]["near_duplicate"] = match
+
+        pool["dedup"] = {"checked": len(tweets), "flagged": flagged_count, "regenerated": regenerated}
+        write_pool_file(pool, iter(tweets), output_file)
+        index.mark_indexed(output_file)
+        index.save()
+
+        print(f"   检查 {len(tweets)} 条: 重复 {flagged_count} 条, 重新生成 {regenerated} 条, "
+              f"仍标记 {len(flagged)} 条 (本次计算签名 {index.hashed} 条)\n")
+        return {**pool["dedup"], "hashed": index.hashed}
+
+    @staticmethod
+    def _respec(planner, tweet: Dict, spec_id: str) -> Optional[Dict]:
+        """由推文的类型信息重建generation_spec，并换一个未用过的变化组合（无类型信息时返回None）"""
+        content_type = tweet.get("content_type")
+        subtype = tweet.get("subtype")
+        if not content_type or not subtype:
+            return None
+        try:
+            type_config = planner.config_loader.get_content_type(content_type)
+            subtype_config = type_config['subtypes'][subtype]
+        except (KeyError, ValueError, TypeError):
+            return None
+        return {
+            "content_type": content_type,
+            "subtype": subtype,
+            "subtype_description": subtype_config['description'],
+            "variations": planner.diversity_tracker.get_unique_variation(
+                content_type=content_type,
+                subtype=subtype,
+                variations=type_config['variations']
+            ),
+            "mood": tweet.get("mood", "confident"),
+            "spec_id": spec_id
+        }
+
+    @staticmethod
+    def build_pool_result(
+        persona: Dict,
+        plan: Dict,
+        diversity_report: Dict,
+        tweets: List[Dict]
+    ) -> Dict:
+        """组装内容池输出结构（tweets_pool JSON）"""
         persona_data = persona.get("data", {})
 
         return {
@@ -954,6 +2063,6 @@ class BatchTweetGenerator:
                 "distribution": plan['distribution'],
                 "diversity_stats": diversity_report
             },
-            "tweets": successful_tweets
+            "tweets": tweets
         }
 
@@ -16,6 +16,7 @@ sys.path.insert(0, str(project_root))
 
 from loguru import logger
 from utils.llm_client import LLMClientPool
+from utils.llm_cache import LLMResponseCache
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -58,7 +59,7 @@ OUTPUT FORMAT (JSON only, no markdown):
 Generate the content_type_distribution now:"""
 
 
-async def generate_distribution_for_persona(persona_data: dict, api_key: str, api_base: str, model: str) -> dict:
+async def generate_distribution_for_persona(persona_data: dict, llm_pool: LLMClientPool) -> dict:
     """为单个人设生成content_type_distribution"""
 
     data = persona_data.get('data', {})
@@ -75,16 +76,14 @@ async def generate_distribution_for_persona(persona_data: dict, api_key: str, ap
         personality=personality[:500]
     )
 
-    # 调用LLM
-    client_pool = LLMClientPool(api_key=api_key, api_base=api_base, model=model, max_concurrent=1)
-
     try:
         messages = [
             {"role": "system", "content": "You are a content strategy expert. Output only valid JSON."},
             {"role": "user", "content": prompt}
         ]
 
-        response = await client_pool.generate(
+        # 调用LLM（经由共享的LLM池，受统一并发/限流控制）
+        response = await llm_pool.generate(
             messages=messages,
             temperature=0.7,
             max_tokens=800
@@ -136,6 +135,20 @@ async def main():
     logger.info(f"使用模型: {model}")
     logger.info(f"API Base: {api_base}")
 
+    # LLM_CACHE=1 时重跑直接回放已缓存的响应
+    llm_cache = LLMResponseCache.from_env()
+
+    # 所有人设共享同一个LLM池（并发和RPM由池统一控制）
+    llm_pool = LLMClientPool(
+        api_key=api_key,
+        api_base=api_base,
+        model=model,
+        max_concurrent=int(os.getenv('MAX_CONCURRENT', '1')),
+        rpm_limit=int(os.getenv('RPM_LIMIT', '0')) or None,
+        tpm_limit=int(os.getenv('TPM_LIMIT', '0')) or None,
+        cache=llm_cache
+    )
+
     # 加载所有人设
     personas_dir = Path('personas')
     persona_files = sorted([f for f in personas_dir.glob('*.json') if not f.name.startswith('.')])
@@ -163,7 +176,7 @@ async def main():
             continue
 
         # 生成distribution
-        distribution = await generate_distribution_for_persona(persona_data, api_key, api_base, model)
+        distribution = await generate_distribution_for_persona(persona_data, llm_pool)
 
         if distribution:
             # 保存到persona
@@ -187,6 +200,11 @@ async def main():
         # 避免API限流
         await asyncio.sleep(1)
 
+    await llm_pool.aclose()
+    if llm_cache:
+        logger.info(f"LLM缓存: {llm_cache.get_stats()}")
+        llm_cache.close()
+
     # 统计结果
     success_count = sum(1 for r in results if r['status'] == 'success')
     skip_count = sum(1 for r in results if r['status'] == 'skip')
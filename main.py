@@ -7,8 +7,12 @@ import asyncio
 import json
 import sys
 import os
+import time
+import uuid
+from collections import deque
+from functools import partial
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Awaitable, Callable, List, Dict, Optional, Tuple
 from datetime import datetime
 import logging
 from dotenv import load_dotenv
@@ -20,9 +24,14 @@ load_dotenv()
 sys.path.insert(0, str(Path(__file__).parent))
 
 from utils.llm_client import LLMClientPool
+from utils.fair_scheduler import tenant
+from utils.llm_cache import LLMResponseCache, DEFAULT_CACHE_PATH
 from utils.calendar_manager import CalendarManager
+from utils.pool_file import PoolCheckpoint
+from utils.near_dup import NearDuplicateIndex
+from utils.image_preprocess import ImagePreprocessor
 from core.tweet_generator import BatchTweetGenerator
-from core.persona_generator import PersonaGenerator  # ⭐ 新增
+from core.persona_generator import PersonaGenerator, missing_stages  # ⭐ 新增
 from tools.datetime_tool import DateTimeTool
 from tools.weather_tool import WeatherTool
 
@@ -34,6 +43,27 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def _tweet_count(tweets_batch: Dict) -> int:
+    """推文批次的推文数（内容池模式流式写盘时结果中只有 tweet_count）"""
+    if "tweet_count" in tweets_batch:
+        return tweets_batch["tweet_count"]
+    return len(tweets_batch.get("tweets", []))
+
+
+def _parse_named_values(values: List[str], cast: Callable, flag: str, parser) -> Dict:
+    """解析 NAME=VALUE 列表（VALUE需大于0），如 --persona-weight / --bulk-targets"""
+    parsed = {}
+    for value in values:
+        name, sep, raw = value.partition("=")
+        try:
+            parsed[name] = cast(raw)
+        except ValueError:
+            sep = ""
+        if not sep or not name or parsed[name] <= 0:
+            parser.error(f"{flag} 格式应为 NAME=VALUE（VALUE>0）: {value}")
+    return parsed
+
+
 class HighConcurrencyCoordinator:
     """高并发协调器"""
 
@@ -44,21 +74,64 @@ class HighConcurrencyCoordinator:
         model: str = "gpt-4",
         max_concurrent: int = 20,
         output_dir: str = "output_standalone",
-        weather_api_key: str = None
+        weather_api_key: str = None,
+        rpm_limit: Optional[int] = None,
+        tpm_limit: Optional[int] = None,
+        adaptive_concurrency: bool = False,
+        min_concurrent: int = 1,
+        llm_endpoints: Optional[str] = None,
+        stream: bool = False,
+        hedge: bool = False,
+        hedge_budget: float = 0.05,
+        llm_cache_path: Optional[str] = None,
+        llm_cache_ttl: Optional[float] = None,
+        llm_cache_max_mb: int = 512,
+        plan_strategy: str = "random",
+        persona_image_max_side: int = 1536,
+        persona_image_format: str = "jpeg"
     ):
-        # 创建LLM客户端池
+        # 本地LLM响应缓存（llm_cache_path为None时不启用）
+        self.llm_cache = None
+        if llm_cache_path:
+            self.llm_cache = LLMResponseCache(
+                path=llm_cache_path,
+                max_bytes=llm_cache_max_mb * 1024 * 1024,
+                ttl=llm_cache_ttl
+            )
+
+        # 创建LLM客户端池（全局并发调度器，所有LLM调用都经过它）
         self.llm_pool = LLMClientPool(
             api_key=api_key,
             api_base=api_base,
             model=model,
-            max_concurrent=max_concurrent
+            max_concurrent=max_concurrent,
+            rpm_limit=rpm_limit,
+            tpm_limit=tpm_limit,
+            adaptive_concurrency=adaptive_concurrency,
+            min_concurrent=min_concurrent,
+            endpoints=llm_endpoints,
+            hedge=hedge,
+            hedge_budget=hedge_budget,
+            cache=self.llm_cache
         )
 
         # 创建生成器
-        self.tweet_generator = BatchTweetGenerator(self.llm_pool)
+        self.tweet_generator = BatchTweetGenerator(self.llm_pool, stream=stream, plan_strategy=plan_strategy)
 
         # ⭐ 创建PersonaGenerator（完全保留ComfyUI精调逻辑）
-        self.persona_generator = PersonaGenerator(self.llm_pool.client)
+        # 人设图片缩放/编码后按内容哈希缓存；阶段检查点按图片内容哈希保存，
+        # 同一图片重跑时从第一个缺失或失败的阶段继续
+        self.image_preprocessor = ImagePreprocessor(
+            max_side=persona_image_max_side,
+            image_format=persona_image_format,
+            cache_dir=str(Path(output_dir) / ".image_cache")
+        )
+        self.persona_generator = PersonaGenerator(
+            self.llm_pool,
+            checkpoint_dir=str(Path(output_dir) / ".persona_stages"),
+            image_preprocessor=self.image_preprocessor
+        )
+        self.persona_stage_reports: Dict[str, Dict] = {}  # 图片路径 -> 最近一次生成的阶段报告
 
         # ⭐ 创建Calendar Manager（完全保留ComfyUI精调逻辑）
         self.calendar_manager = CalendarManager()
@@ -74,14 +147,41 @@ class HighConcurrencyCoordinator:
         # 输出目录
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.checkpoint_dir = self.output_dir / ".checkpoints"
+        self.dedup_dir = self.output_dir / ".dedup"
+        self.diversity_dir = self.output_dir / ".diversity"
 
         logger.info(f"协调器初始化完成")
         logger.info(f"  API: {api_base}")
         logger.info(f"  Model: {model}")
         logger.info(f"  最大并发: {max_concurrent}")
+        if len(self.llm_pool.endpoints) > 1:
+            logger.info(f"  多端点路由: {len(self.llm_pool.endpoints)} 个后端")
+        if adaptive_concurrency:
+            logger.info(f"  自适应并发: 已启用 (范围 {min_concurrent}~{max_concurrent})")
+        if stream:
+            logger.info(f"  流式生成: 已启用 (SCENE完成即终止)")
+        if plan_strategy != "random":
+            logger.info(f"  规划策略: {plan_strategy}")
+        if hedge:
+            logger.info(f"  对冲请求: 已启用 (预算 {hedge_budget:.0%})")
+        if self.llm_cache:
+            logger.info(f"  LLM缓存: {llm_cache_path}")
+        if rpm_limit or tpm_limit:
+            logger.info(f"  限流: RPM={rpm_limit or '不限'}, TPM={tpm_limit or '不限'}")
         if weather_api_key:
             logger.info(f"  天气API: 已启用")
 
+    async def aclose(self) -> None:
+        """释放LLM连接池（长连接会话）、响应缓存和图片预处理线程池"""
+        await self.llm_pool.aclose()
+        self.persona_generator.close()
+        self.image_preprocessor.close()
+        if self.llm_cache:
+            stats = self.llm_cache.get_stats()
+            logger.info(f"LLM缓存: 命中 {stats['hits']} / 未命中 {stats['misses']} ({stats['hit_rate']:.0%})")
+            self.llm_cache.close()
+
     async def load_persona(self, persona_file: str) -> Dict:
         """加载人设文件"""
         with open(persona_file, 'r', encoding='utf-8') as f:
@@ -232,16 +332,13 @@ Must output valid JSON format:
             persona, year_month, days_to_generate
         )
 
-        # 调用LLM
-        from utils.llm_client import AsyncLLMClient
-        llm = AsyncLLMClient(self.api_key, self.api_base, self.model)
-
+        # 调用LLM（经由共享的LLM池，受统一并发/限流控制）
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ]
 
-        response = await llm.generate(messages, temperature=0.7, max_tokens=10000)
+        response = await self.llm_pool.generate(messages, temperature=0.7, max_tokens=10000)
 
         # 解析并保存
         calendar_data = self.calendar_manager.parse_calendar_response(
@@ -297,7 +394,8 @@ Must output valid JSON format:
         location: str = "",
         business_goal: str = "",
         custom_instructions: str = "",
-        temperature: float = 0.85
+        temperature: Optional[float] = None,
+        refresh_stages: bool = False
     ) -> Dict:
         """
         从图片生成完整人设（完全保留ComfyUI精调逻辑）
@@ -310,7 +408,8 @@ Must output valid JSON format:
             location: 地理位置（留空自动生成）
             business_goal: 业务目标
             custom_instructions: 自定义控制词
-            temperature: 温度参数
+            temperature: Stage 1/2 的温度（None则使用 PersonaGenerationConfig 的各阶段配置）
+            refresh_stages: 忽略阶段检查点，所有阶段重新生成（默认同一图片和参数复用已保存的阶段输出）
         """
         logger.info(f"\n{'='*70}")
         logger.info(f"🎨 从图片生成人设: {Path(image_path).name}")
@@ -319,15 +418,27 @@ Must output valid JSON format:
         start_time = datetime.now()
 
         # 调用PersonaGenerator（完全保留ComfyUI的多阶段流程）
-        persona = await self.persona_generator.generate_from_image(
-            image_path=image_path,
-            nsfw_level=nsfw_level,
-            language=language,
-            location=location,
-            business_goal=business_goal,
-            custom_instructions=custom_instructions,
-            temperature=temperature
-        )
+        generator = self._new_persona_generator()
+        try:
+            persona = await generator.generate_from_image(
+                image_path=image_path,
+                nsfw_level=nsfw_level,
+                language=language,
+                location=location,
+                business_goal=business_goal,
+                custom_instructions=custom_instructions,
+                temperature=temperature,
+                refresh=refresh_stages
+            )
+        finally:
+            self.persona_stage_reports[image_path] = generator.last_stage_report
+
+        report = generator.last_stage_report
+        if report and all(entry["status"] == "cached" for entry in report.values()):
+            logger.warning(
+                f"♻️  {Path(image_path).name}: 所有阶段都来自检查点（未调用LLM），"
+                f"与上次生成的人设相同；需要新的变体请加 --refresh-stages"
+            )
 
         # ⭐ 自动添加LoRA配置（基于文件名规则）
         self._add_lora_config(persona, image_path)
@@ -349,6 +460,43 @@ Must output valid JSON format:
 
         return persona
 
+    def _diversity_state_file(self, persona_name: str) -> str:
+        """人设的持久化多样性状态文件（跨运行记录已生成过的变化组合）"""
+        return str(self.diversity_dir / f"{persona_name}.json")
+
+    def _ensure_content_strategy(self, persona: Dict, persona_file: str) -> None:
+        """确保persona有content_strategy（缺失时从描述推断archetype并写回文件）"""
+        persona_data = persona.get('data', {})
+        extensions = persona_data.get('extensions', {})
+
+        if 'content_strategy' not in extensions:
+            logger.info(f"  ⚠️  persona缺少content_strategy，自动添加...")
+            # 从描述推断archetype
+            description = persona_data.get('description', '').lower()
+            personality = persona_data.get('personality', '').lower()
+
+            if 'fitness' in description or 'gym' in description:
+                archetype = "Gym Girl"
+            elif 'gamer' in description or 'e-girl' in description:
+                archetype = "E-girl"
+            elif 'baddie' in personality or 'assertive' in personality:
+                archetype = "Baddie"
+            else:
+                archetype = "ABG"  # 默认
+
+            if 'extensions' not in persona['data']:
+                persona['data']['extensions'] = {}
+
+            persona['data']['extensions']['content_strategy'] = {
+                "archetype": archetype
+            }
+
+            # 保存回文件
+            with open(persona_file, 'w', encoding='utf-8') as f:
+                json.dump(persona, f, ensure_ascii=False, indent=2)
+
+            logger.info(f"  ✓ 添加了 content_strategy (archetype: {archetype})\n")
+
     async def generate_tweets_for_persona(
         self,
         persona_file: str,
@@ -357,7 +505,11 @@ Must output valid JSON format:
         temperature: float = 1.0,
         auto_generate_calendar: bool = False,
         enable_context: bool = False,
-        use_content_pool: bool = False
+        use_content_pool: bool = False,
+        tweets_per_call: int = 1,
+        run_id: Optional[str] = None,
+        dedup: bool = False,
+        dedup_regenerate: bool = False
     ) -> Dict:
         """
         为单个人设生成推文
@@ -370,6 +522,10 @@ Must output valid JSON format:
             auto_generate_calendar: 是否自动生成calendar
             enable_context: 是否启用上下文
             use_content_pool: 是否使用内容池模式（按类别生成）
+            tweets_per_call: 内容池模式下每次LLM调用生成的推文数
+            run_id: 内容池模式的运行ID（默认随机生成；中断后用 resume_pool_run 恢复）
+            dedup: 内容池模式下生成后与该人设的历史内容池做近似重复检查
+            dedup_regenerate: 近似重复的推文自动重新生成（隐含dedup）
         """
         logger.info(f"\n{'='*70}")
         logger.info(f"📝 生成推文: {Path(persona_file).stem}")
@@ -379,52 +535,42 @@ Must output valid JSON format:
 
         # 加载数据
         persona = await self.load_persona(persona_file)
+        persona_name = persona["data"]["name"]
+        output_file = self.output_dir / f"{persona_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
 
         # ⭐ 内容池模式（按类别生成）
         if use_content_pool:
             logger.info(f"  🎯 使用内容池模式（按类别生成）")
             logger.info(f"  📊 目标推文数: {tweets_count}\n")
 
-            # 确保persona有content_strategy
             persona_data = persona.get('data', {})
-            extensions = persona_data.get('extensions', {})
-
-            if 'content_strategy' not in extensions:
-                logger.info(f"  ⚠️  persona缺少content_strategy，自动添加...")
-                # 从描述推断archetype
-                description = persona_data.get('description', '').lower()
-                personality = persona_data.get('personality', '').lower()
-
-                if 'fitness' in description or 'gym' in description:
-                    archetype = "Gym Girl"
-                elif 'gamer' in description or 'e-girl' in description:
-                    archetype = "E-girl"
-                elif 'baddie' in personality or 'assertive' in personality:
-                    archetype = "Baddie"
-                else:
-                    archetype = "ABG"  # 默认
-
-                if 'extensions' not in persona['data']:
-                    persona['data']['extensions'] = {}
+            self._ensure_content_strategy(persona, persona_file)
 
-                persona['data']['extensions']['content_strategy'] = {
-                    "archetype": archetype
-                }
-
-                # 保存回文件
-                with open(persona_file, 'w', encoding='utf-8') as f:
-                    json.dump(persona, f, ensure_ascii=False, indent=2)
-
-                logger.info(f"  ✓ 添加了 content_strategy (archetype: {archetype})\n")
+            # 检查点：保存计划，已完成的推文在sidecar中，中断后可 --resume 继续
+            run_id = run_id or uuid.uuid4().hex[:8]
+            checkpoint = PoolCheckpoint(
+                str(self.checkpoint_dir), run_id,
+                meta={"persona_file": str(persona_file)}
+            )
+            logger.info(f"  🔖 运行ID: {run_id}（中断后可用 --resume {run_id} 继续）\n")
 
             # 使用generate_pool方法
             tweets_batch = await self.tweet_generator.generate_pool(
                 persona=persona,
                 count=tweets_count,
                 temperature=temperature,
-                explicit_nudity_allowed=(persona_data.get('nsfw_level') == 'enabled')
+                explicit_nudity_allowed=(persona_data.get('nsfw_level') == 'enabled'),
+                tweets_per_call=tweets_per_call,
+                output_file=str(output_file),  # 边生成边写入sidecar，结束后组装
+                checkpoint=checkpoint,
+                diversity_state_file=self._diversity_state_file(persona_name)
             )
 
+            if dedup or dedup_regenerate:
+                await self.dedup_pool_output(
+                    persona, str(output_file), dedup_regenerate, temperature
+                )
+
             # 显示内容分布
             logger.info(f"\n  📊 内容分布:")
             for content_type, count in tweets_batch['content_plan']['distribution'].items():
@@ -465,69 +611,531 @@ Must output valid JSON format:
                 context=context
             )
 
-        # 保存结果
-        persona_name = persona["data"]["name"]
-        output_file = self.output_dir / f"{persona_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(tweets_batch, f, ensure_ascii=False, indent=2)
+            # 保存结果（内容池模式已由generate_pool写出）
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(tweets_batch, f, ensure_ascii=False, indent=2)
 
         duration = (datetime.now() - start_time).total_seconds()
 
         logger.info(f"\n✅ 推文生成完成")
         logger.info(f"   人设: {persona_name}")
-        logger.info(f"   推文数: {len(tweets_batch['tweets'])}")
+        logger.info(f"   推文数: {_tweet_count(tweets_batch)}")
         logger.info(f"   耗时: {duration:.1f}秒")
         logger.info(f"   保存至: {output_file}\n")
 
         return tweets_batch
 
+    async def dedup_pool_output(
+        self,
+        persona: Dict,
+        output_file: str,
+        regenerate: bool = False,
+        temperature: float = 1.0
+    ) -> Dict:
+        """
+        新内容池与该人设的历史内容池（输出目录中的 {人设名}_*.json）做近似重复检查，
+        索引保存在 <output_dir>/.dedup/{人设名}.json，增量运行只计算新文件的签名；
+        重新生成时使用并更新该人设的多样性状态
+
+        Args:
+            persona: 人设JSON
+            output_file: 新生成的内容池文件
+            regenerate: 是否自动重新生成重复的推文
+            temperature: 重新生成时的温度参数
+        """
+        persona_name = persona["data"]["name"]
+        history_files = sorted(
+            str(path) for path in self.output_dir.glob(f"{persona_name}_*.json")
+            if path.resolve() != Path(output_file).resolve()
+        )
+        index = NearDuplicateIndex(str(self.dedup_dir / f"{persona_name}.json"))
+
+        return await self.tweet_generator.dedup_pool(
+            persona=persona,
+            output_file=output_file,
+            index=index,
+            history_files=history_files,
+            regenerate=regenerate,
+            temperature=temperature,
+            explicit_nudity_allowed=(persona.get('data', {}).get('nsfw_level') == 'enabled'),
+            diversity_state_file=self._diversity_state_file(persona_name)
+        )
+
+    async def resume_pool_run(self, run_id: str) -> Dict:
+        """
+        从检查点恢复中断的内容池运行：沿用原计划和输出文件，只生成缺失的spec
+
+        Args:
+            run_id: generate_tweets_for_persona 打印的运行ID
+        """
+        checkpoint = PoolCheckpoint(str(self.checkpoint_dir), run_id)
+        if not checkpoint.exists():
+            raise FileNotFoundError(f"找不到运行检查点: {checkpoint.path}")
+
+        state = checkpoint.load()
+        if state.get("status") == "completed":
+            logger.info(f"✅ 运行 {run_id} 已完成: {state['output_file']}")
+            return state
+
+        logger.info(f"\n{'='*70}")
+        logger.info(f"♻️  恢复运行: {run_id} ({Path(state['persona_file']).stem})")
+        logger.info(f"{'='*70}\n")
+
+        start_time = datetime.now()
+        checkpoint.meta = {"persona_file": state["persona_file"]}
+        persona = await self.load_persona(state["persona_file"])
+
+        tweets_batch = await self.tweet_generator.generate_pool(
+            persona=persona,
+            temperature=state["temperature"],
+            explicit_nudity_allowed=state["explicit_nudity_allowed"],
+            tweets_per_call=state["tweets_per_call"],
+            checkpoint=checkpoint,
+            diversity_state_file=self._diversity_state_file(persona["data"]["name"])
+        )
+
+        duration = (datetime.now() - start_time).total_seconds()
+        logger.info(f"\n✅ 恢复完成")
+        logger.info(f"   推文数: {_tweet_count(tweets_batch)}")
+        logger.info(f"   耗时: {duration:.1f}秒")
+        logger.info(f"   保存至: {tweets_batch['output_file']}\n")
+        return tweets_batch
+
+    async def topup_pool_for_persona(
+        self,
+        persona_file: str,
+        existing_files: List[str],
+        target_count: int,
+        temperature: float = 1.0,
+        tweets_per_call: int = 1
+    ) -> Dict:
+        """
+        为已有内容池按分布补量到目标数量（只生成不足的content_type/subtype/mood）
+
+        Args:
+            persona_file: 人设文件路径
+            existing_files: 已有的内容池文件
+            target_count: 补量后的目标总数
+            temperature: 温度参数
+            tweets_per_call: 每次LLM调用生成的推文数
+        """
+        logger.info(f"\n{'='*70}")
+        logger.info(f"🧮 按分布补量: {Path(persona_file).stem} -> {target_count} 条")
+        logger.info(f"{'='*70}\n")
+
+        start_time = datetime.now()
+        persona = await self.load_persona(persona_file)
+        self._ensure_content_strategy(persona, persona_file)
+        persona_name = persona["data"]["name"]
+        output_file = self.output_dir / f"{persona_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+
+        tweets_batch = await self.tweet_generator.topup_pool(
+            persona=persona,
+            existing_files=existing_files,
+            target_count=target_count,
+            output_file=str(output_file),
+            temperature=temperature,
+            explicit_nudity_allowed=(persona.get('data', {}).get('nsfw_level') == 'enabled'),
+            tweets_per_call=tweets_per_call,
+            diversity_state_file=self._diversity_state_file(persona_name)
+        )
+
+        duration = (datetime.now() - start_time).total_seconds()
+        logger.info(f"\n✅ 补量完成")
+        logger.info(f"   新增: {tweets_batch['topup']['added']} 条")
+        logger.info(f"   推文数: {_tweet_count(tweets_batch)}")
+        logger.info(f"   耗时: {duration:.1f}秒")
+        logger.info(f"   保存至: {output_file}\n")
+        return tweets_batch
+
+    async def _run_persona_jobs(
+        self,
+        jobs: Dict[str, Callable[[], Awaitable[Optional[Dict]]]],
+        weights: Optional[Dict[str, float]] = None
+    ) -> Dict[str, Dict]:
+        """
+        在同一事件循环中并发运行多个人设的任务（共用LLM池，按人设公平调度）
+
+        每个人设是一个调度租户，LLM请求按DRR轮流放行，大批量人设不会把小任务饿死。
+
+        Args:
+            jobs: {人设文件名: 返回推文批次的协程函数（返回None表示跳过）}
+            weights: {人设文件名: 权重}，未配置的人设权重为1
+
+        Returns:
+            {人设文件名: {"result", "tweets", "seconds", "tweets_per_second", "error"?}}
+        """
+        scheduler = self.llm_pool.enable_fair_share(weights)
+
+        async def run_job(name: str, job: Callable[[], Awaitable[Optional[Dict]]]) -> Dict:
+            # 该人设任务（及其子任务）发出的LLM请求都计入这个租户
+            with tenant(name):
+                job_start = datetime.now()
+                result = await job()
+                return {"result": result, "seconds": (datetime.now() - job_start).total_seconds()}
+
+        outcomes = await asyncio.gather(
+            *[run_job(name, job) for name, job in jobs.items()],
+            return_exceptions=True
+        )
+
+        tenant_stats = scheduler.get_stats()
+        report = {}
+        for name, outcome in zip(jobs, outcomes):
+            stats = tenant_stats.get(name, {})
+            item = {
+                "result": None, "tweets": 0, "seconds": 0.0, "tweets_per_second": 0.0,
+                "weight": stats.get("weight", 1.0),
+                "llm_requests": stats.get("requests", 0),
+                "avg_wait_seconds": stats.get("avg_wait_seconds", 0.0)
+            }
+            if isinstance(outcome, Exception):
+                report[name] = {**item, "error": str(outcome)}
+                continue
+            result = outcome["result"]
+            # 补量结果只计新生成的推文
+            count = 0
+            if result:
+                count = result["topup"]["added"] if "topup" in result else _tweet_count(result)
+            seconds = outcome["seconds"]
+            report[name] = {
+                **item,
+                "result": result,
+                "tweets": count,
+                "seconds": round(seconds, 1),
+                "tweets_per_second": round(count / seconds, 2) if seconds else 0.0
+            }
+        return report
+
+    @staticmethod
+    def _log_persona_throughput(report: Dict[str, Dict]) -> None:
+        """输出各人设的吞吐与调度统计"""
+        logger.info(f"   各人设吞吐:")
+        for name, item in report.items():
+            if "error" in item:
+                logger.info(f"     ❌ {name}: {item['error']}")
+                continue
+            logger.info(
+                f"     {name}: {item['tweets']} 条 / {item['seconds']}秒 "
+                f"({item['tweets_per_second']} 条/秒, 权重 {item['weight']}, "
+                f"LLM请求 {item['llm_requests']}, 平均排队 {item['avg_wait_seconds']}秒)"
+            )
+
     async def generate_batch_tweets(
         self,
         persona_files: List[str],
-        calendar_files: List[str],
+        calendar_files: Optional[List[str]] = None,
         tweets_per_persona: int = 5,
-        temperature: float = 1.0
-    ):
-        """批量生成推文（高并发）"""
+        temperature: float = 1.0,
+        use_content_pool: Optional[bool] = None,
+        tweets_per_call: int = 1,
+        weights: Optional[Dict[str, float]] = None
+    ) -> Dict:
+        """
+        批量生成推文（多个人设共用LLM池，按权重公平调度）
+
+        Args:
+            persona_files: 人设文件列表
+            calendar_files: 日历文件列表（calendar模式，与persona_files一一对应）
+            tweets_per_persona: 每个人设的推文数
+            temperature: 温度参数
+            use_content_pool: 是否使用内容池模式（None则没有日历文件时使用内容池模式）
+            tweets_per_call: 内容池模式下每次LLM调用生成的推文数
+            weights: {人设文件名: 权重}，未配置的人设权重为1
+
+        Returns:
+            {人设文件名: {"result", "tweets", "seconds", "tweets_per_second", "error"?}}
+        """
+        if calendar_files and len(calendar_files) != len(persona_files):
+            raise ValueError(
+                f"日历文件数量({len(calendar_files)})需要与人设文件数量({len(persona_files)})一致"
+            )
+        if use_content_pool is None:
+            use_content_pool = not calendar_files
+
         logger.info(f"\n{'='*70}")
-        logger.info(f"🚀 批量生成推文: {len(persona_files)} 个人设")
+        logger.info(f"🚀 批量生成推文: {len(persona_files)} 个人设（公平调度）")
         logger.info(f"{'='*70}\n")
 
         start_time = datetime.now()
-
-        # 创建任务
-        tasks = []
-        for persona_file, calendar_file in zip(persona_files, calendar_files):
-            task = self.generate_tweets_for_persona(
+        calendar_files = calendar_files or [None] * len(persona_files)
+        jobs = {
+            Path(persona_file).stem: partial(
+                self.generate_tweets_for_persona,
                 persona_file=persona_file,
                 calendar_file=calendar_file,
                 tweets_count=tweets_per_persona,
-                temperature=temperature
+                temperature=temperature,
+                use_content_pool=use_content_pool,
+                tweets_per_call=tweets_per_call
             )
-            tasks.append(task)
-
-        # 并发执行
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        # 统计
-        successful = [r for r in results if not isinstance(r, Exception)]
-        failed = [r for r in results if isinstance(r, Exception)]
+            for persona_file, calendar_file in zip(persona_files, calendar_files)
+        }
 
+        report = await self._run_persona_jobs(jobs, weights)
+        failed = [name for name, item in report.items() if "error" in item]
         duration = (datetime.now() - start_time).total_seconds()
-        total_tweets = sum(len(r["tweets"]) for r in successful)
 
         logger.info(f"\n{'='*70}")
         logger.info(f"✅ 批量生成完成")
         logger.info(f"{'='*70}")
+        self._log_persona_throughput(report)
         logger.info(f"   人设数: {len(persona_files)}")
-        logger.info(f"   成功: {len(successful)}")
+        logger.info(f"   成功: {len(persona_files) - len(failed)}")
         logger.info(f"   失败: {len(failed)}")
-        logger.info(f"   总推文数: {total_tweets}")
+        logger.info(f"   总推文数: {sum(item['tweets'] for item in report.values())}")
         logger.info(f"   总耗时: {duration:.1f}秒")
-        logger.info(f"   平均: {duration/len(persona_files):.1f}秒/人设")
         logger.info(f"{'='*70}\n")
 
+        return report
+
+    def _current_pools(self, persona_name: str) -> Tuple[List[str], int]:
+        """
+        人设在输出目录中的当前内容池（已被补量合并进新文件的源文件不再计入）
+
+        Returns:
+            (内容池文件列表, 推文总数)
+        """
+        pools = {}
+        superseded = set()
+        for path in sorted(self.output_dir.glob(f"{persona_name}_*.json")):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            pools[path.name] = (str(path), len(data.get("tweets", [])))
+            for source in data.get("topup", {}).get("source_files", []):
+                superseded.add(Path(source).name)
+
+        current = [item for name, item in pools.items() if name not in superseded]
+        return [path for path, _ in current], sum(count for _, count in current)
+
+    async def generate_bulk(
+        self,
+        persona_files: List[str],
+        default_target: int,
+        targets: Optional[Dict[str, int]] = None,
+        temperature: float = 1.0,
+        tweets_per_call: int = 1,
+        topup: bool = False,
+        weights: Optional[Dict[str, float]] = None
+    ) -> Dict:
+        """
+        多人设批量生产内容池（同一进程、同一事件循环、共用一个LLM池和限流器）
+
+        每个人设输出各自的内容池文件，全部结束后写出汇总报告 bulk_summary_{时间}.json。
+
+        Args:
+            persona_files: 人设文件列表
+            default_target: 每个人设的默认目标推文数
+            targets: {人设文件名: 目标推文数}，覆盖默认目标
+            temperature: 温度参数
+            tweets_per_call: 每次LLM调用生成的推文数
+            topup: 已有内容池时按分布补量到目标数（已达标的人设跳过）；否则每个人设新生成目标数
+            weights: {人设文件名: 调度权重}
+
+        Returns:
+            汇总报告
+        """
+        targets = targets or {}
+        logger.info(f"\n{'='*70}")
+        logger.info(f"🏭 批量生产内容池: {len(persona_files)} 个人设{'（按分布补量）' if topup else ''}")
+        logger.info(f"{'='*70}\n")
+
+        start_time = datetime.now()
+        plans = {}
+        jobs = {}
+        for persona_file in persona_files:
+            name = Path(persona_file).stem
+            target = targets.get(name, default_target)
+            plans[name] = {"persona_file": str(persona_file), "target": target, "existing": 0}
+
+            if topup:
+                persona = await self.load_persona(persona_file)
+                existing_files, existing_count = self._current_pools(persona["data"]["name"])
+                plans[name]["existing"] = existing_count
+                if existing_count >= target:
+                    logger.info(f"  ✓ {name}: 已有 {existing_count} 条，达到目标 {target}，跳过")
+                    continue
+                if existing_files:
+                    logger.info(f"  🧮 {name}: {existing_count} -> {target} 条（{len(existing_files)} 个已有内容池）")
+                    jobs[name] = partial(
+                        self.topup_pool_for_persona,
+                        persona_file=persona_file,
+                        existing_files=existing_files,
+                        target_count=target,
+                        temperature=temperature,
+                        tweets_per_call=tweets_per_call
+                    )
+                    continue
+
+            logger.info(f"  📝 {name}: 生成 {target} 条")
+            jobs[name] = partial(
+                self.generate_tweets_for_persona,
+                persona_file=persona_file,
+                tweets_count=target,
+                temperature=temperature,
+                use_content_pool=True,
+                tweets_per_call=tweets_per_call
+            )
+
+        report = await self._run_persona_jobs(jobs, weights) if jobs else {}
+        duration = (datetime.now() - start_time).total_seconds()
+
+        personas = {}
+        for name, plan in plans.items():
+            item = report.get(name)
+            if item is None:
+                personas[name] = {**plan, "status": "skipped", "added": 0, "total": plan["existing"]}
+                continue
+            entry = {**plan, "seconds": item["seconds"], "tweets_per_second": item["tweets_per_second"]}
+            if "error" in item:
+                personas[name] = {**entry, "status": "failed", "added": 0, "total": plan["existing"], "error": item["error"]}
+                continue
+            personas[name] = {
+                **entry,
+                "status": "success",
+                "added": item["tweets"],
+                "total": _tweet_count(item["result"]),
+                "output_file": item["result"].get("output_file")
+            }
+
+        summary = {
+            "created_at": datetime.now().isoformat(),
+            "mode": "topup" if topup else "generate",
+            "persona_count": len(plans),
+            "succeeded": sum(1 for p in personas.values() if p["status"] == "success"),
+            "skipped": sum(1 for p in personas.values() if p["status"] == "skipped"),
+            "failed": sum(1 for p in personas.values() if p["status"] == "failed"),
+            "tweets_added": sum(p["added"] for p in personas.values()),
+            "seconds": round(duration, 1),
+            "llm_stats": self.llm_pool.get_stats(),
+            "personas": personas
+        }
+        summary_file = self.output_dir / f"bulk_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(summary_file, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+        logger.info(f"\n{'='*70}")
+        logger.info(f"✅ 批量生产完成")
+        logger.info(f"{'='*70}")
+        if report:
+            self._log_persona_throughput(report)
+        logger.info(f"   人设数: {summary['persona_count']}")
+        logger.info(f"   成功: {summary['succeeded']}  跳过: {summary['skipped']}  失败: {summary['failed']}")
+        logger.info(f"   新增推文: {summary['tweets_added']}")
+        logger.info(f"   总耗时: {duration:.1f}秒")
+        logger.info(f"   汇总报告: {summary_file}")
+        logger.info(f"{'='*70}\n")
+
+        return summary
+
+    async def render_offline_batch(
+        self,
+        persona_files: List[str],
+        batch_file: str,
+        tweets_per_persona: int = 1000,
+        temperature: float = 1.0
+    ) -> Dict:
+        """
+        离线批量模式：把所有人设的内容计划渲染成 OpenAI Batch 格式的请求JSONL（不调用LLM）
+
+        Args:
+            persona_files: 人设文件列表
+            batch_file: 输出的批量请求JSONL路径（同目录写出 .manifest.json）
+            tweets_per_persona: 每个人设的推文数
+            temperature: 温度参数
+        """
+        from core.batch_submission import render_batch_file, manifest_path_for
+
+        logger.info(f"\n{'='*70}")
+        logger.info(f"📦 渲染离线批量请求: {len(persona_files)} 个人设 × {tweets_per_persona} 条")
+        logger.info(f"{'='*70}\n")
+
+        personas = []
+        for persona_file in persona_files:
+            persona = await self.load_persona(persona_file)
+            self._ensure_content_strategy(persona, persona_file)
+            personas.append((persona_file, persona, tweets_per_persona))
+
+        manifest = render_batch_file(
+            self.tweet_generator.generator,
+            personas,
+            batch_file,
+            model=self.llm_pool.endpoints[0]["model"],
+            temperature=temperature,
+            plan_strategy=self.tweet_generator.plan_strategy
+        )
+
+        logger.info(f"\n✅ 批量请求文件: {batch_file}")
+        logger.info(f"   Manifest: {manifest_path_for(batch_file)}")
+        logger.info(f"   导入结果: python main.py --batch-ingest <results.jsonl> --batch-manifest {manifest_path_for(batch_file)}\n")
+        return manifest
+
+    async def ingest_offline_batch(self, results_file: str, manifest_file: str) -> List[Path]:
+        """
+        导入离线批量结果：解析、检查长度（超长的改写）、按人设写出内容池文件
+
+        Args:
+            results_file: 批量结果JSONL
+            manifest_file: render_offline_batch 写出的manifest
+        """
+        from core.batch_submission import ingest_batch_results
+
+        logger.info(f"\n{'='*70}")
+        logger.info(f"📥 导入离线批量结果: {results_file}")
+        logger.info(f"{'='*70}\n")
+
+        written = await ingest_batch_results(
+            self.tweet_generator.generator,
+            manifest_file,
+            results_file,
+            str(self.output_dir)
+        )
+
+        logger.info(f"\n✅ 导入完成: {len(written)} 个内容池文件 -> {self.output_dir}\n")
+        return written
+
+    def _new_persona_generator(self) -> PersonaGenerator:
+        """与 self.persona_generator 共享配置、检查点和图片缓存的新实例（last_stage_report 不会被并发的其他人设覆盖）"""
+        base = self.persona_generator
+        return PersonaGenerator(
+            self.llm_pool,
+            config=base.config,
+            stage_retries=base.stage_retries,
+            checkpoint_dir=str(base.checkpoint_dir) if base.checkpoint_dir else None,
+            image_preprocessor=base.images
+        )
+
+    def _persona_window(self, window: Optional[int]) -> int:
+        """同时生成的人设数（None/0 按LLM并发自动：每个人设在 Stage 1 之后最多同时发出5个请求）"""
+        if window:
+            return max(1, window)
+        return max(1, self.llm_pool.max_concurrent // 5)
+
+    @staticmethod
+    def _order_persona_images(
+        image_files: List[str],
+        order: str = "smallest",
+        priorities: Optional[Dict[str, float]] = None
+    ) -> List[str]:
+        """
+        人设图片的生成顺序
+
+        Args:
+            image_files: 图片文件列表
+            order: "smallest" 小图片优先（更快完成、更早出结果）；"given" 保持输入顺序
+            priorities: {图片文件名（不含扩展名）: 优先级}，数值大的先生成，未指定为0
+        """
+        if order not in ("smallest", "given"):
+            raise ValueError(f"未知的人设生成顺序: {order}")
+        priorities = priorities or {}
+
+        def sort_key(indexed: Tuple[int, str]) -> Tuple:
+            index, image_path = indexed
+            size = os.path.getsize(image_path) if order == "smallest" and os.path.exists(image_path) else 0
+            return (-priorities.get(Path(image_path).stem, 0), size, index)
+
+        return [image_path for _, image_path in sorted(enumerate(image_files), key=sort_key)]
+
     async def generate_batch_personas(
         self,
         image_files: List[str],
@@ -537,68 +1145,120 @@ Must output valid JSON format:
         location: str = "",
         business_goal: str = "",
         custom_instructions: str = "",
-        temperature: float = 0.85
-    ):
+        temperature: Optional[float] = None,
+        window: Optional[int] = None,
+        order: str = "smallest",
+        priorities: Optional[Dict[str, float]] = None,
+        on_progress: Optional[Callable[[Dict], None]] = None,
+        refresh_stages: bool = False
+    ) -> Dict:
         """
-        ⚡ 批量人设生成（并发模式）
+        ⚡ 批量人设生成（有界并发 + 优先级）
+
+        最多 window 个人设同时生成（每个人设内部还会并发 Stage 2-7），按优先级顺序开始；
+        每个人设完成即写入 output_dir，并追加一行到进度报告 persona_batch_{时间戳}.jsonl
 
         Args:
             image_files: 图片文件列表
             output_dir: 输出目录
+            window: 同时生成的人设数（None/0 按LLM并发自动）
+            order: "smallest" 小图片优先；"given" 保持输入顺序
+            priorities: {图片文件名（不含扩展名）: 优先级}，数值大的先生成
+            on_progress: 每个人设完成后的回调，参数为该图片的进度记录
+            refresh_stages: 忽略阶段检查点，所有阶段重新生成
             其他参数同 generate_persona_from_image
+
+        Returns:
+            {"report_file", "success", "failed", "elapsed_seconds", "images": [进度记录]}
         """
+        window = self._persona_window(window)
+        queue = deque(self._order_persona_images(image_files, order, priorities))
+        total = len(queue)
+
         logger.info(f"\n{'='*70}")
-        logger.info(f"⚡ 批量人设生成模式（并发）")
-        logger.info(f"   图片数量: {len(image_files)}")
+        logger.info(f"⚡ 批量人设生成模式（有界并发）")
+        logger.info(f"   图片数量: {total}")
+        logger.info(f"   同时生成: {window} 个人设（顺序: {order}{', 指定优先级' if priorities else ''}）")
         logger.info(f"   输出目录: {output_dir}")
         logger.info(f"{'='*70}\n")
 
         # 确保输出目录存在
         Path(output_dir).mkdir(parents=True, exist_ok=True)
+        report_file = Path(output_dir) / f"persona_batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
 
         start_time = datetime.now()
+        origin = time.monotonic()
+
+        # 先并行预处理全部图片（缩放/编码在线程池中完成），LLM阶段开始后直接命中缓存
+        preprocess_start = datetime.now()
+        before = dict(self.image_preprocessor.stats)
+        errors = await self.image_preprocessor.prepare_many(list(queue))
+        stats = {key: value - before[key] for key, value in self.image_preprocessor.stats.items()}
+        logger.info(
+            f"🖼️  图片预处理: {total} 张 "
+            f"(编码 {stats['encoded']}, 磁盘缓存 {stats['disk_hits']}) "
+            f"{stats['source_bytes'] / 1e6:.1f}MB → {stats['encoded_bytes'] / 1e6:.1f}MB, "
+            f"耗时 {(datetime.now() - preprocess_start).total_seconds():.1f}秒"
+        )
+        for image_path, error in errors.items():
+            if error:
+                logger.warning(f"⚠️  {Path(image_path).name} 预处理失败: {error}")
+
+        records: List[Dict] = []
+
+        async def worker() -> None:
+            while queue:
+                image_path = queue.popleft()
+                output_file = f"{output_dir}/{Path(image_path).stem}_persona.json"
+                record = {
+                    "image": image_path,
+                    "output_file": output_file,
+                    "queued_seconds": round(time.monotonic() - origin, 2)
+                }
+                started = time.monotonic()
+                try:
+                    persona = await self.generate_persona_from_image(
+                        image_path=image_path,
+                        output_file=output_file,
+                        nsfw_level=nsfw_level,
+                        language=language,
+                        location=location,
+                        business_goal=business_goal,
+                        custom_instructions=custom_instructions,
+                        temperature=temperature,
+                        refresh_stages=refresh_stages
+                    )
+                    record.update(status="success", name=persona.get("data", {}).get("name", "Unknown"))
+                except Exception as e:
+                    record.update(status="failed", error=str(e))
+                record["seconds"] = round(time.monotonic() - started, 2)
+                record["stages"] = {
+                    name: {"status": entry["status"], "seconds": entry["seconds"]}
+                    for name, entry in self.persona_stage_reports.pop(image_path, {}).items()
+                }
+                records.append(record)
 
-        # 为每个图片创建任务
-        tasks = []
-        for image_path in image_files:
-            # 自动生成输出文件名
-            image_name = Path(image_path).stem
-            output_file = f"{output_dir}/{image_name}_persona.json"
-
-            # 创建任务
-            task = self.generate_persona_from_image(
-                image_path=image_path,
-                output_file=output_file,
-                nsfw_level=nsfw_level,
-                language=language,
-                location=location,
-                business_goal=business_goal,
-                custom_instructions=custom_instructions,
-                temperature=temperature
-            )
-            tasks.append((image_path, task))
-
-        # 🚀 并发执行所有人设生成
-        logger.info(f"🚀 开始并发生成 {len(tasks)} 个人设...\n")
+                with open(report_file, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
 
-        results = await asyncio.gather(
-            *[task for _, task in tasks],
-            return_exceptions=True
-        )
+                progress = f"[{len(records)}/{total}]"
+                if record["status"] == "success":
+                    logger.info(
+                        f"✅ {progress} {Path(image_path).name}: {record['name']} "
+                        f"({record['seconds']:.1f}秒, 排队 {record['queued_seconds']:.1f}秒)"
+                    )
+                else:
+                    logger.error(f"❌ {progress} {Path(image_path).name}: {record['error']}")
+                if on_progress:
+                    on_progress(dict(record, done=len(records), total=total))
 
-        # 统计结果
-        success = 0
-        failed = 0
-        for (image_path, _), result in zip(tasks, results):
-            if isinstance(result, Exception):
-                logger.error(f"❌ {Path(image_path).name}: {result}")
-                failed += 1
-            else:
-                logger.info(f"✅ {Path(image_path).name}: {result.get('data', {}).get('name', 'Unknown')}")
-                success += 1
+        # 🚀 window 个worker按优先级顺序领取图片
+        logger.info(f"🚀 开始生成 {total} 个人设...\n")
+        await asyncio.gather(*[worker() for _ in range(min(window, total))])
 
+        success = sum(1 for record in records if record["status"] == "success")
+        failed = total - success
         elapsed = (datetime.now() - start_time).total_seconds()
-        total = len(image_files)
 
         logger.info(f"\n{'='*70}")
         logger.info(f"✅ 批量人设生成完成")
@@ -607,8 +1267,73 @@ Must output valid JSON format:
         logger.info(f"   失败: {failed} / {total}")
         if total > 0:
             logger.info(f"   平均速度: {elapsed/total:.1f}秒/人设")
+        logger.info(f"   进度报告: {report_file}")
         logger.info(f"{'='*70}\n")
 
+        return {
+            "report_file": str(report_file),
+            "success": success,
+            "failed": failed,
+            "elapsed_seconds": round(elapsed, 2),
+            "images": records
+        }
+
+    async def regenerate_persona_stages(
+        self,
+        persona_files: List[str],
+        stages: Optional[List[int]] = None,
+        temperature: Optional[float] = None
+    ) -> Dict[str, Dict]:
+        """
+        🔧 原地重新生成已有人设的指定阶段（不重跑 Stage 1，其余内容保持不变）
+
+        Args:
+            persona_files: 人设文件列表
+            stages: 阶段编号（Stage 2-7）；None表示各人设中输出缺失的阶段
+            temperature: Stage 2 的温度覆盖
+
+        Returns:
+            {人设文件: {"stages": 重新生成的阶段, "report": 阶段报告 或 "error": 错误}}
+        """
+        async def repair(persona_file: str) -> Dict:
+            with open(persona_file, 'r', encoding='utf-8') as f:
+                persona = json.load(f)
+            selected = stages if stages is not None else missing_stages(persona)
+            if not selected:
+                logger.info(f"✓ {Path(persona_file).name}: 各阶段输出完整，跳过")
+                return {"stages": []}
+
+            generator = self._new_persona_generator()
+            updated = await generator.regenerate_stages(persona, selected, temperature=temperature)
+
+            tmp_path = f"{persona_file}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(updated, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, persona_file)
+
+            failed = [
+                name for name, entry in generator.last_stage_report.items()
+                if entry["status"] not in ("ok", "cached")
+            ]
+            status = f"⚠️  失败阶段保留原内容: {', '.join(failed)}" if failed else "✅"
+            logger.info(f"{status} {Path(persona_file).name}: 重新生成 Stage {sorted(set(selected))}")
+            return {"stages": sorted(set(selected)), "report": generator.last_stage_report}
+
+        logger.info(f"\n🔧 原地重新生成人设阶段: {len(persona_files)} 个人设")
+        results = await asyncio.gather(
+            *[repair(persona_file) for persona_file in persona_files],
+            return_exceptions=True
+        )
+
+        summary = {}
+        for persona_file, result in zip(persona_files, results):
+            if isinstance(result, Exception):
+                logger.error(f"❌ {Path(persona_file).name}: {result}")
+                summary[persona_file] = {"error": str(result)}
+            else:
+                summary[persona_file] = result
+        return summary
+
 
 async def main():
     """命令行入口"""
@@ -665,6 +1390,47 @@ async def main():
         default="personas/generated_persona.json",
         help="生成的人设保存路径（默认personas/generated_persona.json）"
     )
+    parser.add_argument(
+        "--persona-window",
+        type=int,
+        default=int(os.getenv("PERSONA_WINDOW", "0")),
+        help="批量人设生成时同时生成的人设数（可从.env文件读取PERSONA_WINDOW，默认0=按最大并发自动）"
+    )
+    parser.add_argument(
+        "--persona-order",
+        choices=["smallest", "given"],
+        default="smallest",
+        help="批量人设生成顺序：smallest 小图片优先（默认）；given 保持 --images 的顺序"
+    )
+    parser.add_argument(
+        "--persona-priority",
+        nargs="+",
+        metavar="NAME=PRIORITY",
+        help="批量人设生成：图片的优先级（NAME为图片文件名，不含扩展名；数值大的先生成）"
+    )
+    parser.add_argument(
+        "--persona-image-max-side",
+        type=int,
+        default=int(os.getenv("PERSONA_IMAGE_MAX_SIDE", "1536")),
+        help="人设生成时图片缩放到的最长边像素（可从.env文件读取PERSONA_IMAGE_MAX_SIDE，默认：1536）"
+    )
+    parser.add_argument(
+        "--persona-image-format",
+        choices=["jpeg", "webp"],
+        default=os.getenv("PERSONA_IMAGE_FORMAT", "jpeg"),
+        help="人设生成时发送给视觉模型的图片编码（可从.env文件读取PERSONA_IMAGE_FORMAT，默认：jpeg）"
+    )
+    parser.add_argument(
+        "--refresh-stages",
+        action="store_true",
+        help="人设生成时忽略阶段检查点、所有阶段重新生成（默认同一图片和参数复用上次保存的阶段输出，"
+             "用于从失败处继续；需要同一图片的新变体时使用）"
+    )
+    parser.add_argument(
+        "--stages",
+        help="与 --generate-persona 和 --persona/--personas 一起使用：原地重新生成已有人设的指定阶段，"
+             "如 4,7（Stage 2-7）；missing 表示各人设中输出缺失的阶段"
+    )
 
     # 推文生成模式参数
     parser.add_argument(
@@ -687,6 +1453,40 @@ async def main():
         action="store_true",
         help="使用内容池模式（按类别生成推文，不需要calendar）- 推荐使用"
     )
+    parser.add_argument(
+        "--tweets-per-call",
+        type=int,
+        default=int(os.getenv("TWEETS_PER_CALL", "1")),
+        help="内容池模式下每次LLM调用生成的推文数，>1时共用系统prompt以节省token（可从.env文件读取TWEETS_PER_CALL，默认：1）"
+    )
+    parser.add_argument(
+        "--plan-strategy",
+        choices=["random", "stratified"],
+        default=os.getenv("PLAN_STRATEGY", "random"),
+        help="内容池的规划策略：random 各维度独立随机；stratified 选项与mood按配额分层分配，"
+             "少量推文也能覆盖全部选项（可从.env文件读取PLAN_STRATEGY，默认：random）"
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="RUN_ID",
+        help="恢复中断的内容池运行：沿用原计划，只生成缺失的推文（运行ID见生成时的日志）"
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="内容池模式：生成后与该人设的历史内容池做近似重复检查（MinHash LSH），重复的推文标记 near_duplicate"
+    )
+    parser.add_argument(
+        "--dedup-regenerate",
+        action="store_true",
+        help="近似重复的推文自动换一个变化组合重新生成（隐含 --dedup）"
+    )
+    parser.add_argument(
+        "--topup-from",
+        nargs="+",
+        metavar="POOL",
+        help="按分布补量：读取已有内容池，只生成与目标分布相比不足的类型，合并写出（--tweets 为补量后的总数）"
+    )
     parser.add_argument(
         "--use-calendar",
         action="store_true",
@@ -695,17 +1495,22 @@ async def main():
     parser.add_argument(
         "--api-key",
         default=os.getenv("API_KEY"),
-        help="LLM API密钥（可从.env文件读取API_KEY）"
+        help="LLM API密钥（可从.env文件读取API_KEY；多个key用逗号分隔即启用多端点路由）"
     )
     parser.add_argument(
         "--api-base",
         default=os.getenv("API_BASE", "https://api.openai.com/v1"),
-        help="LLM API地址（可从.env文件读取API_BASE，默认：https://api.openai.com/v1）"
+        help="LLM API地址（可从.env文件读取API_BASE，默认：https://api.openai.com/v1；可为与key对应的逗号列表）"
     )
     parser.add_argument(
         "--model",
         default=os.getenv("MODEL", "gpt-4"),
-        help="LLM模型名称（可从.env文件读取MODEL，默认：gpt-4）"
+        help="LLM模型名称（可从.env文件读取MODEL，默认：gpt-4；可为与key对应的逗号列表）"
+    )
+    parser.add_argument(
+        "--llm-endpoints",
+        default=os.getenv("LLM_ENDPOINTS"),
+        help="多端点配置：JSON字符串或JSON文件路径，每项含api_key/api_base/model/weight/max_concurrent（可从.env文件读取LLM_ENDPOINTS）"
     )
     parser.add_argument(
         "--max-concurrent",
@@ -713,6 +1518,71 @@ async def main():
         default=int(os.getenv("MAX_CONCURRENT", "20")),
         help="最大并发数（可从.env文件读取MAX_CONCURRENT，默认：20）"
     )
+    parser.add_argument(
+        "--adaptive-concurrency",
+        action="store_true",
+        default=os.getenv("ADAPTIVE_CONCURRENCY", "").lower() in ("1", "true", "yes"),
+        help="启用自适应并发（AIMD，根据429和延迟在--min-concurrent和--max-concurrent之间自动调整）"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        default=os.getenv("LLM_STREAM", "").lower() in ("1", "true", "yes"),
+        help="流式生成推文：SCENE完整即终止响应，TWEET超长时提前改写（可从.env文件读取LLM_STREAM）"
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        default=os.getenv("LLM_HEDGE", "").lower() in ("1", "true", "yes"),
+        help="对冲请求：耗时超过p95时用空闲槽位发重复请求，先返回者胜出（可从.env文件读取LLM_HEDGE）"
+    )
+    parser.add_argument(
+        "--hedge-budget",
+        type=float,
+        default=float(os.getenv("HEDGE_BUDGET", "0.05")),
+        help="最多允许对冲的请求比例（可从.env文件读取HEDGE_BUDGET，默认：0.05）"
+    )
+    parser.add_argument(
+        "--llm-cache",
+        action="store_true",
+        default=os.getenv("LLM_CACHE", "").lower() in ("1", "true", "yes"),
+        help="启用本地LLM响应缓存，相同请求直接回放（可从.env文件读取LLM_CACHE）"
+    )
+    parser.add_argument(
+        "--llm-cache-path",
+        default=os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH),
+        help=f"LLM缓存文件路径（可从.env文件读取LLM_CACHE_PATH，默认：{DEFAULT_CACHE_PATH}）"
+    )
+    parser.add_argument(
+        "--llm-cache-ttl",
+        type=float,
+        default=float(os.getenv("LLM_CACHE_TTL", "0")) or None,
+        help="LLM缓存有效期（秒，可从.env文件读取LLM_CACHE_TTL，默认永久）"
+    )
+    parser.add_argument(
+        "--llm-cache-max-mb",
+        type=int,
+        default=int(os.getenv("LLM_CACHE_MAX_MB", "512")),
+        help="LLM缓存大小上限，超出按LRU淘汰（可从.env文件读取LLM_CACHE_MAX_MB，默认：512）"
+    )
+    parser.add_argument(
+        "--min-concurrent",
+        type=int,
+        default=int(os.getenv("MIN_CONCURRENT", "1")),
+        help="自适应并发的下限（可从.env文件读取MIN_CONCURRENT，默认：1）"
+    )
+    parser.add_argument(
+        "--rpm-limit",
+        type=int,
+        default=int(os.getenv("RPM_LIMIT", "0")) or None,
+        help="每分钟请求数上限（可从.env文件读取RPM_LIMIT，默认不限制）"
+    )
+    parser.add_argument(
+        "--tpm-limit",
+        type=int,
+        default=int(os.getenv("TPM_LIMIT", "0")) or None,
+        help="每分钟token数上限（可从.env文件读取TPM_LIMIT，默认不限制）"
+    )
     parser.add_argument(
         "--temperature",
         type=float,
@@ -741,6 +1611,44 @@ async def main():
         nargs="+",
         help="批量模式：多个日历文件路径"
     )
+    parser.add_argument(
+        "--bulk-dir",
+        metavar="PERSONA_DIR",
+        help="批量生产模式：为目录下所有人设（*.json）在同一进程中生成内容池，共用LLM池和限流"
+    )
+    parser.add_argument(
+        "--bulk-targets",
+        nargs="+",
+        metavar="NAME=COUNT",
+        help="批量生产模式：单个人设的目标推文数（NAME为人设文件名，不含.json；默认 --tweets）"
+    )
+    parser.add_argument(
+        "--bulk-topup",
+        action="store_true",
+        help="批量生产模式：已有内容池时按分布补量到目标数，已达标的人设跳过"
+    )
+    parser.add_argument(
+        "--persona-weight",
+        nargs="+",
+        metavar="NAME=WEIGHT",
+        help="批量/批量生产模式：人设的调度权重（NAME为人设文件名，不含.json；默认1）"
+    )
+
+    # 离线批量模式（OpenAI Batch API格式）
+    parser.add_argument(
+        "--batch-render",
+        metavar="BATCH_JSONL",
+        help="离线批量模式：把 --persona/--personas 的内容计划渲染成批量请求JSONL（不调用LLM）"
+    )
+    parser.add_argument(
+        "--batch-ingest",
+        metavar="RESULTS_JSONL",
+        help="导入离线批量结果JSONL，生成与内容池模式相同的输出文件（需要 --batch-manifest）"
+    )
+    parser.add_argument(
+        "--batch-manifest",
+        help="--batch-render 写出的 .manifest.json 路径"
+    )
 
     # ⭐ Calendar自动生成选项（完全保留ComfyUI精调逻辑）
     parser.add_argument(
@@ -813,7 +1721,7 @@ async def main():
     args = parser.parse_args()
 
     # 检查必需的 API_KEY
-    if not args.api_key:
+    if not args.api_key and not args.llm_endpoints:
         parser.error("需要提供 API_KEY，请在 .env 文件中设置或使用 --api-key 参数")
 
     # 创建协调器
@@ -823,11 +1731,49 @@ async def main():
         model=args.model,
         max_concurrent=args.max_concurrent,
         output_dir=args.output_dir,
-        weather_api_key=args.weather_api_key
+        weather_api_key=args.weather_api_key,
+        rpm_limit=args.rpm_limit,
+        tpm_limit=args.tpm_limit,
+        adaptive_concurrency=args.adaptive_concurrency,
+        min_concurrent=args.min_concurrent,
+        llm_endpoints=args.llm_endpoints,
+        stream=args.stream,
+        hedge=args.hedge,
+        hedge_budget=args.hedge_budget,
+        llm_cache_path=args.llm_cache_path if args.llm_cache else None,
+        llm_cache_ttl=args.llm_cache_ttl,
+        llm_cache_max_mb=args.llm_cache_max_mb,
+        plan_strategy=args.plan_strategy,
+        persona_image_max_side=args.persona_image_max_side,
+        persona_image_format=args.persona_image_format
     )
 
+    try:
+        await run_cli(args, parser, coordinator)
+    finally:
+        await coordinator.aclose()
+
+
+async def run_cli(args, parser, coordinator: HighConcurrencyCoordinator):
+    """根据命令行参数分派到对应的生成模式"""
     # ⭐ 人设生成模式
     if args.generate_persona:
+        # 原地重新生成已有人设的指定阶段
+        if args.stages:
+            persona_files = args.personas or ([args.persona] if args.persona else [])
+            if not persona_files:
+                parser.error("--stages 需要 --persona 或 --personas 指定已有人设文件")
+            stages = None
+            if args.stages != "missing":
+                try:
+                    stages = [int(value) for value in args.stages.split(",") if value.strip()]
+                except ValueError:
+                    parser.error(f"--stages 格式应为逗号分隔的阶段编号或 missing: {args.stages}")
+                if not stages or any(number < 2 or number > 7 for number in stages):
+                    parser.error(f"--stages 只支持 Stage 2-7: {args.stages}")
+            await coordinator.regenerate_persona_stages(persona_files, stages=stages)
+            return
+
         # 批量人设生成
         if args.images:
             await coordinator.generate_batch_personas(
@@ -838,7 +1784,11 @@ async def main():
                 location=args.location,
                 business_goal=args.business_goal,
                 custom_instructions=args.custom_instructions,
-                temperature=args.temperature
+                temperature=args.temperature,
+                window=args.persona_window,
+                order=args.persona_order,
+                priorities=_parse_named_values(args.persona_priority or [], float, "--persona-priority", parser),
+                refresh_stages=args.refresh_stages
             )
             return
 
@@ -854,10 +1804,30 @@ async def main():
             location=args.location,
             business_goal=args.business_goal,
             custom_instructions=args.custom_instructions,
+            temperature=args.temperature,
+            refresh_stages=args.refresh_stages
+        )
+        return
+
+    # 离线批量模式
+    if args.batch_render:
+        persona_files = args.personas or ([args.persona] if args.persona else [])
+        if not persona_files:
+            parser.error("--batch-render 需要 --persona 或 --personas 参数")
+        await coordinator.render_offline_batch(
+            persona_files=persona_files,
+            batch_file=args.batch_render,
+            tweets_per_persona=args.tweets,
             temperature=args.temperature
         )
         return
 
+    if args.batch_ingest:
+        if not args.batch_manifest:
+            parser.error("--batch-ingest 需要 --batch-manifest 参数")
+        await coordinator.ingest_offline_batch(args.batch_ingest, args.batch_manifest)
+        return
+
     # ⭐ 图片生成模式（Z-Image）
     if args.generate_images:
         if not args.tweets_batch:
@@ -893,6 +1863,57 @@ async def main():
 
         return
 
+    # 恢复中断的内容池运行
+    if args.resume:
+        await coordinator.resume_pool_run(args.resume)
+        return
+
+    # 按分布补量已有内容池
+    if args.topup_from:
+        if not args.persona:
+            parser.error("--topup-from 需要 --persona 参数")
+        await coordinator.topup_pool_for_persona(
+            persona_file=args.persona,
+            existing_files=args.topup_from,
+            target_count=args.tweets,
+            temperature=args.temperature,
+            tweets_per_call=args.tweets_per_call
+        )
+        return
+
+    # 批量生产模式：目录下所有人设在同一进程中运行
+    if args.bulk_dir:
+        persona_files = sorted(str(p) for p in Path(args.bulk_dir).glob("*.json"))
+        if not persona_files:
+            parser.error(f"--bulk-dir 目录下没有人设文件: {args.bulk_dir}")
+        await coordinator.generate_bulk(
+            persona_files=persona_files,
+            default_target=args.tweets,
+            targets=_parse_named_values(args.bulk_targets or [], int, "--bulk-targets", parser),
+            temperature=args.temperature,
+            tweets_per_call=args.tweets_per_call,
+            topup=args.bulk_topup,
+            weights=_parse_named_values(args.persona_weight or [], float, "--persona-weight", parser)
+        )
+        return
+
+    # 批量模式：多个人设共用LLM池，按权重公平调度
+    if args.batch_mode:
+        if not args.personas:
+            parser.error("--batch-mode 需要 --personas 参数")
+        if args.calendars and len(args.calendars) != len(args.personas):
+            parser.error("--calendars 的数量需要与 --personas 一致")
+        await coordinator.generate_batch_tweets(
+            persona_files=args.personas,
+            calendar_files=args.calendars,
+            tweets_per_persona=args.tweets,
+            temperature=args.temperature,
+            use_content_pool=args.use_content_pool or (not args.use_calendar and not args.calendars),
+            tweets_per_call=args.tweets_per_call,
+            weights=_parse_named_values(args.persona_weight or [], float, "--persona-weight", parser)
+        )
+        return
+
     # 推文生成模式
     if args.persona:
         # 判断使用哪种模式
@@ -902,10 +1923,6 @@ async def main():
 
         use_content_pool = args.use_content_pool or (not args.use_calendar and not args.calendar)
 
-        if args.batch_mode:
-            logger.error("❌ 批量模式暂不支持，请使用单个persona生成")
-            return
-
         await coordinator.generate_tweets_for_persona(
             persona_file=args.persona,
             calendar_file=args.calendar,
@@ -913,7 +1930,10 @@ async def main():
             temperature=args.temperature,
             auto_generate_calendar=args.generate_calendar,
             enable_context=args.enable_context,
-            use_content_pool=use_content_pool
+            use_content_pool=use_content_pool,
+            tweets_per_call=args.tweets_per_call,
+            dedup=args.dedup,
+            dedup_regenerate=args.dedup_regenerate
         )
         return
 
@@ -175,7 +175,10 @@ async def main():
     ]
 
     # 并发执行
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+    try:
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await coordinator.aclose()
 
     # 统计结果
     duration = (datetime.now() - start_time).total_seconds()
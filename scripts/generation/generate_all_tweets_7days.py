@@ -186,16 +186,13 @@ Must output valid JSON format:
             persona, year_month, days_to_generate
         )
 
-        # 调用LLM
-        from utils.llm_client import AsyncLLMClient
-        llm = AsyncLLMClient(self.api_key, self.api_base, self.model)
-
+        # 调用LLM（经由共享的LLM池，受统一并发/限流控制）
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ]
 
-        response = await llm.generate(messages, temperature=0.7, max_tokens=10000)
+        response = await self.llm_pool.generate(messages, temperature=0.7, max_tokens=10000)
 
         # 解析并保存
         calendar_data = self.calendar_manager.parse_calendar_response(
@@ -416,7 +413,10 @@ async def main():
     ]
 
     # 并发执行
-    all_results = await asyncio.gather(*tasks, return_exceptions=True)
+    try:
+        all_results = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await generator.llm_pool.aclose()
 
     # 统计结果
     duration = (datetime.now() - start_time).total_seconds()
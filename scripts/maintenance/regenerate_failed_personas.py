@@ -9,7 +9,10 @@ import sys
 from pathlib import Path
 from datetime import datetime
 
-sys.path.insert(0, str(Path(__file__).parent))
+# DayByDayTweetGenerator 在 scripts/generation/ 下，它又依赖项目根目录的 utils/core/tools
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "scripts" / "generation"))
 
 from generate_all_tweets_7days import DayByDayTweetGenerator
 
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+修复阶段失败的personas（只重新生成缺失的阶段）
+Stage 4-7 失败时人设里对应的部分为空（如缺少 language_authenticity），
+这里只重新生成缺失的阶段并原地写回，不重跑 Stage 1（不需要原图）
+
+用法:
+    python scripts/maintenance/repair_persona_stages.py                 # 扫描 personas/ 目录
+    python scripts/maintenance/repair_persona_stages.py personas/a.json --stages 4,7
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+from datetime import datetime
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from dotenv import load_dotenv
+
+from core.persona_generator import missing_stages
+
+load_dotenv()
+
+
+async def main():
+    """修复阶段失败的personas"""
+    parser = argparse.ArgumentParser(description="原地重新生成人设中失败/缺失的阶段")
+    parser.add_argument("personas", nargs="*", help="人设文件（默认扫描 personas/ 目录）")
+    parser.add_argument("--stages", help="指定阶段编号，如 4,7（默认各人设中输出缺失的阶段）")
+    args = parser.parse_args()
+
+    persona_files = args.personas or sorted(str(path) for path in (PROJECT_ROOT / "personas").glob("*.json"))
+    stages = [int(value) for value in args.stages.split(",")] if args.stages else None
+
+    print("=" * 80)
+    print("🔄 修复阶段失败的personas")
+    print("=" * 80)
+
+    # 只处理需要修复的人设
+    todo = []
+    for persona_file in persona_files:
+        with open(persona_file, 'r', encoding='utf-8') as f:
+            selected = stages or missing_stages(json.load(f))
+        if selected:
+            todo.append(persona_file)
+            print(f"✗ {Path(persona_file).name}: Stage {selected}")
+        else:
+            print(f"✓ {Path(persona_file).name}")
+
+    if not todo:
+        print("\n✅ 所有人设的阶段输出都完整")
+        return
+
+    print(f"\n将修复 {len(todo)} 个personas\n")
+
+    from main import HighConcurrencyCoordinator
+
+    api_key = os.getenv("API_KEY") or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        print("❌ 错误: 请设置API_KEY环境变量")
+        sys.exit(1)
+
+    coordinator = HighConcurrencyCoordinator(
+        api_key=api_key,
+        api_base=os.getenv("API_BASE", "https://api.openai.com/v1"),
+        model=os.getenv("MODEL", "gpt-4"),
+        max_concurrent=int(os.getenv("MAX_CONCURRENT", "20")),
+        output_dir="output_standalone"
+    )
+
+    start_time = datetime.now()
+    try:
+        summary = await coordinator.regenerate_persona_stages(todo, stages=stages)
+    finally:
+        await coordinator.aclose()
+    duration = (datetime.now() - start_time).total_seconds()
+
+    still_failed = []
+    for persona_file, item in summary.items():
+        if "error" in item:
+            still_failed.append((persona_file, item["error"]))
+            continue
+        with open(persona_file, 'r', encoding='utf-8') as f:
+            remaining = missing_stages(json.load(f))
+        if remaining:
+            still_failed.append((persona_file, f"Stage {remaining} 输出仍缺失"))
+
+    print("\n" + "=" * 80)
+    print("📊 修复结果统计")
+    print("=" * 80)
+    print(f"✅ 成功personas: {len(todo) - len(still_failed)}/{len(todo)}")
+    print(f"⏱️  总耗时: {duration:.1f}秒")
+    print("=" * 80)
+
+    if still_failed:
+        print("\n仍然失败的personas:")
+        for persona_file, error in still_failed:
+            print(f"  ❌ {Path(persona_file).name}: {error}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+LLM HTTP会话微基准
+在本地启动一个OpenAI兼容的stub服务器，对比：
+  - 旧方式：每个请求新建 aiohttp.ClientSession
+  - 新方式：AsyncLLMClient 持有的长连接会话（TCPConnector复用）
+
+用法:
+    python scripts/tools/benchmark_llm_session.py --requests 2000 --concurrency 100
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+# 添加项目路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from utils.llm_client import AsyncLLMClient
+
+MESSAGES = [{"role": "user", "content": "ping"}]
+
+
+async def _stub_completion(request: web.Request) -> web.Response:
+    """返回固定的chat completion响应"""
+    await request.json()
+    return web.json_response({
+        "choices": [{"message": {"role": "assistant", "content": "TWEET: pong\nSCENE: stub"}}]
+    })
+
+
+async def start_stub_server(port: int) -> web.AppRunner:
+    """启动本地stub服务器"""
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", _stub_completion)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def _request_with_new_session(url: str) -> str:
+    """旧方式：每次请求新建会话"""
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, json={"model": "stub", "messages": MESSAGES}) as resp:
+            data = await resp.json()
+            return data["choices"][0]["message"]["content"]
+
+
+async def _run(label: str, make_call, total: int, concurrency: int) -> float:
+    """以固定并发执行total个请求，返回requests/sec"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await make_call()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(total)])
+    elapsed = time.perf_counter() - start
+
+    rps = total / elapsed
+    print(f"  {label:<28s} {elapsed:6.2f}s  {rps:8.1f} req/s")
+    return rps
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="AsyncLLMClient 长连接会话微基准")
+    parser.add_argument("--requests", type=int, default=2000, help="请求总数（默认2000）")
+    parser.add_argument("--concurrency", type=int, default=100, help="并发数（默认100）")
+    parser.add_argument("--port", type=int, default=18765, help="stub服务器端口（默认18765）")
+    args = parser.parse_args()
+
+    runner = await start_stub_server(args.port)
+    api_base = f"http://127.0.0.1:{args.port}/v1"
+
+    client = AsyncLLMClient("stub-key", api_base, "stub", max_connections=args.concurrency)
+    client.use_sdk = False  # 强制走aiohttp路径
+
+    print(f"\n📊 {args.requests} 个请求, 并发 {args.concurrency}\n")
+    try:
+        before = await _run(
+            "每请求新建会话 (旧)",
+            lambda: _request_with_new_session(f"{api_base}/chat/completions"),
+            args.requests, args.concurrency
+        )
+        after = await _run(
+            "长连接会话 (新)",
+            lambda: client.generate(MESSAGES, temperature=0.0, max_tokens=16),
+            args.requests, args.concurrency
+        )
+        print(f"\n  ⚡ 提升: {after / before:.2f}x\n")
+    finally:
+        await client.aclose()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
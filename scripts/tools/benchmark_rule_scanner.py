@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+内容规则扫描器基准
+生成一批与真实推文长度/用词相近的合成推文（按比例混入违规短语、时间戳、日期），
+测量 ContentRuleScanner.scan 的吞吐（tweets/sec，多轮取中位数）并核对命中数量，
+与目标吞吐（默认 100k 条/秒）比较，未达标时退出码为1。
+
+用法:
+    python scripts/tools/benchmark_rule_scanner.py --tweets 100000 --violation-rate 0.05
+    python scripts/tools/benchmark_rule_scanner.py --repeat 5 --target 100000
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# 添加项目路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from utils.content_rules import ContentRuleScanner
+
+FRAGMENTS = [
+    "collar's digging into my throat again.", "not loosening it.", "lace keeps riding up.",
+    "thighs pressed together under this skirt.", "nobody here has any idea what I'm thinking about.",
+    "his shirt keeps slipping off my shoulder.", "kinda hoping you're the one who sees this.",
+    "skin still warm from the shower.", "this mirror is getting a show.", "new heels, same bad ideas.",
+    "staying like this until someone tells me to stop", "hands won't stop touching my neck 😈",
+    "late night and can't sleep.", "bra strap's showing. not fixing it."
+]
+VIOLATIONS = [
+    "whispers of desire everywhere.", "it's 2:17am and I'm still up.", "Monday again.",
+    "christmas eve alone.", "the delicate power of it.", "since dec 7th.", "tonight I'm yours."
+]
+
+
+def make_tweets(count: int, violation_rate: float, seed: int = 42):
+    """生成合成推文（约140-270字符）和注入违规的条数"""
+    rng = random.Random(seed)
+    tweets = []
+    expected = 0
+    for _ in range(count):
+        parts = []
+        while sum(len(p) + 1 for p in parts) < rng.randint(140, 230):
+            parts.append(rng.choice(FRAGMENTS))
+        if rng.random() < violation_rate:
+            parts.insert(rng.randrange(len(parts) + 1), rng.choice(VIOLATIONS))
+            expected += 1
+        tweets.append(" ".join(parts))
+    return tweets, expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="内容规则扫描器吞吐基准")
+    parser.add_argument("--tweets", type=int, default=100000, help="推文数量（默认100000）")
+    parser.add_argument("--violation-rate", type=float, default=0.05, help="含违规内容的比例（默认0.05）")
+    parser.add_argument("--rules", default=None, help="规则文件（默认config/content_rules.yaml）")
+    parser.add_argument("--repeat", type=int, default=3, help="测量轮数，取中位数（默认3）")
+    parser.add_argument("--target", type=int, default=100000, help="目标吞吐 条/秒（默认100000）")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    scanner = ContentRuleScanner.from_file(args.rules)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    tweets, expected = make_tweets(args.tweets, args.violation_rate)
+    avg_len = sum(len(t) for t in tweets) / len(tweets)
+
+    timings = []
+    for _ in range(max(1, args.repeat)):
+        start = time.perf_counter()
+        flagged = sum(1 for tweet in tweets if scanner.scan(tweet))
+        timings.append(time.perf_counter() - start)
+    elapsed = statistics.median(timings)
+    throughput = len(tweets) / elapsed
+
+    print(f"规则编译: {build_ms:.1f}ms (自动机 {len(scanner.matcher._goto)} 个状态, "
+          f"{len(scanner.digit_patterns)} 个数字正则)")
+    print(f"推文: {len(tweets)} 条, 平均 {avg_len:.0f} 字符")
+    print(f"命中: {flagged} 条 (注入违规 {expected} 条)")
+    print(f"耗时: {elapsed:.3f}秒 (中位数/{len(timings)}轮, 最快 {len(tweets) / min(timings):,.0f} 条/秒), "
+          f"{elapsed / len(tweets) * 1e6:.2f}μs/条, {throughput:,.0f} 条/秒")
+
+    if throughput >= args.target:
+        print(f"✅ 达到目标 {args.target:,} 条/秒")
+    else:
+        print(f"❌ 未达到目标 {args.target:,} 条/秒")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+多条生成（--tweets-per-call）基准
+在本地启动一个OpenAI兼容的stub服务器（按prompt/输出长度模拟延迟并统计token），
+用同一人设分别以单条模式和多条模式运行 BatchTweetGenerator.generate_pool，对比：
+  - tokens/tweet（prompt + completion，约4字符/token）
+  - tweets/sec
+
+用法:
+    python scripts/tools/benchmark_tweets_per_call.py --tweets 200 --tweets-per-call 5
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+from aiohttp import web
+
+# 添加项目路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from utils.llm_client import LLMClientPool
+from core.tweet_generator import BatchTweetGenerator
+
+STUB_TWEET = (
+    "collar's digging into my throat again. not loosening it. "
+    "thighs pressed together under the desk and nobody here has any idea what I'm thinking about"
+)
+STUB_SCENE = (
+    "Medium shot from low angle: woman sitting on edge of unmade bed wearing oversized grey sweater "
+    "slipping off one shoulder, thin black collar on throat, legs crossed, one hand on knee, dim purple "
+    "LED light from behind, direct gaze into camera, Raw photo, candid photography, messy background"
+)
+
+
+class StubLLM:
+    """按 prompt/输出 token 数模拟延迟的 chat completion 服务"""
+
+    def __init__(self, prefill_per_token: float, decode_per_token: float, base_latency: float):
+        self.prefill_per_token = prefill_per_token
+        self.decode_per_token = decode_per_token
+        self.base_latency = base_latency
+        self.reset()
+
+    def reset(self) -> None:
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        prompt = "".join(m["content"] for m in payload["messages"])
+        user_prompt = payload["messages"][-1]["content"]
+
+        posts = len(re.findall(r"^### Post \d+$", user_prompt, flags=re.MULTILINE))
+        if posts:
+            content = json.dumps(
+                [{"id": i, "tweet": STUB_TWEET, "scene": STUB_SCENE} for i in range(1, posts + 1)],
+                ensure_ascii=False
+            )
+        else:
+            content = f"TWEET: {STUB_TWEET}\n\nSCENE: {STUB_SCENE}"
+
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+        await asyncio.sleep(
+            self.base_latency
+            + prompt_tokens * self.prefill_per_token
+            + completion_tokens * self.decode_per_token
+        )
+        return web.json_response({
+            "choices": [{"message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+        })
+
+
+async def start_stub_server(stub: StubLLM, port: int) -> web.AppRunner:
+    """启动本地stub服务器"""
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", stub.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def _run(label: str, stub: StubLLM, api_base: str, persona: dict, args, tweets_per_call: int) -> dict:
+    """以指定 tweets_per_call 运行一次 generate_pool 并打印统计"""
+    pool = LLMClientPool("stub-key", api_base, "stub", max_concurrent=args.concurrency)
+    pool.client.use_sdk = False  # 强制走aiohttp路径
+    generator = BatchTweetGenerator(pool)
+    stub.reset()
+
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = await generator.generate_pool(
+                persona, count=args.tweets, tweets_per_call=tweets_per_call
+            )
+    finally:
+        await pool.aclose()
+    elapsed = time.perf_counter() - start
+
+    tweets = len(result["tweets"])
+    total_tokens = stub.prompt_tokens + stub.completion_tokens
+    stats = {
+        "tweets": tweets,
+        "requests": stub.requests,
+        "tokens_per_tweet": total_tokens / max(tweets, 1),
+        "prompt_tokens_per_tweet": stub.prompt_tokens / max(tweets, 1),
+        "tweets_per_sec": tweets / elapsed
+    }
+    print(
+        f"  {label:<22s} {tweets:5d} 条 {stub.requests:5d} 次调用  "
+        f"{stats['tokens_per_tweet']:7.0f} tokens/条 (prompt {stats['prompt_tokens_per_tweet']:6.0f})  "
+        f"{stats['tweets_per_sec']:6.1f} 条/秒"
+    )
+    return stats
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="单条 vs 多条生成（tweets_per_call）基准")
+    parser.add_argument("--persona", default="personas/jfz_45_soft_domme.json", help="人设JSON文件")
+    parser.add_argument("--tweets", type=int, default=200, help="推文数量（默认200）")
+    parser.add_argument("--tweets-per-call", type=int, default=5, help="多条模式每次调用的推文数（默认5）")
+    parser.add_argument("--concurrency", type=int, default=20, help="并发数（默认20）")
+    parser.add_argument("--base-latency", type=float, default=0.3, help="每个请求的固定延迟（秒，默认0.3）")
+    parser.add_argument("--prefill-ms", type=float, default=0.05, help="每个prompt token的处理时间（毫秒，默认0.05）")
+    parser.add_argument("--decode-ms", type=float, default=5.0, help="每个输出token的生成时间（毫秒，默认5）")
+    parser.add_argument("--port", type=int, default=18766, help="stub服务器端口（默认18766）")
+    args = parser.parse_args()
+
+    with open(args.persona, "r", encoding="utf-8") as f:
+        persona = json.load(f)
+
+    stub = StubLLM(args.prefill_ms / 1000, args.decode_ms / 1000, args.base_latency)
+    runner = await start_stub_server(stub, args.port)
+    api_base = f"http://127.0.0.1:{args.port}/v1"
+
+    print(f"\n📊 {args.tweets} 条推文, 并发 {args.concurrency}\n")
+    try:
+        before = await _run("单条模式 (旧)", stub, api_base, persona, args, 1)
+        after = await _run(
+            f"每次{args.tweets_per_call}条 (新)", stub, api_base, persona, args, args.tweets_per_call
+        )
+        print(
+            f"\n  ⚡ tokens/条: {before['tokens_per_tweet'] / after['tokens_per_tweet']:.2f}x 更少, "
+            f"吞吐: {after['tweets_per_sec'] / before['tweets_per_sec']:.2f}x\n"
+        )
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
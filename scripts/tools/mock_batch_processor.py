@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+本地批量处理器（测试用）
+读取 main.py --batch-render 生成的批量请求JSONL，用mock模型逐条作答，
+按 OpenAI Batch API 的结果格式写出结果JSONL，供 --batch-ingest 导入。
+
+用法:
+    python main.py --persona personas/xxx.json --tweets 50 --batch-render batches/run.jsonl
+    python scripts/tools/mock_batch_processor.py batches/run.jsonl batches/run.results.jsonl
+    python main.py --batch-ingest batches/run.results.jsonl --batch-manifest batches/run.manifest.json
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+
+OPENINGS = [
+    "collar's digging into my throat again.",
+    "lace keeps riding up.",
+    "thighs pressed together under this skirt.",
+    "his shirt keeps slipping off my shoulder.",
+    "skin still warm from the shower.",
+]
+CLOSINGS = [
+    "not fixing it. let someone notice",
+    "nobody here has any idea what I'm thinking about",
+    "kinda hoping you're the one who sees this",
+    "staying like this until someone tells me to stop",
+]
+
+
+def _field(prompt: str, name: str, default: str) -> str:
+    """从spec prompt中取出 **Name**: value 字段"""
+    match = re.search(rf"\*\*{name}\*\*: (.+)", prompt)
+    return match.group(1).strip() if match else default
+
+
+def mock_completion(custom_id: str, body: dict, overlong_rate: float) -> str:
+    """按custom_id确定性地生成 TWEET/SCENE 响应"""
+    rng = random.Random(hashlib.sha256(custom_id.encode("utf-8")).hexdigest())
+    prompt = body["messages"][-1]["content"]
+    mood = _field(prompt, "Mood", "confident")
+    scene = _field(prompt, "Specific Scene", "bedroom")
+
+    tweet = f"{rng.choice(OPENINGS)} feeling {mood}. {rng.choice(CLOSINGS)}"
+    if rng.random() < overlong_rate:
+        tweet = " ".join([tweet] * 3)  # 触发导入时的长度检查
+    return (
+        f"TWEET: {tweet}\n\n"
+        f"SCENE: Medium shot at eye level: {scene}, {mood} expression, direct gaze into camera, "
+        f"warm window light, Raw photo, candid photography, messy background"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用mock模型回答批量请求JSONL（OpenAI Batch结果格式）")
+    parser.add_argument("input", help="批量请求JSONL")
+    parser.add_argument("output", help="输出的结果JSONL")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟失败请求的比例（默认0）")
+    parser.add_argument("--overlong-rate", type=float, default=0.0, help="模拟超长推文的比例（默认0）")
+    args = parser.parse_args()
+
+    total = failed = 0
+    with open(args.input, "r", encoding="utf-8") as fin, open(args.output, "w", encoding="utf-8") as fout:
+        for line in fin:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            custom_id = request["custom_id"]
+            total += 1
+
+            rng = random.Random(custom_id)
+            if rng.random() < args.error_rate:
+                failed += 1
+                record = {
+                    "id": f"batch_req_{total:06d}",
+                    "custom_id": custom_id,
+                    "response": None,
+                    "error": {"code": "mock_error", "message": "simulated failure"}
+                }
+            else:
+                content = mock_completion(custom_id, request["body"], args.overlong_rate)
+                record = {
+                    "id": f"batch_req_{total:06d}",
+                    "custom_id": custom_id,
+                    "response": {
+                        "status_code": 200,
+                        "request_id": f"mock-{total:06d}",
+                        "body": {
+                            "object": "chat.completion",
+                            "model": request["body"].get("model", "mock"),
+                            "choices": [{
+                                "index": 0,
+                                "message": {"role": "assistant", "content": content},
+                                "finish_reason": "stop"
+                            }]
+                        }
+                    },
+                    "error": None
+                }
+            fout.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    print(f"✅ {total} 个请求已处理 (失败 {failed}) -> {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
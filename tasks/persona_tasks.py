@@ -71,6 +71,16 @@ def generate_persona_task(
             api_base=settings.llm_api_base,
             model=settings.llm_model,
             max_concurrent=settings.llm_max_concurrent,
+            rpm_limit=settings.llm_rpm_limit,
+            tpm_limit=settings.llm_tpm_limit,
+            adaptive_concurrency=settings.llm_adaptive_concurrency,
+            min_concurrent=settings.llm_min_concurrent,
+            llm_endpoints=settings.llm_endpoints,
+            hedge=settings.llm_hedge,
+            hedge_budget=settings.llm_hedge_budget,
+            llm_cache_path=settings.llm_cache_path,
+            llm_cache_ttl=settings.llm_cache_ttl,
+            llm_cache_max_mb=settings.llm_cache_max_mb,
             weather_api_key=settings.weather_api_key
         )
 
@@ -105,6 +115,8 @@ def generate_persona_task(
             }
 
         finally:
+            # 释放LLM长连接后再关闭事件循环
+            loop.run_until_complete(coordinator.aclose())
             loop.close()
 
     except Exception as e:
@@ -147,7 +159,17 @@ def generate_batch_personas_task(
             api_key=settings.llm_api_key,
             api_base=settings.llm_api_base,
             model=settings.llm_model,
-            max_concurrent=settings.llm_max_concurrent
+            max_concurrent=settings.llm_max_concurrent,
+            rpm_limit=settings.llm_rpm_limit,
+            tpm_limit=settings.llm_tpm_limit,
+            adaptive_concurrency=settings.llm_adaptive_concurrency,
+            min_concurrent=settings.llm_min_concurrent,
+            llm_endpoints=settings.llm_endpoints,
+            hedge=settings.llm_hedge,
+            hedge_budget=settings.llm_hedge_budget,
+            llm_cache_path=settings.llm_cache_path,
+            llm_cache_ttl=settings.llm_cache_ttl,
+            llm_cache_max_mb=settings.llm_cache_max_mb
         )
 
         loop = asyncio.new_event_loop()
@@ -156,13 +178,19 @@ def generate_batch_personas_task(
         try:
             logger.info(f"Task {task_id}: Starting batch persona generation for {len(image_files)} images")
 
-            # 批量生成（会内部并发）
-            loop.run_until_complete(
+            def on_progress(record):
+                # 每个人设完成时更新任务进度
+                storage.update_task(task_id, progress=int(record["done"] * 100 / record["total"]))
+
+            # 批量生成（最多 persona_window 个人设同时生成，小图片优先，完成即写入）
+            summary = loop.run_until_complete(
                 coordinator.generate_batch_personas(
                     image_files=image_files,
                     output_dir=output_dir,
                     nsfw_level=nsfw_level,
-                    language=language
+                    language=language,
+                    window=settings.persona_window,
+                    on_progress=on_progress
                 )
             )
 
@@ -170,10 +198,16 @@ def generate_batch_personas_task(
 
             return {
                 "count": len(image_files),
-                "output_dir": output_dir
+                "output_dir": output_dir,
+                "success": summary["success"],
+                "failed": summary["failed"],
+                "report_file": summary["report_file"],
+                "images": summary["images"]
             }
 
         finally:
+            # 释放LLM长连接后再关闭事件循环
+            loop.run_until_complete(coordinator.aclose())
             loop.close()
 
     except Exception as e:
@@ -67,6 +67,17 @@ def generate_tweets_task(
             api_base=settings.llm_api_base,
             model=settings.llm_model,
             max_concurrent=settings.llm_max_concurrent,
+            rpm_limit=settings.llm_rpm_limit,
+            tpm_limit=settings.llm_tpm_limit,
+            adaptive_concurrency=settings.llm_adaptive_concurrency,
+            min_concurrent=settings.llm_min_concurrent,
+            llm_endpoints=settings.llm_endpoints,
+            hedge=settings.llm_hedge,
+            hedge_budget=settings.llm_hedge_budget,
+            llm_cache_path=settings.llm_cache_path,
+            llm_cache_ttl=settings.llm_cache_ttl,
+            llm_cache_max_mb=settings.llm_cache_max_mb,
+            stream=settings.llm_stream,
             weather_api_key=settings.weather_api_key,
             output_dir=settings.output_dir
         )
@@ -97,6 +108,8 @@ def generate_tweets_task(
             }
 
         finally:
+            # 释放LLM长连接后再关闭事件循环
+            loop.run_until_complete(coordinator.aclose())
             loop.close()
 
     except Exception as e:
@@ -136,6 +149,17 @@ def generate_batch_tweets_task(
             api_base=settings.llm_api_base,
             model=settings.llm_model,
             max_concurrent=settings.llm_max_concurrent,
+            rpm_limit=settings.llm_rpm_limit,
+            tpm_limit=settings.llm_tpm_limit,
+            adaptive_concurrency=settings.llm_adaptive_concurrency,
+            min_concurrent=settings.llm_min_concurrent,
+            llm_endpoints=settings.llm_endpoints,
+            hedge=settings.llm_hedge,
+            hedge_budget=settings.llm_hedge_budget,
+            llm_cache_path=settings.llm_cache_path,
+            llm_cache_ttl=settings.llm_cache_ttl,
+            llm_cache_max_mb=settings.llm_cache_max_mb,
+            stream=settings.llm_stream,
             output_dir=settings.output_dir
         )
 
@@ -162,6 +186,8 @@ def generate_batch_tweets_task(
             }
 
         finally:
+            # 释放LLM长连接后再关闭事件循环
+            loop.run_until_complete(coordinator.aclose())
             loop.close()
 
     except Exception as e:
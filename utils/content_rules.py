@@ -0,0 +1,155 @@
+"""
+推文内容规则扫描
+从 config/content_rules.yaml 构建一次：禁用短语编译成按词匹配的 Aho-Corasick 自动机，
+时间戳/日期等用预编译正则；每条推文一次线性扫描即可找出全部违规。
+绝大多数推文没有违规，先用C实现的字符串操作做预筛（不含任何短语尾词或首词、不含数字的直接放行；
+尾词比首词选择性高得多："this"、"new" 这类首词几乎每条推文都有）
+"""
+import re
+import string
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import yaml
+
+PROJECT_ROOT = Path(__file__).parent.parent
+DEFAULT_RULES_FILE = PROJECT_ROOT / "config" / "content_rules.yaml"
+
+_DIGITS = string.digits.encode("ascii")
+# 分词用的字节映射表：大写转小写，字母数字和撇号保留，其余字节都变成空格
+_KEEP = (string.ascii_lowercase + string.digits + "'").encode("ascii")
+_TOKEN_TABLE = bytes(
+    c if c in _KEEP else (c + 32 if 65 <= c <= 90 else 32)
+    for c in range(256)
+)
+
+
+def _encode(text: str) -> bytes:
+    """非ASCII字符（emoji等）编码成 "?"，弯引号先统一为撇号"""
+    if not text.isascii():
+        text = text.replace("’", "'")
+    return text.encode("ascii", "replace")
+
+
+def _tokenize(text: str) -> List[bytes]:
+    """
+    小写分词（按词匹配避免 "sunday" 命中 "sundays" 这类片段）
+
+    在bytes上用 translate + split 完成（都是C实现）；"?" 和标点一样成为分隔符
+    """
+    return _encode(text).translate(_TOKEN_TABLE).split()
+
+
+class PhraseMatcher:
+    """按词的 Aho-Corasick 多模式匹配（一次扫描匹配全部短语，与短语数量无关）"""
+
+    def __init__(self, phrases: Dict[str, str]):
+        """
+        Args:
+            phrases: {短语: 规则名}
+        """
+        self._goto: List[Dict[bytes, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[str]] = [[]]
+
+        for phrase, rule in phrases.items():
+            tokens = _tokenize(phrase)
+            if not tokens:
+                continue
+            state = 0
+            for token in tokens:
+                if token not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][token] = len(self._goto) - 1
+                state = self._goto[state][token]
+            self._out[state].append(f"{rule}:{phrase}")
+        self.first_tokens = frozenset(self._goto[0])
+        self.last_tokens = frozenset(
+            tokens[-1] for tokens in map(_tokenize, phrases) if tokens
+        )
+
+        # BFS构建失败指针，并合并输出（后缀短语也能匹配）
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(token, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def scan(self, tokens: List[bytes]) -> List[str]:
+        """返回命中的 "规则名:短语" 列表"""
+        if self.last_tokens.isdisjoint(tokens) or self.first_tokens.isdisjoint(tokens):
+            return []
+        goto, fail, out = self._goto, self._fail, self._out
+        hits = []
+        state = 0
+        for token in tokens:
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            if out[state]:
+                hits.extend(out[state])
+        return hits
+
+
+class ContentRuleScanner:
+    """推文内容规则扫描器"""
+
+    def __init__(self, rules: Dict):
+        """
+        Args:
+            rules: content_rules.yaml 的内容
+                {"phrases": {规则名: [短语]}, "digit_patterns": {规则名: 正则}}
+        """
+        phrases = {}
+        for rule, rule_phrases in (rules.get("phrases") or {}).items():
+            for phrase in rule_phrases:
+                phrases[phrase.lower()] = rule
+        self.matcher = PhraseMatcher(phrases)
+        self.digit_patterns = [
+            (rule, re.compile(pattern, re.IGNORECASE))
+            for rule, pattern in (rules.get("digit_patterns") or {}).items()
+        ]
+
+    @classmethod
+    def from_file(cls, rules_file: Optional[str] = None) -> "ContentRuleScanner":
+        """从规则文件构建"""
+        with open(rules_file or DEFAULT_RULES_FILE, 'r', encoding='utf-8') as f:
+            return cls(yaml.safe_load(f) or {})
+
+    def scan(self, text: str) -> List[str]:
+        """
+        扫描推文文本
+
+        Returns:
+            违规列表（"规则名:命中内容"，去重保序），无违规时为空列表
+        """
+        if not text:
+            return []
+        encoded = _encode(text)
+        hits = self.matcher.scan(encoded.translate(_TOKEN_TABLE).split())
+        # 在bytes上删掉数字、比较长度判断是否含数字（比 \d 正则快几倍；时间戳/日期规则只针对ASCII数字）
+        if self.digit_patterns and len(encoded.translate(None, _DIGITS)) != len(encoded):
+            for rule, pattern in self.digit_patterns:
+                match = pattern.search(text)
+                if match:
+                    hits.append(f"{rule}:{match.group(0)}")
+        return list(dict.fromkeys(hits)) if hits else hits
+
+
+_rule_scanner = None
+
+
+def get_rule_scanner() -> ContentRuleScanner:
+    """获取全局ContentRuleScanner实例（规则文件只编译一次）"""
+    global _rule_scanner
+    if _rule_scanner is None:
+        _rule_scanner = ContentRuleScanner.from_file()
+    return _rule_scanner
@@ -0,0 +1,158 @@
+"""
+跨人设的公平调度 - 加权赤字轮询（Deficit Round Robin）
+多个人设共用一个 LLMClientPool 时，每个人设（租户）的请求进入自己的队列，
+有空闲并发槽位时按权重轮流放行：大批量人设排再多请求，小任务也能按份额立刻拿到槽位。
+
+请求属于哪个人设由 contextvar 决定：在人设的任务里 `with tenant("xxx"):`，
+其中（及其创建的子任务中）发出的所有LLM请求都计入该人设。
+"""
+import asyncio
+import contextvars
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Deque, Dict, Optional
+
+DEFAULT_TENANT = "default"
+
+current_tenant: contextvars.ContextVar = contextvars.ContextVar("llm_tenant", default=DEFAULT_TENANT)
+
+
+@contextmanager
+def tenant(name: str):
+    """把当前上下文中的LLM请求归属到指定租户（人设）"""
+    token = current_tenant.set(name)
+    try:
+        yield
+    finally:
+        current_tenant.reset(token)
+
+
+class FairShareScheduler:
+    """
+    加权DRR准入控制
+
+    同时放行的请求数不超过 capacity()（通常为LLM池当前并发上限）；
+    有积压时每轮给队首租户加 weight 的额度，每放行一个请求消耗1，额度不足即轮到下一个租户。
+    """
+
+    def __init__(self, capacity: Callable[[], int], weights: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            capacity: 返回当前可同时放行的请求数
+            weights: {租户: 权重}，未配置的租户权重为1
+        """
+        self._capacity = capacity
+        self.weights: Dict[str, float] = dict(weights or {})
+        self._queues: Dict[str, Deque[asyncio.Future]] = {}
+        self._ring: Deque[str] = deque()  # 有积压的租户，队首为当前轮到的
+        self._deficit: Dict[str, float] = {}
+        self._active = 0
+        self._stats: Dict[str, Dict] = {}
+
+    def set_weight(self, name: str, weight: float) -> None:
+        """设置租户权重（>0）"""
+        if weight <= 0:
+            raise ValueError(f"权重必须大于0: {name}={weight}")
+        self.weights[name] = weight
+
+    def _tenant_stats(self, name: str) -> Dict:
+        if name not in self._stats:
+            self._stats[name] = {
+                "requests": 0, "completed": 0, "wait_seconds": 0.0,
+                "first_start": None, "last_end": None
+            }
+        return self._stats[name]
+
+    def _dispatch(self) -> None:
+        """在容量内按DRR放行排队的请求"""
+        while self._ring and self._active < self._capacity():
+            name = self._ring[0]
+            queue = self._queues[name]
+
+            if self._deficit[name] < 1:
+                self._deficit[name] += self.weights.get(name, 1.0)
+                if self._deficit[name] < 1:
+                    self._ring.rotate(-1)
+                    continue
+
+            waiter = queue.popleft()
+            if not waiter.done():  # 已取消的等待者不消耗额度
+                waiter.set_result(None)
+                self._active += 1
+                self._deficit[name] -= 1
+
+            if not queue:
+                self._ring.popleft()
+                self._deficit[name] = 0.0
+            elif self._deficit[name] < 1:
+                self._ring.rotate(-1)
+
+    async def acquire(self, name: str) -> None:
+        """为租户获取一个放行名额（排队期间按DRR与其他租户轮流）"""
+        stats = self._tenant_stats(name)
+        stats["requests"] += 1
+        start = time.monotonic()
+
+        if not self._ring and self._active < self._capacity():
+            self._active += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            if name not in self._queues or not self._queues[name]:
+                self._queues[name] = deque()
+                self._deficit[name] = 0.0
+                self._ring.append(name)
+            self._queues[name].append(waiter)
+            self._dispatch()
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self.release()  # 已放行但调用方被取消，归还名额
+                raise
+
+        now = time.monotonic()
+        stats["wait_seconds"] += now - start
+        if stats["first_start"] is None:
+            stats["first_start"] = now
+
+    def release(self, name: Optional[str] = None) -> None:
+        """归还名额（name 用于统计完成数）"""
+        self._active -= 1
+        if name is not None:
+            stats = self._tenant_stats(name)
+            stats["completed"] += 1
+            stats["last_end"] = time.monotonic()
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, name: Optional[str] = None):
+        """占用一个名额（默认使用当前上下文的租户）"""
+        name = name or current_tenant.get()
+        await self.acquire(name)
+        try:
+            yield
+        finally:
+            self.release(name)
+
+    @property
+    def backlog(self) -> int:
+        """排队中的请求数"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """各租户统计：请求数、平均排队时间、活跃时长和请求吞吐"""
+        report = {}
+        for name, stats in self._stats.items():
+            span = 0.0
+            if stats["first_start"] is not None and stats["last_end"] is not None:
+                span = max(stats["last_end"] - stats["first_start"], 1e-6)
+            report[name] = {
+                "weight": self.weights.get(name, 1.0),
+                "requests": stats["requests"],
+                "completed": stats["completed"],
+                "avg_wait_seconds": round(stats["wait_seconds"] / max(stats["requests"], 1), 3),
+                "active_seconds": round(span, 2),
+                "requests_per_second": round(stats["completed"] / span, 2) if span else 0.0
+            }
+        return report
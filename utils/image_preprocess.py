@@ -0,0 +1,189 @@
+"""
+人设图片预处理
+原图（常见为几MB的照片）解码、缩放到最长边 max_side、编码为 JPEG/WebP 后作为 data URL 发给视觉模型：
+上传更快，视觉token更少。解码/缩放/编码在线程池中完成，不阻塞事件循环；
+编码结果按 "原图内容哈希 + 预处理参数" 缓存（内存 + 可选磁盘目录），同一图片只处理一次。
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import tempfile
+from concurrent.futures import Executor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+FORMATS = {"jpeg": ("JPEG", "image/jpeg", "jpg"), "webp": ("WEBP", "image/webp", "webp")}
+
+
+def file_sha256(path: str) -> str:
+    """文件内容的SHA256（分块读取）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def encode_image(path: str, max_side: int, image_format: str, quality: int) -> bytes:
+    """
+    解码、按EXIF方向旋正、缩放到最长边不超过 max_side，编码为 JPEG/WebP
+
+    模块级函数，可以直接提交给进程池
+    """
+    pil_format = FORMATS[image_format][0]
+    with Image.open(path) as img:
+        img = ImageOps.exif_transpose(img)
+        if max(img.size) > max_side:
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            if pil_format == "JPEG":  # JPEG不支持透明通道，铺白底
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel("A"))
+                img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+
+        buffered = io.BytesIO()
+        img.save(buffered, format=pil_format, quality=quality)
+        return buffered.getvalue()
+
+
+def load_or_encode(
+    path: str,
+    cache_file: Optional[str],
+    max_side: int,
+    image_format: str,
+    quality: int
+) -> Tuple[bytes, bool]:
+    """读磁盘缓存，未命中则编码并写入缓存；返回 (编码结果, 是否命中磁盘缓存)"""
+    if cache_file is not None and os.path.exists(cache_file):
+        with open(cache_file, 'rb') as f:
+            return f.read(), True
+
+    payload = encode_image(path, max_side, image_format, quality)
+    if cache_file is not None:
+        cache_dir = os.path.dirname(cache_file)
+        os.makedirs(cache_dir, exist_ok=True)
+        # 同一进程内多个预处理器（如每个任务一个协调器）共享缓存目录，临时文件名不能只靠pid区分
+        with tempfile.NamedTemporaryFile(dir=cache_dir, prefix=".encode.", suffix=".tmp", delete=False) as f:
+            f.write(payload)
+        try:
+            os.replace(f.name, cache_file)
+        except OSError:
+            os.unlink(f.name)
+            raise
+    return payload, False
+
+
+class ImagePreprocessor:
+    """图片预处理与缓存（线程池执行，按原图哈希缓存编码结果）"""
+
+    def __init__(
+        self,
+        max_side: int = 1536,
+        image_format: str = "jpeg",
+        quality: int = 90,
+        cache_dir: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        executor: Optional[Executor] = None
+    ):
+        """
+        Args:
+            max_side: 最长边像素（更大的图片等比缩小）
+            image_format: "jpeg" 或 "webp"
+            quality: 编码质量（1-100）
+            cache_dir: 编码结果的磁盘缓存目录（None则只缓存在内存中）
+            max_workers: 线程池大小（默认CPU核数）
+            executor: 自定义执行器（如 ProcessPoolExecutor），传入时忽略 max_workers
+        """
+        image_format = image_format.lower()
+        if image_format not in FORMATS:
+            raise ValueError(f"不支持的图片格式: {image_format}（可选: {', '.join(FORMATS)}）")
+        if max_side < 64:
+            raise ValueError(f"max_side 过小: {max_side}")
+        self.max_side = max_side
+        self.image_format = image_format
+        self.quality = quality
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=max_workers or os.cpu_count() or 4,
+            thread_name_prefix="image-preprocess"
+        )
+        self._hashes: Dict[Tuple[str, int, int], str] = {}  # (路径, mtime_ns, size) -> 内容哈希
+        self._payloads: Dict[str, str] = {}  # 缓存key -> data URL
+        self._pending: Dict[str, asyncio.Future] = {}  # 正在处理的缓存key（并发请求同一图片只处理一次）
+        self.stats = {"encoded": 0, "memory_hits": 0, "disk_hits": 0, "source_bytes": 0, "encoded_bytes": 0}
+
+    @property
+    def mime_type(self) -> str:
+        return FORMATS[self.image_format][1]
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def source_hash(self, path: str) -> str:
+        """原图内容哈希（按路径+修改时间+大小记住，同一文件只读一次）"""
+        stat = os.stat(path)
+        file_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        if file_key not in self._hashes:
+            self._hashes[file_key] = await self._run(file_sha256, path)
+        return self._hashes[file_key]
+
+    def _cache_key(self, source_hash: str) -> str:
+        return f"{source_hash[:32]}_{self.max_side}_q{self.quality}.{FORMATS[self.image_format][2]}"
+
+    async def data_url(self, path: str) -> str:
+        """预处理后的图片 data URL（命中缓存时不重新解码）"""
+        cache_key = self._cache_key(await self.source_hash(path))
+        if cache_key in self._payloads:
+            self.stats["memory_hits"] += 1
+            return self._payloads[cache_key]
+        if cache_key in self._pending:
+            return await asyncio.shield(self._pending[cache_key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[cache_key] = future
+        try:
+            cache_file = str(self.cache_dir / cache_key) if self.cache_dir else None
+            payload, disk_hit = await self._run(
+                load_or_encode, path, cache_file, self.max_side, self.image_format, self.quality
+            )
+            url = f"data:{self.mime_type};base64,{base64.b64encode(payload).decode('ascii')}"
+            self._payloads[cache_key] = url
+            self.stats["disk_hits" if disk_hit else "encoded"] += 1
+            self.stats["source_bytes"] += os.path.getsize(path)
+            self.stats["encoded_bytes"] += len(payload)
+            future.set_result(url)
+            return url
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # 没有其他等待者时不报 "exception was never retrieved"
+            raise
+        finally:
+            del self._pending[cache_key]
+
+    async def prepare_many(self, paths: List[str]) -> Dict[str, Optional[str]]:
+        """
+        并行预处理一批图片（结果进入缓存，之后的 data_url 直接命中）
+
+        Returns:
+            {路径: 错误信息}，成功的图片错误信息为None
+        """
+        results = await asyncio.gather(*[self.data_url(path) for path in paths], return_exceptions=True)
+        return {
+            path: (str(result) if isinstance(result, Exception) else None)
+            for path, result in zip(paths, results)
+        }
+
+    def close(self) -> None:
+        """关闭执行器"""
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,199 @@
+"""
+LLM 响应缓存 - 按请求内容寻址的本地SQLite缓存
+相同的 model + messages + temperature + max_tokens (+ namespace) 直接回放历史响应，
+用于重跑、回归测试等场景，避免重复调用付费API
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = "cache/llm_cache.sqlite"
+
+
+class LLMResponseCache:
+    """
+    内容寻址的LLM响应缓存（SQLite，按总大小LRU淘汰，支持TTL）
+
+    同一进程内相同请求的第N次调用对应第N条缓存，
+    因此高温度下重复的prompt仍得到不同的结果，而重跑时按相同顺序回放。
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        max_bytes: int = 512 * 1024 * 1024,
+        ttl: Optional[float] = None,
+        namespace: str = ""
+    ):
+        """
+        Args:
+            path: SQLite文件路径
+            max_bytes: 缓存响应的总大小上限（超出时淘汰最久未访问的条目）
+            ttl: 条目有效期（秒），None=永久
+            namespace: 命名空间/seed，不同命名空间的缓存互不命中
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.namespace = namespace
+
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses(accessed_at)")
+        self._conn.commit()
+
+        self._occurrences = Counter()
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+        # 统计
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["LLMResponseCache"]:
+        """
+        根据环境变量创建缓存（LLM_CACHE=1 时启用）
+
+        LLM_CACHE_PATH / LLM_CACHE_MAX_MB / LLM_CACHE_TTL(秒) / LLM_CACHE_NAMESPACE 可选
+        """
+        if os.getenv("LLM_CACHE", "").lower() not in ("1", "true", "yes"):
+            return None
+        ttl = os.getenv("LLM_CACHE_TTL")
+        return cls(
+            path=os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH),
+            max_bytes=int(os.getenv("LLM_CACHE_MAX_MB", "512")) * 1024 * 1024,
+            ttl=float(ttl) if ttl else None,
+            namespace=os.getenv("LLM_CACHE_NAMESPACE", "")
+        )
+
+    def make_key(
+        self,
+        model: str,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: int
+    ) -> str:
+        """
+        计算请求的缓存键（同一请求在本进程内每调用一次，序号加一）
+
+        Returns:
+            sha256十六进制字符串
+        """
+        payload = json.dumps(
+            {
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "namespace": self.namespace
+            },
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        base = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        occurrence = self._occurrences[base]
+        self._occurrences[base] += 1
+        return hashlib.sha256(f"{base}:{occurrence}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存（过期条目视为未命中并删除）"""
+        row = self._conn.execute(
+            "SELECT response, size, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+
+        if row is not None and self.ttl is not None and now - row[2] > self.ttl:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+            self._total_bytes -= row[1]
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+        self.hits += 1
+        return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        """写入缓存，超出大小上限时按LRU淘汰"""
+        if response is None:
+            return
+        size = len(response.encode("utf-8"))
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, size, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, response, size, now, now)
+        )
+        self._conn.commit()
+        self._total_bytes += size
+        self.writes += 1
+
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self) -> None:
+        """淘汰最久未访问的条目，直到总大小降到上限的90%"""
+        # 其他进程可能也在写同一个文件，以数据库实际大小为准
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        target = self.max_bytes * 0.9
+        if self._total_bytes <= target:
+            return
+
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+        )
+        victims = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            victims.append((key,))
+            self._total_bytes -= size
+
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self._conn.commit()
+        self.evictions += len(victims)
+        logger.info(f"LLM缓存淘汰 {len(victims)} 条 (当前 {self._total_bytes / 1024 / 1024:.1f}MB)")
+
+    def get_stats(self) -> Dict:
+        """命中率等统计"""
+        lookups = self.hits + self.misses
+        return {
+            "path": str(self.path),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "size_mb": round(self._total_bytes / 1024 / 1024, 2)
+        }
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        self._conn.close()
@@ -4,10 +4,12 @@
 """
 import asyncio
 import json
+import logging
 import time
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 
 try:
+    import openai
     from openai import AsyncOpenAI
     HAS_OPENAI = True
 except ImportError:
@@ -16,6 +18,85 @@ except ImportError:
 
 import aiohttp
 
+from .llm_cache import LLMResponseCache
+from .rate_limiter import TokenBucket, AdaptiveConcurrencyLimiter
+from .fair_scheduler import FairShareScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class LLMRateLimitError(RuntimeError):
+    """LLM API 返回429（限流）"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMTransientError(RuntimeError):
+    """可重试的临时错误（网络错误、超时等）"""
+
+
+def _parse_retry_after(headers) -> Optional[float]:
+    """解析 Retry-After / retry-after-ms 响应头（秒）"""
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            # HTTP-date 格式
+            try:
+                from email.utils import parsedate_to_datetime
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+class _StreamText:
+    """
+    流式响应的累计文本：增量先存入列表，只在收到的内容完成一行时拼接并调用 on_text
+    （逐块 text += delta 对长响应是平方复杂度；TweetStreamParser 也只在行结束时推进）
+    """
+
+    def __init__(self, on_text: Callable[[str], bool]):
+        self.on_text = on_text
+        self._chunks: List[str] = []
+        self._unreported = False
+
+    @property
+    def text(self) -> str:
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def add(self, delta: str) -> bool:
+        """追加增量；完成一行时回调，返回True表示应终止流"""
+        self._chunks.append(delta)
+        if "\n" not in delta:
+            self._unreported = True
+            return False
+        self._unreported = False
+        return self.on_text(self.text)
+
+    def finish(self) -> str:
+        """流结束：最后一行没有换行时补一次回调，返回完整文本"""
+        text = self.text
+        if self._unreported:
+            self._unreported = False
+            self.on_text(text)
+        return text
+
 
 class AsyncLLMClient:
     """异步 LLM 客户端 - 支持高并发"""
@@ -24,18 +105,39 @@ class AsyncLLMClient:
         self,
         api_key: str,
         api_base: str = "https://api.openai.com/v1",
-        model: str = "gpt-4"
+        model: str = "gpt-4",
+        max_connections: int = 100,
+        retry_on_rate_limit: bool = True,
+        cache: Optional[LLMResponseCache] = None
     ):
+        """
+        Args:
+            api_key: API密钥
+            api_base: API地址
+            model: 模型名称
+            max_connections: aiohttp连接池大小（单host上限）
+            retry_on_rate_limit: 收到429时是否在客户端内部退避重试
+                （由LLMClientPool统一处理限流时设为False，429直接抛出LLMRateLimitError）
+            cache: 可选的本地响应缓存（命中时不调用API）
+        """
         self.api_key = api_key
         self.api_base = api_base.rstrip('/')
         self.model = model
+        self.max_connections = max_connections
+        self.retry_on_rate_limit = retry_on_rate_limit
+        self.cache = cache
+        self.max_retries = 3
+        self.base_delay = 1  # 秒
 
-        # 使用异步 OpenAI SDK
+        # aiohttp长连接会话（懒创建，需在事件循环内创建；用完调用 aclose()）
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        # 使用异步 OpenAI SDK（重试由 generate() 统一处理，SDK内部不再重试）
         if HAS_OPENAI:
             self.client = AsyncOpenAI(
                 api_key=api_key,
                 base_url=api_base,
-                max_retries=3,
+                max_retries=0,
                 timeout=180.0
             )
             self.use_sdk = True
@@ -43,38 +145,129 @@ class AsyncLLMClient:
             self.client = None
             self.use_sdk = False
 
+    def _get_session(self) -> aiohttp.ClientSession:
+        """获取（必要时创建）长连接会话，复用TCP/TLS连接"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections,
+                ttl_dns_cache=300,        # DNS缓存5分钟
+                keepalive_timeout=60      # 空闲连接保持60秒
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def aclose(self) -> None:
+        """关闭底层HTTP连接（aiohttp会话和OpenAI SDK客户端）"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+        if self.client is not None:
+            await self.client.close()
+
     async def generate(
         self,
         messages: List[Dict[str, str]],
         temperature: float = 0.7,
         max_tokens: int = 3000,
-        timeout: int = 180
+        timeout: int = 180,
+        on_text: Optional[Callable[[str], bool]] = None
     ) -> str:
         """
-        异步生成文本
+        异步生成文本（带重试机制）
 
         Args:
             messages: 消息列表 [{"role": "system", "content": "..."}]
             temperature: 温度参数
             max_tokens: 最大token数
             timeout: 超时时间（秒）
+            on_text: 提供时使用流式响应；收到的内容每完成一行（及流结束时）以当前累计文本调用一次，
+                返回True则立即终止流（不再为后续token付费）。重试时累计文本从头开始
 
         Returns:
-            生成的文本
+            生成的文本（提前终止时为终止前已收到的部分）
         """
-        if self.use_sdk:
-            return await self._generate_with_sdk(messages, temperature, max_tokens)
-        else:
-            return await self._generate_with_aiohttp(messages, temperature, max_tokens, timeout)
+        if self.cache is None:
+            return await self._generate_with_retry(messages, temperature, max_tokens, timeout, on_text)
+
+        cache_key = self.cache.make_key(self.model, messages, temperature, max_tokens)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            if on_text is not None:
+                on_text(cached)
+            return cached
+
+        result = await self._generate_with_retry(messages, temperature, max_tokens, timeout, on_text)
+        self.cache.put(cache_key, result)
+        return result
+
+    async def _generate_with_retry(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        timeout: int,
+        on_text: Optional[Callable[[str], bool]] = None
+    ) -> str:
+        """带重试的生成（429 / 网络错误按指数退避）"""
+        for attempt in range(self.max_retries):
+            is_last = attempt == self.max_retries - 1
+            try:
+                if self.use_sdk:
+                    return await self._generate_with_sdk(messages, temperature, max_tokens, on_text)
+                return await self._generate_with_aiohttp(
+                    messages, temperature, max_tokens, timeout, on_text
+                )
+
+            except LLMRateLimitError as e:
+                if not self.retry_on_rate_limit:
+                    raise
+                if is_last:
+                    raise LLMRateLimitError(
+                        f"LLM API rate limit after {self.max_retries} retries: {e}", e.retry_after
+                    )
+                delay = e.retry_after or self.base_delay * (2 ** attempt)  # 优先遵守Retry-After
+                logger.warning(f"Rate limit hit, retrying in {delay}s...")
+                await asyncio.sleep(delay)
+
+            except LLMTransientError as e:
+                if is_last:
+                    raise RuntimeError(f"LLM调用失败(重试{self.max_retries}次): {e}")
+                delay = self.base_delay * (2 ** attempt)
+                logger.warning(f"Request failed: {e}, retrying in {delay}s...")
+                await asyncio.sleep(delay)
+
+        raise RuntimeError("LLM调用失败:超过最大重试次数")
 
     async def _generate_with_sdk(
         self,
         messages: List[Dict],
         temperature: float,
-        max_tokens: int
+        max_tokens: int,
+        on_text: Optional[Callable[[str], bool]] = None
     ) -> str:
-        """使用 OpenAI SDK 异步生成"""
+        """使用 OpenAI SDK 异步生成（单次尝试）"""
         try:
+            if on_text is not None:
+                stream = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True
+                )
+                text = _StreamText(on_text)
+                try:
+                    async for chunk in stream:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta and text.add(delta):
+                            return text.text
+                finally:
+                    # 提前终止时关闭连接，服务端随即停止生成
+                    await stream.close()
+                return text.finish()
+
             response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
@@ -83,6 +276,10 @@ class AsyncLLMClient:
             )
             return response.choices[0].message.content
 
+        except openai.RateLimitError as e:
+            raise LLMRateLimitError(str(e), _parse_retry_after(e.response.headers))
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            raise LLMTransientError(str(e))
         except Exception as e:
             raise RuntimeError(f"LLM 调用失败: {e}")
 
@@ -91,15 +288,10 @@ class AsyncLLMClient:
         messages: List[Dict],
         temperature: float,
         max_tokens: int,
-        timeout: int
+        timeout: int,
+        on_text: Optional[Callable[[str], bool]] = None
     ) -> str:
-        """使用 aiohttp 异步调用（带重试机制）"""
-        import logging
-        logger = logging.getLogger(__name__)
-
-        max_retries = 3
-        base_delay = 1  # 秒
-
+        """使用 aiohttp 异步调用（单次尝试）"""
         url = f"{self.api_base}/chat/completions"
         headers = {
             "Authorization": f"Bearer {self.api_key}",
@@ -111,64 +303,406 @@ class AsyncLLMClient:
             "temperature": temperature,
             "max_tokens": max_tokens
         }
+        if on_text is not None:
+            payload["stream"] = True
 
-        for attempt in range(max_retries):
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(
-                        url,
-                        headers=headers,
-                        json=payload,
-                        timeout=aiohttp.ClientTimeout(total=timeout)
-                    ) as resp:
-                        # 处理 rate limit
-                        if resp.status == 429:
-                            if attempt < max_retries - 1:
-                                delay = base_delay * (2 ** attempt)  # 指数退避
-                                logger.warning(f"Rate limit hit, retrying in {delay}s...")
-                                await asyncio.sleep(delay)
-                                continue
-                            else:
-                                error_text = await resp.text()
-                                raise RuntimeError(f"LLM API rate limit after {max_retries} retries: {error_text}")
-
-                        if resp.status != 200:
-                            error_text = await resp.text()
-                            raise RuntimeError(f"LLM API 错误 {resp.status}: {error_text}")
-
-                        data = await resp.json()
-                        return data["choices"][0]["message"]["content"]
-
-            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-                if attempt < max_retries - 1:
-                    delay = base_delay * (2 ** attempt)
-                    logger.warning(f"Request failed: {e}, retrying in {delay}s...")
-                    await asyncio.sleep(delay)
-                else:
-                    raise RuntimeError(f"LLM调用失败(重试{max_retries}次): {e}")
+        session = self._get_session()
 
-        raise RuntimeError("LLM调用失败:超过最大重试次数")
+        try:
+            async with session.post(
+                url,
+                headers=headers,
+                json=payload,
+                timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as resp:
+                # 处理 rate limit
+                if resp.status == 429:
+                    error_text = await resp.text()
+                    raise LLMRateLimitError(
+                        f"LLM API rate limit: {error_text}",
+                        _parse_retry_after(resp.headers)
+                    )
+
+                if resp.status != 200:
+                    error_text = await resp.text()
+                    raise RuntimeError(f"LLM API 错误 {resp.status}: {error_text}")
+
+                if on_text is not None:
+                    # 退出 async with 时未读完的响应会直接断开连接
+                    return await self._read_sse(resp, on_text)
+
+                data = await resp.json()
+                return data["choices"][0]["message"]["content"]
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise LLMTransientError(f"{type(e).__name__}: {e}")
+
+    @staticmethod
+    async def _read_sse(resp: aiohttp.ClientResponse, on_text: Callable[[str], bool]) -> str:
+        """
+        逐行读取 SSE 流（data: {...} / data: [DONE]），累计 delta 内容
+
+        无法解析的 data 帧（心跳、被截断的帧）跳过，不丢弃整个响应
+        """
+        text = _StreamText(on_text)
+        async for raw in resp.content:
+            line = raw.decode("utf-8", "replace").strip()
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+
+            try:
+                frame = json.loads(data)
+            except json.JSONDecodeError:
+                if data:
+                    logger.debug(f"跳过无法解析的SSE帧: {data[:80]}")
+                continue
+            choices = (frame.get("choices") if isinstance(frame, dict) else None) or []
+            delta = choices[0].get("delta", {}).get("content") if choices else None
+            if delta and text.add(delta):
+                return text.text
+        return text.finish()
 
 
 class LLMClientPool:
-    """LLM 客户端池 - 支持并发限流"""
+    """
+    LLM 客户端池 - 全局并发调度器
+
+    所有生成器（推文/人设/calendar）都应通过同一个池调用LLM，
+    这样 max_concurrent / RPM / TPM 才是真正的上限。
+    """
 
     def __init__(
         self,
         api_key: str,
         api_base: str,
         model: str,
-        max_concurrent: int = 10
+        max_concurrent: int = 10,
+        rpm_limit: Optional[int] = None,
+        tpm_limit: Optional[int] = None,
+        adaptive_concurrency: bool = False,
+        min_concurrent: int = 1,
+        max_rate_limit_retries: int = 5,
+        endpoints: Optional[str] = None,
+        hedge: bool = False,
+        hedge_budget: float = 0.05,
+        cache: Optional[LLMResponseCache] = None
     ):
-        self.client = AsyncLLMClient(api_key, api_base, model)
-        self.semaphore = asyncio.Semaphore(max_concurrent)
+        """
+        Args:
+            api_key: API密钥（多个key用逗号分隔即启用多端点路由）
+            api_base: API地址（单个，或与key一一对应的逗号列表）
+            model: 模型名称（单个，或与key一一对应的逗号列表）
+            max_concurrent: 最大并发请求数（自适应模式下为上限）
+            rpm_limit: 每分钟请求数上限（None=不限制）
+            tpm_limit: 每分钟token数上限（None=不限制，按 prompt估算 + max_tokens 计）
+            adaptive_concurrency: 是否启用AIMD自适应并发（根据429和p95延迟自动调整）
+            min_concurrent: 自适应模式下的并发下限
+            max_rate_limit_retries: 单个请求遇到429时的最大重试次数
+            endpoints: 多端点配置（JSON字符串或文件路径，含weight/max_concurrent），优先于前三项
+            hedge: 对冲请求：耗时超过当前p95仍未返回时，利用空闲槽位发一个重复请求，先返回者胜出
+            hedge_budget: 最多允许对冲的请求比例（0~1）
+            cache: 可选的本地响应缓存，命中时不占用并发槽位和限流令牌（由调用方负责关闭）
+        """
+        from .llm_router import LLMRouter, parse_llm_endpoints
+
+        # 支持多端点（逗号分隔的key/base/model，或LLM_ENDPOINTS JSON）
+        self.endpoints = parse_llm_endpoints(api_key, api_base, model, endpoints)
+        if len(self.endpoints) > 1:
+            self.client = LLMRouter(self.endpoints)
+        else:
+            # 429由池统一处理（全局降并发 + 遵守Retry-After），客户端不再各自退避
+            endpoint = self.endpoints[0]
+            self.client = AsyncLLMClient(
+                endpoint["api_key"], endpoint["api_base"], endpoint["model"],
+                max_connections=max_concurrent,
+                retry_on_rate_limit=False
+            )
+        self.max_concurrent = max_concurrent
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.hedge = hedge
+        self.hedge_budget = hedge_budget
+        self.cache = cache
+        self.limiter = AdaptiveConcurrencyLimiter(
+            initial_limit=max_concurrent,
+            min_limit=min_concurrent if adaptive_concurrency else max_concurrent,
+            max_limit=max_concurrent
+        )
+
+        self.rpm_bucket = TokenBucket(rpm_limit) if rpm_limit else None
+        self.tpm_bucket = TokenBucket(tpm_limit) if tpm_limit else None
+        self.scheduler: Optional[FairShareScheduler] = None
+
+        # 运行时计数
+        self._waiting = 0
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._throttle_wait = 0.0
+        self._requests = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+
+    async def aclose(self) -> None:
+        """释放底层HTTP连接"""
+        await self.client.aclose()
+
+    def enable_fair_share(self, weights: Optional[Dict[str, float]] = None) -> FairShareScheduler:
+        """
+        启用跨人设公平调度：请求按 utils.fair_scheduler.tenant() 标记的人设分队列，
+        按权重DRR轮流占用并发槽位（同时放行数 = 当前并发上限）
+        """
+        if self.scheduler is None:
+            self.scheduler = FairShareScheduler(lambda: self.limiter.limit, weights)
+        else:
+            for name, weight in (weights or {}).items():
+                self.scheduler.set_weight(name, weight)
+        return self.scheduler
+
+    @property
+    def queue_depth(self) -> int:
+        """等待调度的请求数（等待并发槽位或限流令牌）"""
+        return self._waiting
+
+    @property
+    def in_flight(self) -> int:
+        """正在执行的请求数"""
+        return self._in_flight
+
+    @property
+    def current_limit(self) -> int:
+        """当前生效的并发上限（自适应模式下随运行情况变化）"""
+        return self.limiter.limit
+
+    def get_stats(self) -> Dict:
+        """获取调度器实时统计"""
+        p95 = self.limiter.latency_p95()
+        return {
+            "max_concurrent": self.max_concurrent,
+            "current_limit": self.limiter.limit,
+            "adaptive": self.limiter.adaptive,
+            "limit_increases": self.limiter.increases,
+            "limit_decreases": self.limiter.decreases,
+            "rate_limited": self.limiter.rate_limited,
+            "latency_p95": round(p95, 2) if p95 is not None else None,
+            "queue_depth": self._waiting,
+            "in_flight": self._in_flight,
+            "peak_in_flight": self._peak_in_flight,
+            "completed": self._completed,
+            "failed": self._failed,
+            "throttle_wait_seconds": round(self._throttle_wait, 2),
+            "hedged": self._hedged,
+            "hedge_wins": self._hedge_wins,
+            "cache": self.cache.get_stats() if self.cache is not None else None,
+            "tenants": self.scheduler.get_stats() if self.scheduler is not None else None,
+            "backends": self.client.get_stats() if len(self.endpoints) > 1 else None
+        }
+
+    @staticmethod
+    def _estimate_tokens(messages: List[Dict], max_tokens: int) -> int:
+        """粗略估算一次请求消耗的token（约4字符/token，图片按固定值计）"""
+        chars = 0
+        images = 0
+        for message in messages:
+            content = message.get("content", "")
+            if isinstance(content, str):
+                chars += len(content)
+            elif isinstance(content, list):
+                for part in content:
+                    if part.get("type") == "text":
+                        chars += len(part.get("text", ""))
+                    elif part.get("type") == "image_url":
+                        images += 1
+        return chars // 4 + images * 1000 + max_tokens
 
     async def generate(
         self,
         messages: List[Dict],
         temperature: float = 0.7,
-        max_tokens: int = 3000
+        max_tokens: int = 3000,
+        timeout: int = 180,
+        on_text: Optional[Callable[[str], bool]] = None
+    ) -> str:
+        """带并发限制、RPM/TPM限流和429自适应处理的生成（on_text 见 AsyncLLMClient.generate）"""
+        cache_key = None
+        if self.cache is not None:
+            # 在调度之前查缓存，命中不消耗并发槽位/RPM/TPM
+            cache_key = self.cache.make_key(self.client.model, messages, temperature, max_tokens)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                if on_text is not None:
+                    on_text(cached)
+                return cached
+
+        self._requests += 1
+        if self.scheduler is None:
+            return await self._generate_with_retries(messages, temperature, max_tokens, timeout, on_text, cache_key)
+        # 公平调度：先在本人设的队列里排到名额，再进入并发/限流控制
+        async with self.scheduler.slot():
+            return await self._generate_with_retries(messages, temperature, max_tokens, timeout, on_text, cache_key)
+
+    async def _generate_with_retries(
+        self,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: int,
+        timeout: int,
+        on_text: Optional[Callable[[str], bool]],
+        cache_key: Optional[str]
+    ) -> str:
+        """执行调用，429时重新排队重试"""
+        for attempt in range(self.max_rate_limit_retries + 1):
+            try:
+                result = await self._generate_hedged(
+                    messages, temperature, max_tokens, timeout, on_text
+                )
+                if cache_key is not None:
+                    self.cache.put(cache_key, result)
+                return result
+            except LLMRateLimitError as e:
+                if attempt >= self.max_rate_limit_retries:
+                    self._failed += 1
+                    raise
+                # 暂停时间已由limiter记录，下一次acquire会统一等待
+                logger.debug(f"Rate limited, re-queue (attempt {attempt + 1}): {e}")
+
+        raise RuntimeError("LLM调用失败:超过最大重试次数")
+
+    def _hedge_budget_left(self) -> bool:
+        """对冲次数是否还在预算内"""
+        return self._hedged < self.hedge_budget * self._requests
+
+    def _has_idle_slot(self) -> bool:
+        """有空闲并发槽位且无排队（对冲不和正常请求抢资源）"""
+        return self._waiting == 0 and self.limiter.active < self.limiter.limit
+
+    async def _generate_hedged(
+        self,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: int,
+        timeout: int,
+        on_text: Optional[Callable[[str], bool]] = None
+    ) -> str:
+        """
+        执行一次调用；启用对冲时，超过p95仍未返回则发出重复请求，
+        先成功的结果胜出，另一个被取消（流式调用不对冲）
+        """
+        if not self.hedge or on_text is not None:
+            return await self._generate_once(messages, temperature, max_tokens, timeout, on_text)
+
+        start = time.monotonic()
+        primary = asyncio.ensure_future(
+            self._generate_once(messages, temperature, max_tokens, timeout)
+        )
+        tasks = [primary]
+        try:
+            # 超过p95（样本不足时先等样本）且出现空闲槽位（通常是批次尾部）时才对冲
+            while True:
+                p95 = self.limiter.latency_p95()
+                elapsed = time.monotonic() - start
+                if p95 is not None and elapsed >= p95:
+                    if not self._hedge_budget_left():
+                        return await primary
+                    if self._has_idle_slot():
+                        break
+                    delay = max(0.05, p95 / 4)
+                else:
+                    delay = p95 - elapsed if p95 is not None else 0.5
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if done:
+                    return await primary
+
+            self._hedged += 1
+            logger.debug(f"LLM请求超过p95({p95:.1f}s)，发出对冲请求")
+            hedge = asyncio.ensure_future(
+                self._generate_once(messages, temperature, max_tokens, timeout)
+            )
+            tasks.append(hedge)
+
+            pending = set(tasks)
+            errors = {}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        errors[task] = task.exception()
+                winners = [task for task in done if task not in errors]
+                if winners:
+                    if hedge in winners and primary not in winners:
+                        self._hedge_wins += 1
+                    return winners[0].result()
+
+            # 都失败：优先抛出原请求的错误
+            raise errors.get(primary) or errors[hedge]
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _generate_once(
+        self,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: int,
+        timeout: int,
+        on_text: Optional[Callable[[str], bool]] = None
     ) -> str:
-        """带并发限制的生成"""
-        async with self.semaphore:
-            return await self.client.generate(messages, temperature, max_tokens)
+        """获取并发槽位和限流令牌后执行一次调用，并把结果反馈给limiter"""
+        self._waiting += 1
+        try:
+            await self.limiter.acquire()
+        finally:
+            self._waiting -= 1
+
+        try:
+            # 持有并发槽位后再等限流令牌，保证实际发出的请求不超过上限
+            if self.rpm_bucket or self.tpm_bucket:
+                self._waiting += 1
+                try:
+                    if self.rpm_bucket:
+                        self._throttle_wait += await self.rpm_bucket.acquire(1)
+                    if self.tpm_bucket:
+                        self._throttle_wait += await self.tpm_bucket.acquire(
+                            self._estimate_tokens(messages, max_tokens)
+                        )
+                finally:
+                    self._waiting -= 1
+
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+            start = time.monotonic()
+            try:
+                result = await self.client.generate(
+                    messages, temperature, max_tokens, timeout, on_text
+                )
+            except LLMRateLimitError as e:
+                # 没有Retry-After时按指数退避的起点暂停1秒
+                retry_after = e.retry_after if e.retry_after is not None else 1.0
+                if self.limiter.on_rate_limit(retry_after):
+                    logger.warning(
+                        f"LLM限流(429)，并发上限下调至 {self.limiter.limit} "
+                        f"(Retry-After={retry_after}s)"
+                    )
+                raise
+            except Exception:
+                self._failed += 1
+                raise
+            finally:
+                self._in_flight -= 1
+
+            self._completed += 1
+            change = self.limiter.on_success(time.monotonic() - start)
+            if change == "latency":
+                logger.warning(
+                    f"LLM p95延迟膨胀({self.limiter.latency_p95():.1f}s)，"
+                    f"并发上限下调至 {self.limiter.limit}"
+                )
+            elif change == "increase":
+                logger.info(f"LLM并发上限上调至 {self.limiter.limit}")
+            return result
+        finally:
+            await self.limiter.release()
@@ -0,0 +1,343 @@
+"""
+多端点 LLM 路由 - 多个 OpenAI 兼容 endpoint/key/model 之间的负载均衡
+按 EWMA延迟 + 错误率 + 当前负载 选择最空闲的健康后端，失败的后端冷却一段时间后再启用
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+from .llm_client import AsyncLLMClient, LLMRateLimitError
+
+logger = logging.getLogger(__name__)
+
+
+def parse_llm_endpoints(
+    api_key: str,
+    api_base: str = "https://api.openai.com/v1",
+    model: str = "gpt-4",
+    endpoints: Optional[str] = None
+) -> List[Dict]:
+    """
+    解析LLM端点配置（支持列表形式）
+
+    两种写法：
+    1. 逗号分隔：API_KEY="sk-a,sk-b"，API_BASE / MODEL 可以是单个值（所有key共用）
+       或与key数量一致的逗号列表
+    2. LLM_ENDPOINTS：JSON字符串或JSON文件路径，每项包含
+       api_key / api_base / model / weight / max_concurrent / name
+
+    Returns:
+        端点配置列表 [{"api_key", "api_base", "model", "weight", "max_concurrent", "name"}]
+    """
+    if endpoints:
+        raw = endpoints
+        if os.path.exists(endpoints):
+            with open(endpoints, 'r', encoding='utf-8') as f:
+                raw = f.read()
+        entries = json.loads(raw)
+        if isinstance(entries, dict):
+            entries = entries.get("endpoints", [])
+
+        result = []
+        for i, entry in enumerate(entries):
+            if not entry.get("api_key"):
+                raise ValueError(f"LLM_ENDPOINTS 第{i + 1}项缺少 api_key")
+            result.append({
+                "api_key": entry["api_key"],
+                "api_base": entry.get("api_base", api_base),
+                "model": entry.get("model", model),
+                "weight": float(entry.get("weight", 1.0)),
+                "max_concurrent": entry.get("max_concurrent"),
+                "name": entry.get("name") or f"endpoint-{i + 1}"
+            })
+        return result
+
+    keys = [k.strip() for k in (api_key or "").split(",") if k.strip()]
+    bases = [b.strip() for b in (api_base or "").split(",") if b.strip()]
+    models = [m.strip() for m in (model or "").split(",") if m.strip()]
+
+    count = max(len(keys), len(bases), len(models), 1)
+    for label, values in (("API_KEY", keys), ("API_BASE", bases), ("MODEL", models)):
+        if len(values) not in (1, count):
+            raise ValueError(f"{label} 列表长度({len(values)})与端点数量({count})不一致")
+
+    def pick(values: List[str], i: int) -> str:
+        return values[i] if len(values) > 1 else values[0]
+
+    return [
+        {
+            "api_key": pick(keys, i),
+            "api_base": pick(bases, i),
+            "model": pick(models, i),
+            "weight": 1.0,
+            "max_concurrent": None,
+            "name": f"endpoint-{i + 1}"
+        }
+        for i in range(count)
+    ]
+
+
+class LLMBackend:
+    """单个LLM后端（endpoint + key + model）及其健康状态"""
+
+    EWMA_ALPHA = 0.2
+
+    def __init__(
+        self,
+        api_key: str,
+        api_base: str,
+        model: str,
+        weight: float = 1.0,
+        max_concurrent: Optional[int] = None,
+        name: str = ""
+    ):
+        self.name = name or f"{api_base}/{model}"
+        self.model = model
+        self.weight = max(weight, 0.01)
+        self.max_concurrent = max_concurrent
+        self.client = AsyncLLMClient(
+            api_key, api_base, model,
+            max_connections=max_concurrent or 100,
+            retry_on_rate_limit=False
+        )
+
+        self.in_flight = 0
+        self.ewma_latency: Optional[float] = None
+        self.ewma_error = 0.0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.ejections = 0  # 累计故障摘除次数（统计用）
+        self.backoff_level = 0  # 冷却时间翻倍的次数，持续健康后逐级降低
+        self.healthy_since = time.monotonic()  # 最近一次失败/摘除/降级的时间
+        self.requests = 0
+        self.failures = 0
+        self.rate_limited = 0
+
+    def is_ejected(self, now: float) -> bool:
+        """是否处于摘除冷却期"""
+        return now < self.ejected_until
+
+    def has_capacity(self) -> bool:
+        """是否还有并发余量"""
+        return self.max_concurrent is None or self.in_flight < self.max_concurrent
+
+    def score(self, default_latency: float) -> float:
+        """负载评分（越小越优先）：按权重归一化的负载 × 预期延迟 × 错误惩罚"""
+        latency = self.ewma_latency if self.ewma_latency is not None else default_latency
+        return (self.in_flight + 1) / self.weight * latency * (1.0 + 4.0 * self.ewma_error)
+
+    def record_success(self, latency: float) -> None:
+        """记录成功请求，更新EWMA延迟和错误率"""
+        self.requests += 1
+        self.consecutive_failures = 0
+        self.ewma_error *= (1 - self.EWMA_ALPHA)
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency += self.EWMA_ALPHA * (latency - self.ewma_latency)
+
+    def record_failure(self) -> None:
+        """记录失败请求"""
+        self.requests += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.ewma_error += self.EWMA_ALPHA * (1.0 - self.ewma_error)
+        self.healthy_since = time.monotonic()
+
+    def eject(self, seconds: float, count: bool = True) -> None:
+        """摘除一段时间（count=False 用于429冷却，不计入故障摘除次数）"""
+        self.ejected_until = max(self.ejected_until, time.monotonic() + seconds)
+        if count:
+            self.ejections += 1
+            self.backoff_level += 1
+            self.healthy_since = time.monotonic()
+
+    def healthy_for(self, now: float) -> float:
+        """摘除结束后持续没有失败的时长（秒）"""
+        return now - max(self.healthy_since, self.ejected_until)
+
+    def get_stats(self) -> Dict:
+        """后端健康统计"""
+        return {
+            "name": self.name,
+            "model": self.model,
+            "weight": self.weight,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "rate_limited": self.rate_limited,
+            "ewma_latency": round(self.ewma_latency, 2) if self.ewma_latency is not None else None,
+            "error_rate": round(self.ewma_error, 3),
+            "ejected": self.is_ejected(time.monotonic()),
+            "ejections": self.ejections,
+            "backoff_level": self.backoff_level
+        }
+
+
+class LLMRouter:
+    """
+    多后端路由器，接口与 AsyncLLMClient 一致（generate / aclose），
+    由 LLMClientPool 在配置了多个端点时使用
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Dict],
+        eject_after_failures: int = 3,
+        eject_error_rate: float = 0.5,
+        cooldown: float = 30.0,
+        max_cooldown: float = 300.0,
+        healthy_period: Optional[float] = None
+    ):
+        """
+        Args:
+            endpoints: parse_llm_endpoints() 返回的端点配置
+            eject_after_failures: 连续失败多少次后摘除
+            eject_error_rate: EWMA错误率超过该值时摘除
+            cooldown: 首次摘除的冷却时间（秒），连续摘除时翻倍
+            max_cooldown: 冷却时间上限（秒）
+            healthy_period: 摘除结束后持续健康多久（秒）冷却时间降一级（默认 max_cooldown）；
+                单次成功不清零，反复失败又恢复的后端冷却时间仍会翻倍
+        """
+        if not endpoints:
+            raise ValueError("LLMRouter 至少需要一个端点")
+
+        self.backends = [LLMBackend(**endpoint) for endpoint in endpoints]
+        self.eject_after_failures = eject_after_failures
+        self.eject_error_rate = eject_error_rate
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.healthy_period = max_cooldown if healthy_period is None else healthy_period
+        self._cond = asyncio.Condition()
+
+    @property
+    def model(self) -> str:
+        """所有后端使用的模型（逗号分隔）"""
+        return ",".join(sorted({b.model for b in self.backends}))
+
+    async def aclose(self) -> None:
+        """关闭所有后端的HTTP连接"""
+        for backend in self.backends:
+            await backend.client.aclose()
+
+    def get_stats(self) -> List[Dict]:
+        """所有后端的健康统计"""
+        return [backend.get_stats() for backend in self.backends]
+
+    def _pick(self, exclude: set) -> Optional[LLMBackend]:
+        """选择评分最低的可用后端（未摘除且有并发余量）"""
+        now = time.monotonic()
+        known = [b.ewma_latency for b in self.backends if b.ewma_latency is not None]
+        default_latency = sum(known) / len(known) if known else 1.0
+
+        candidates = [
+            b for b in self.backends
+            if b.name not in exclude and not b.is_ejected(now) and b.has_capacity()
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda b: b.score(default_latency))
+
+    async def _acquire_backend(self, exclude: set) -> Optional[LLMBackend]:
+        """获取后端槽位；全部繁忙时等待释放，全部摘除时等待最早恢复的那个"""
+        async with self._cond:
+            while True:
+                backend = self._pick(exclude)
+                if backend is not None:
+                    backend.in_flight += 1
+                    return backend
+
+                remaining = [b for b in self.backends if b.name not in exclude]
+                if not remaining:
+                    return None
+
+                now = time.monotonic()
+                ejected = [b.ejected_until - now for b in remaining if b.is_ejected(now)]
+                if len(ejected) == len(remaining):
+                    # 全部处于冷却期：等到最早的一个恢复
+                    timeout = min(ejected)
+                else:
+                    timeout = None
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _release_backend(self, backend: LLMBackend) -> None:
+        """释放后端槽位并唤醒等待者"""
+        async with self._cond:
+            backend.in_flight -= 1
+            self._cond.notify_all()
+
+    def _maybe_eject(self, backend: LLMBackend) -> None:
+        """连续失败或错误率过高时摘除后端"""
+        if backend.is_ejected(time.monotonic()):
+            return  # 摘除前已发出的请求陆续失败，不重复摘除
+        if (backend.consecutive_failures >= self.eject_after_failures
+                or backend.ewma_error >= self.eject_error_rate):
+            seconds = min(self.max_cooldown, self.cooldown * (2 ** min(backend.backoff_level, 4)))
+            backend.eject(seconds)
+            logger.warning(
+                f"LLM后端 {backend.name} 被摘除 {seconds:.0f}秒 "
+                f"(连续失败{backend.consecutive_failures}次, 错误率{backend.ewma_error:.2f})"
+            )
+
+    def _maybe_recover(self, backend: LLMBackend) -> None:
+        """摘除结束后持续健康 healthy_period 秒，冷却时间降一级（每个周期只降一级）"""
+        now = time.monotonic()
+        if backend.backoff_level and backend.healthy_for(now) >= self.healthy_period:
+            backend.backoff_level -= 1
+            backend.healthy_since = now
+
+    async def generate(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.7,
+        max_tokens: int = 3000,
+        timeout: int = 180,
+        on_text: Optional[Callable[[str], bool]] = None
+    ) -> str:
+        """路由到最优后端生成；限流或失败时切换到其他后端"""
+        tried = set()
+        last_error: Optional[Exception] = None
+
+        while len(tried) < len(self.backends):
+            backend = await self._acquire_backend(tried)
+            if backend is None:
+                break
+            tried.add(backend.name)
+
+            start = time.monotonic()
+            try:
+                result = await backend.client.generate(
+                    messages, temperature, max_tokens, timeout, on_text
+                )
+            except LLMRateLimitError as e:
+                # 只冷却这个key，立即尝试其他后端
+                backend.rate_limited += 1
+                backend.eject(e.retry_after if e.retry_after is not None else 1.0, count=False)
+                last_error = e
+                continue
+            except Exception as e:
+                backend.record_failure()
+                self._maybe_eject(backend)
+                last_error = e
+                continue
+            finally:
+                await self._release_backend(backend)
+
+            backend.record_success(time.monotonic() - start)
+            self._maybe_recover(backend)
+            return result
+
+        if isinstance(last_error, LLMRateLimitError):
+            # 所有后端都被限流：告诉上层等到最早恢复的后端
+            now = time.monotonic()
+            wait = min(max(0.0, b.ejected_until - now) for b in self.backends)
+            raise LLMRateLimitError(f"所有LLM后端均被限流: {last_error}", wait or None)
+        if last_error is not None:
+            raise last_error
+        raise RuntimeError("没有可用的LLM后端")
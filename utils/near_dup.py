@@ -0,0 +1,209 @@
+"""
+近似重复检测 - MinHash + LSH 分桶
+对每个人设的历史内容池建立索引，新推文只需与同桶的候选比较（近线性时间），
+不必两两比较。索引持久化到JSON，增量运行只对新文件/新推文计算签名。
+"""
+import json
+import os
+import random
+import re
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_WORD = re.compile(r"[\w']+")
+
+# 各字段的默认相似度阈值（估计的Jaccard相似度，word 3-gram）
+DEFAULT_THRESHOLDS = {
+    "tweet_text": 0.6,
+    "scene_hint": 0.8  # 场景描述模板化程度高，阈值更严
+}
+
+
+def shingles(text: str, k: int = 3) -> set:
+    """文本的 word k-gram 集合（小写、去标点；不足k个词时整句作为一个shingle）"""
+    words = _WORD.findall(text.lower())
+    if len(words) < k:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+
+class MinHasher:
+    """MinHash签名（num_perm 个 (a*x+b) mod p 的哈希函数）"""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, text: str) -> Optional[List[int]]:
+        """文本的MinHash签名（空文本返回None）"""
+        hashed = [zlib.crc32(s.encode("utf-8")) for s in shingles(text)]
+        if not hashed:
+            return None
+        return [
+            min((a * x + b) % _MERSENNE_PRIME for x in hashed)
+            for a, b in self._perms
+        ]
+
+
+def estimate_similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    """由两个签名估计Jaccard相似度"""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+class NearDuplicateIndex:
+    """
+    单个人设的近似重复索引（按字段分别建LSH桶）
+
+    持久化内容: 参数、已索引的文件（路径/大小/修改时间）、每条推文每个字段的签名；
+    LSH桶在加载时由签名重建。
+    """
+
+    FIELDS = ("tweet_text", "scene_hint")
+
+    def __init__(
+        self,
+        index_file: str,
+        num_perm: int = 64,
+        bands: int = 16,
+        thresholds: Optional[Dict[str, float]] = None
+    ):
+        """
+        Args:
+            index_file: 索引文件路径（不存在时新建）
+            num_perm: MinHash签名长度
+            bands: LSH分段数（每段 num_perm/bands 行；bands越多召回越高、候选越多）
+            thresholds: 各字段的相似度阈值（默认 DEFAULT_THRESHOLDS）
+        """
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) 必须是 bands ({bands}) 的整数倍")
+        self.index_file = Path(index_file)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+        self.hasher = MinHasher(num_perm)
+
+        self.files: Dict[str, Dict] = {}
+        self.signatures: Dict[str, Dict[str, List[int]]] = {field: {} for field in self.FIELDS}
+        self._buckets: Dict[str, Dict[Tuple, List[str]]] = {field: defaultdict(list) for field in self.FIELDS}
+        self.hashed = 0  # 本次运行新计算签名的推文数
+
+        if self.index_file.exists():
+            self._load(num_perm)
+
+    def _load(self, num_perm: int) -> None:
+        with open(self.index_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # 参数变化后旧签名不可比，丢弃重建
+        if data.get("num_perm") != num_perm or data.get("bands") != self.bands:
+            return
+        self.files = data.get("files", {})
+        for field in self.FIELDS:
+            for key, sig in data.get("signatures", {}).get(field, {}).items():
+                self._insert(field, key, sig)
+
+    def save(self) -> None:
+        """原子写入索引文件"""
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_file.with_name(self.index_file.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "num_perm": self.hasher.num_perm,
+                "bands": self.bands,
+                "files": self.files,
+                "signatures": self.signatures
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_file)
+
+    def _band_keys(self, sig: List[int]) -> Iterable[Tuple]:
+        for band in range(self.bands):
+            yield (band, *sig[band * self.rows:(band + 1) * self.rows])
+
+    def _insert(self, field: str, key: str, sig: List[int]) -> None:
+        self.signatures[field][key] = sig
+        for band_key in self._band_keys(sig):
+            self._buckets[field][band_key].append(key)
+
+    def _remove_file_entries(self, file_key: str) -> None:
+        prefix = f"{file_key}#"
+        for field in self.FIELDS:
+            stale = [key for key in self.signatures[field] if key.startswith(prefix)]
+            for key in stale:
+                for band_key in self._band_keys(self.signatures[field].pop(key)):
+                    self._buckets[field][band_key].remove(key)
+
+    def signatures_for(self, tweet: Dict) -> Dict[str, List[int]]:
+        """计算推文各字段的签名（空字段不包含）"""
+        self.hashed += 1
+        sigs = {}
+        for field in self.FIELDS:
+            sig = self.hasher.signature(tweet.get(field) or "")
+            if sig is not None:
+                sigs[field] = sig
+        return sigs
+
+    def add(self, key: str, sigs: Dict[str, List[int]]) -> None:
+        """把一条推文的签名加入索引"""
+        for field, sig in sigs.items():
+            self._insert(field, key, sig)
+
+    def mark_indexed(self, pool_file: str) -> None:
+        """登记内容池文件已被索引（其推文已用 "文件名#序号" 的key加入），之后sync不再重新计算"""
+        stat = os.stat(pool_file)
+        self.files[Path(pool_file).name] = {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def sync(self, pool_files: Iterable[str]) -> int:
+        """
+        增量同步历史内容池：只对新增或有变化的文件计算签名，已删除的文件移出索引
+
+        Returns:
+            新索引的推文数
+        """
+        current = {}
+        for pool_file in pool_files:
+            stat = os.stat(pool_file)
+            current[Path(pool_file).name] = (pool_file, {"size": stat.st_size, "mtime": stat.st_mtime})
+
+        for file_key in list(self.files):
+            if file_key not in current or self.files[file_key] != current[file_key][1]:
+                self._remove_file_entries(file_key)
+                del self.files[file_key]
+
+        added = 0
+        for file_key, (pool_file, meta) in current.items():
+            if file_key in self.files:
+                continue
+            with open(pool_file, 'r', encoding='utf-8') as f:
+                tweets = json.load(f).get("tweets", [])
+            for i, tweet in enumerate(tweets):
+                self.add(f"{file_key}#{i}", self.signatures_for(tweet))
+            self.files[file_key] = meta
+            added += len(tweets)
+        return added
+
+    def query(self, sigs: Dict[str, List[int]]) -> Optional[Dict]:
+        """
+        查找与推文近似重复的已索引条目（同一LSH桶的候选再按签名估计相似度过滤）
+
+        Args:
+            sigs: signatures_for 计算的签名
+
+        Returns:
+            相似度最高的匹配 {"of": key, "field": 字段, "similarity": 相似度}，无匹配时None
+        """
+        best = None
+        for field, sig in sigs.items():
+            candidates = set()
+            for band_key in self._band_keys(sig):
+                candidates.update(self._buckets[field].get(band_key, ()))
+            for key in candidates:
+                similarity = estimate_similarity(sig, self.signatures[field][key])
+                if similarity >= self.thresholds[field] and (best is None or similarity > best["similarity"]):
+                    best = {"of": key, "field": field, "similarity": round(similarity, 3)}
+        return best
@@ -0,0 +1,197 @@
+"""
+内容池文件的增量写入
+生成过程中每条推文追加到 JSONL sidecar，结束后从 sidecar 流式组装最终的
+内容池JSON（格式与 json.dump(pool, indent=2, ensure_ascii=False) 完全一致），
+内存占用与推文数量无关
+"""
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+# sidecar记录的标记：推文超长/违规，等待结束时的修复（修复后以同一spec_id追加新记录）
+PENDING_REPAIR = "pending_repair"
+
+
+def sidecar_path_for(output_file: str) -> Path:
+    """内容池文件对应的sidecar路径（xxx.json -> xxx.partial.jsonl）"""
+    path = Path(output_file)
+    return path.with_name(f"{path.stem}.partial.jsonl")
+
+
+class JsonlSidecar:
+    """逐条追加的JSONL文件（每行写完立即flush，进程崩溃时已完成的记录不丢失）"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: sidecar文件路径（已存在时追加）
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        # 上次崩溃时末行可能只写了一半，先换行，避免和新记录粘在同一行
+        if self._file.tell() > 0:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+        self.count = 0
+
+    def append(self, record: Dict) -> None:
+        """追加一条记录"""
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.count += 1
+
+    def close(self) -> None:
+        """关闭文件"""
+        self._file.close()
+
+    def __enter__(self) -> "JsonlSidecar":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def iter_jsonl(path: str) -> Iterator[Dict]:
+    """逐行读取JSONL（跳过空行和崩溃时写了一半的末行）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def _repair_state(path: str):
+    """(标记为待修复的spec_id, 其中之后已追加修复结果的spec_id)"""
+    pending, resolved = set(), set()
+    for record in iter_jsonl(path):
+        if record.get(PENDING_REPAIR):
+            pending.add(record.get("spec_id"))
+        elif record.get("spec_id") in pending:
+            resolved.add(record["spec_id"])
+    return pending, resolved
+
+
+def pending_repair_records(path: str) -> Iterator[Dict]:
+    """
+    sidecar中还没有修复结果的待修复记录（超长/违规的推文先标记写入，结束时再修复，
+    修复结果作为同一spec_id的新记录追加；中断后恢复时继续修复剩下的）
+    """
+    pending, resolved = _repair_state(path)
+    unresolved = pending - resolved
+    if not unresolved:
+        return
+    for record in iter_jsonl(path):
+        if record.get(PENDING_REPAIR) and record.get("spec_id") in unresolved:
+            unresolved.discard(record["spec_id"])
+            yield record
+
+
+def iter_pool_tweets(path: str) -> Iterator[Dict]:
+    """sidecar中的最终推文（待修复记录已有修复结果时跳过原记录，只取修复后的）"""
+    _, resolved = _repair_state(path)
+    for record in iter_jsonl(path):
+        if record.get(PENDING_REPAIR) and record.get("spec_id") in resolved:
+            continue
+        yield record["tweet"]
+
+
+def write_pool_file(
+    header: Dict,
+    tweets: Iterator[Dict],
+    output_file: str,
+    tweets_key: str = "tweets"
+) -> int:
+    """
+    流式写出内容池JSON：header的各字段在前，tweets数组逐条写入；
+    先写临时文件再原子替换，写到一半不会留下损坏的内容池文件
+
+    Args:
+        header: 除tweets以外的字段
+        tweets: 推文迭代器
+        output_file: 输出路径
+        tweets_key: 推文数组的字段名
+
+    Returns:
+        写入的推文数量
+    """
+    output_path = Path(output_file)
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    count = 0
+
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("{")
+        for key, value in header.items():
+            f.write("\n  " + json.dumps(key, ensure_ascii=False) + ": ")
+            f.write(_indent(json.dumps(value, ensure_ascii=False, indent=2), 2) + ",")
+
+        f.write("\n  " + json.dumps(tweets_key) + ": [")
+        for tweet in tweets:
+            f.write("," if count else "")
+            f.write("\n    " + _indent(json.dumps(tweet, ensure_ascii=False, indent=2), 4))
+            count += 1
+        f.write("\n  ]\n}" if count else "]\n}")
+
+    os.replace(tmp_path, output_path)
+    return count
+
+
+def _indent(text: str, spaces: int) -> str:
+    """给多行JSON的第2行起加缩进（嵌套到外层结构中）"""
+    return text.replace("\n", "\n" + " " * spaces)
+
+
+class PoolCheckpoint:
+    """
+    内容池运行的检查点
+
+    保存运行参数和完整的内容计划（含每个spec的spec_id）；已完成的推文记录在
+    内容池文件的 sidecar 中。中断后按 run_id 恢复，只重新生成缺失的spec。
+    """
+
+    def __init__(self, checkpoint_dir: str, run_id: str, meta: Optional[Dict] = None):
+        """
+        Args:
+            checkpoint_dir: 检查点目录
+            run_id: 运行ID
+            meta: 随检查点保存的额外信息（如人设文件路径，恢复时使用）
+        """
+        self.run_id = run_id
+        self.meta = meta or {}
+        self.path = Path(checkpoint_dir) / f"{run_id}.json"
+
+    def exists(self) -> bool:
+        """检查点是否存在"""
+        return self.path.exists()
+
+    def load(self) -> Dict:
+        """读取检查点"""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, state: Dict) -> None:
+        """原子写入检查点"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def update(self, **fields) -> None:
+        """更新检查点中的字段"""
+        state = self.load()
+        state.update(fields)
+        self.save(state)
+
+    @staticmethod
+    def completed_spec_ids(sidecar_path: Path) -> set:
+        """sidecar中已完成的spec_id"""
+        if not sidecar_path.exists():
+            return set()
+        return {record["spec_id"] for record in iter_jsonl(str(sidecar_path)) if "spec_id" in record}
@@ -0,0 +1,228 @@
+"""限流工具 - 用于LLM请求的RPM/TPM控制和自适应并发"""
+import asyncio
+import time
+from collections import deque
+from typing import Optional
+
+
+class TokenBucket:
+    """令牌桶（按每分钟速率补充，支持RPM/TPM限流）"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        初始化令牌桶
+
+        Args:
+            rate_per_minute: 每分钟补充的令牌数
+            capacity: 桶容量（默认等于每分钟速率，即允许一分钟的突发量）
+        """
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute 必须大于0")
+
+        self.rate = rate_per_minute / 60.0  # 每秒补充
+        self.capacity = capacity if capacity is not None else float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        """按流逝时间补充令牌"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """
+        获取令牌，不足时等待
+
+        Args:
+            amount: 需要的令牌数（超过桶容量时按容量计，避免永久等待）
+
+        Returns:
+            实际等待的秒数
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+
+        # 持锁等待，保证先到先得
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+
+                delay = (amount - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+    @property
+    def available(self) -> float:
+        """当前可用令牌数"""
+        self._refill()
+        return self.tokens
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    自适应并发限制器（AIMD：加性增、乘性减）
+
+    - 成功请求：每完成约 limit 个请求，limit + increase_step
+    - 收到429 / p95延迟膨胀：limit * decrease_factor（冷却期内只降一次）
+    - Retry-After：在指定时间内暂停派发新请求
+    - min_limit == max_limit 时退化为固定并发（仍然遵守Retry-After暂停）
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int = 1,
+        max_limit: Optional[int] = None,
+        increase_step: float = 1.0,
+        decrease_factor: float = 0.7,
+        latency_window: int = 50,
+        latency_tolerance: float = 2.0
+    ):
+        """
+        Args:
+            initial_limit: 初始并发上限
+            min_limit: 并发下限
+            max_limit: 并发上限（默认等于initial_limit）
+            increase_step: 每个"窗口"的加性增量
+            decrease_factor: 乘性减系数（0~1）
+            latency_window: 计算p95所用的最近样本数
+            latency_tolerance: p95超过基线的倍数即视为延迟膨胀
+        """
+        self.max_limit = max_limit if max_limit is not None else initial_limit
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+
+        self._limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self._active = 0
+        self._cond = asyncio.Condition()
+        self._pause_until = 0.0
+        self._last_decrease = 0.0
+
+        self._latencies = deque(maxlen=latency_window)
+        self._samples_since_eval = 0
+        self._baseline_p95: Optional[float] = None
+
+        # 统计
+        self.increases = 0
+        self.decreases = 0
+        self.rate_limited = 0
+
+    @property
+    def limit(self) -> int:
+        """当前生效的并发上限"""
+        return int(self._limit)
+
+    @property
+    def active(self) -> int:
+        """已占用的并发槽位"""
+        return self._active
+
+    @property
+    def adaptive(self) -> bool:
+        """是否启用自适应调整"""
+        return self.min_limit < self.max_limit
+
+    def latency_p95(self) -> Optional[float]:
+        """最近窗口的p95延迟（样本不足时返回None）"""
+        if len(self._latencies) < 10:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    async def acquire(self) -> None:
+        """获取并发槽位（遵守当前limit和Retry-After暂停）"""
+        while True:
+            pause = self._pause_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+
+            async with self._cond:
+                if time.monotonic() < self._pause_until:
+                    continue
+                if self._active < self.limit:
+                    self._active += 1
+                    return
+                await self._cond.wait()
+
+    async def release(self) -> None:
+        """释放并发槽位"""
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def on_success(self, latency: float) -> Optional[str]:
+        """
+        记录一次成功请求
+
+        Returns:
+            limit发生变化时返回原因（"increase" / "latency"），否则None
+        """
+        self._latencies.append(latency)
+        self._samples_since_eval += 1
+
+        if not self.adaptive:
+            return None
+
+        # 每积累半个窗口的新样本评估一次延迟
+        if self._samples_since_eval >= max(10, self._latencies.maxlen // 2):
+            self._samples_since_eval = 0
+            p95 = self.latency_p95()
+            if p95 is not None:
+                if self._baseline_p95 is None or p95 < self._baseline_p95:
+                    self._baseline_p95 = p95
+                elif p95 > self._baseline_p95 * self.latency_tolerance:
+                    if self._decrease():
+                        # 基线缓慢上移，避免持续高延迟时反复下调
+                        self._baseline_p95 *= 1.1
+                        return "latency"
+                    return None
+
+        # 加性增：每完成约limit个请求，limit增加increase_step
+        if self._limit < self.max_limit:
+            old = self.limit
+            self._limit = min(self.max_limit, self._limit + self.increase_step / self._limit)
+            if self.limit != old:
+                # 等待者会在调用方随后 release() 时被唤醒
+                self.increases += 1
+                return "increase"
+        return None
+
+    def on_rate_limit(self, retry_after: Optional[float] = None) -> bool:
+        """
+        记录一次429限流
+
+        Args:
+            retry_after: 服务端返回的Retry-After秒数
+
+        Returns:
+            limit是否被下调
+        """
+        self.rate_limited += 1
+        if retry_after:
+            self._pause_until = max(self._pause_until, time.monotonic() + retry_after)
+        return self.adaptive and self._decrease()
+
+    def _decrease(self) -> bool:
+        """乘性减（冷却期内只执行一次，防止429风暴把limit直接打到下限）"""
+        now = time.monotonic()
+        p95 = self.latency_p95()
+        cooldown = max(1.0, p95 or 0.0)
+        if now - self._last_decrease < cooldown:
+            return False
+
+        new_limit = max(float(self.min_limit), self._limit * self.decrease_factor)
+        if new_limit >= self._limit:
+            return False
+
+        self._limit = new_limit
+        self._last_decrease = now
+        self.decreases += 1
+        return True
@@ -0,0 +1,243 @@
+"""
+阶段依赖图执行器
+每个阶段声明依赖的输入（初始输入或其他阶段的输出），依赖全部就绪即开始运行，
+互不依赖的阶段自动并发；记录每个阶段的开始时间、耗时、尝试次数和错误。
+
+可选的检查点（StageCheckpoint）按 "阶段参数 + 各输入内容的哈希" 保存每个成功阶段的输出，
+重跑时输入和参数都没变的阶段直接复用，只有缺失、失败或上游变化的阶段重新运行。
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class StageFailed(Exception):
+    """必需阶段重试后仍失败"""
+
+    def __init__(self, stage: str, error: Exception):
+        super().__init__(f"阶段 {stage} 失败: {error}")
+        self.stage = stage
+        self.error = error
+
+
+def fingerprint(obj: Any) -> str:
+    """JSON内容的哈希（key顺序无关）"""
+    payload = json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class StageCheckpoint:
+    """阶段输出的磁盘检查点：每个阶段一个文件 {directory}/{stage}.json = {"key", "output", "saved_at"}"""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    def _path(self, stage: str) -> Path:
+        return self.directory / f"{stage}.json"
+
+    def load(self, stage: str, key: str) -> Tuple[bool, Any]:
+        """返回 (是否命中, 输出)；key不一致（参数或输入变了）视为未命中"""
+        path = self._path(stage)
+        if not path.exists():
+            return False, None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return False, None
+        if saved.get("key") != key:
+            return False, None
+        return True, saved.get("output")
+
+    def save(self, stage: str, key: str, output: Any) -> None:
+        """原子写入阶段输出（临时文件名唯一，同一图片的并发运行互不干扰，后写入的生效）"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            'w', encoding='utf-8', dir=self.directory, prefix=f".{stage}.", suffix=".tmp", delete=False
+        ) as f:
+            json.dump({"key": key, "output": output, "saved_at": time.time()}, f, ensure_ascii=False)
+        try:
+            os.replace(f.name, self._path(stage))
+        except OSError:
+            os.unlink(f.name)
+            raise
+
+
+class Stage:
+    """依赖图中的一个阶段"""
+
+    def __init__(
+        self,
+        name: str,
+        run: Callable[..., Awaitable[Any]],
+        deps: Iterable[str] = (),
+        required: bool = True,
+        retries: int = 0,
+        default: Any = None,
+        params: Any = None
+    ):
+        """
+        Args:
+            name: 阶段名（也是输出在结果中的key）
+            run: 协程函数，以依赖名为关键字参数调用
+            deps: 依赖的初始输入名或阶段名
+            required: 必需阶段重试后仍失败时整个图失败；非必需阶段失败时输出 default
+            retries: 失败后的重试次数
+            default: 非必需阶段失败时的输出
+            params: 影响输出的参数（参与检查点key，需可JSON序列化）
+        """
+        self.name = name
+        self.run = run
+        self.deps = tuple(deps)
+        self.required = required
+        self.retries = retries
+        self.default = default
+        self.params = params
+
+
+class StageGraph:
+    """按依赖关系调度阶段的执行器"""
+
+    def __init__(self, stages: List[Stage], checkpoint: Optional[StageCheckpoint] = None):
+        """
+        Args:
+            stages: 阶段列表
+            checkpoint: 阶段输出检查点（None则不保存/复用）
+        """
+        self.checkpoint = checkpoint
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("阶段名重复")
+        self._check_acyclic()
+        self.report: Dict[str, Dict] = {}  # 阶段名 -> {status, started_at, seconds, attempts, error?}
+        # status: ok / cached（检查点复用）/ skipped（非必需阶段失败）/ failed / cancelled
+        self.total_seconds = 0.0
+
+    def _check_acyclic(self) -> None:
+        visiting, done = set(), set()
+
+        def visit(name: str, path: List[str]) -> None:
+            if name in done or name not in self.stages:
+                return
+            if name in visiting:
+                raise ValueError(f"阶段依赖存在环: {' -> '.join(path + [name])}")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep, path + [name])
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name, [])
+
+    async def run(
+        self,
+        inputs: Optional[Dict[str, Any]] = None,
+        refresh: Iterable[str] = ()
+    ) -> Dict[str, Any]:
+        """
+        运行所有阶段
+
+        Args:
+            inputs: 初始输入（阶段可以把它们作为依赖）
+            refresh: 忽略检查点、强制重新运行的阶段名（新输出仍会写入检查点）
+
+        Returns:
+            初始输入 + 各阶段输出
+
+        Raises:
+            StageFailed: 必需阶段失败（其余未完成的阶段会被取消）
+        """
+        results = dict(inputs or {})
+        missing = {
+            dep for stage in self.stages.values() for dep in stage.deps
+            if dep not in self.stages and dep not in results
+        }
+        if missing:
+            raise ValueError(f"缺少阶段依赖的输入: {', '.join(sorted(missing))}")
+
+        refresh = set(refresh)
+        self.report = {}
+        self.total_seconds = 0.0
+        origin = time.monotonic()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(stage: Stage) -> None:
+            upstream = [tasks[dep] for dep in stage.deps if dep in tasks]
+            if upstream:
+                await asyncio.gather(*upstream)
+
+            kwargs = {dep: results[dep] for dep in stage.deps}
+            entry = self.report[stage.name] = {
+                "status": "running",
+                "started_at": round(time.monotonic() - origin, 3),
+                "seconds": 0.0,
+                "attempts": 0
+            }
+            cache_key = None
+            if self.checkpoint is not None:
+                cache_key = fingerprint({
+                    "stage": stage.name,
+                    "params": stage.params,
+                    "inputs": {dep: fingerprint(value) for dep, value in kwargs.items()}
+                })
+                if stage.name not in refresh:
+                    hit, output = self.checkpoint.load(stage.name, cache_key)
+                    if hit:
+                        results[stage.name] = output
+                        entry["status"] = "cached"
+                        return
+
+            start = time.monotonic()
+            while True:
+                entry["attempts"] += 1
+                try:
+                    results[stage.name] = await stage.run(**kwargs)
+                    entry["status"] = "ok"
+                    break
+                except asyncio.CancelledError:
+                    entry["status"] = "cancelled"
+                    raise
+                except Exception as e:
+                    entry["error"] = str(e)
+                    if entry["attempts"] <= stage.retries:
+                        continue
+                    if stage.required:
+                        entry["status"] = "failed"
+                        raise StageFailed(stage.name, e) from e
+                    entry["status"] = "skipped"
+                    results[stage.name] = stage.default
+                    break
+                finally:
+                    entry["seconds"] = round(time.monotonic() - start, 3)
+
+            if entry["status"] == "ok" and cache_key is not None:
+                self.checkpoint.save(stage.name, cache_key, results[stage.name])
+
+        # 按依赖顺序创建任务（依赖的任务先创建）
+        def schedule(name: str) -> None:
+            if name in tasks or name not in self.stages:
+                return
+            for dep in self.stages[name].deps:
+                schedule(dep)
+            tasks[name] = asyncio.ensure_future(run_stage(self.stages[name]))
+
+        for name in self.stages:
+            schedule(name)
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        finally:
+            self.total_seconds = round(time.monotonic() - origin, 3)
+
+        return results
@@ -0,0 +1,67 @@
+"""
+推文长度的本地处理
+超长推文先用确定性的规则缩短（多余空白、重复分句、末尾emoji），
+只有规则处理不了的才交给LLM改写
+"""
+import re
+
+MAX_TWEET_LENGTH = 270
+
+# emoji及其修饰符（变体选择符、肤色、ZWJ连接符）
+_EMOJI_CHARS = (
+    "\U0001F000-\U0001FAFF"
+    "\u2600-\u27BF"
+    "\u2B00-\u2BFF"
+    "\uFE0F\u200D"
+)
+_TRAILING_EMOJI = re.compile(rf"[\s{_EMOJI_CHARS}]*[{_EMOJI_CHARS}][\s{_EMOJI_CHARS}]*$")
+_CLAUSE_SPLIT = re.compile(r"(?<=[.!?…])\s+")
+
+
+def _normalize_whitespace(text: str) -> str:
+    """合并连续空白和重复标点（保留换行）"""
+    text = re.sub(r"[ \t\u00a0]+", " ", text)
+    text = re.sub(r" *\n *", "\n", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    text = re.sub(r"([!?])\1+", r"\1", text)
+    text = re.sub(r"\.{4,}", "...", text)
+    return text.strip()
+
+
+def _drop_duplicate_clauses(text: str) -> str:
+    """删除重复出现的分句（忽略大小写和标点，保留第一次出现）"""
+    kept = []
+    seen = set()
+    for line in text.split("\n"):
+        clauses = []
+        for clause in _CLAUSE_SPLIT.split(line):
+            key = re.sub(r"[^\w\s]", "", clause).lower().strip()
+            if key and key in seen:
+                continue
+            seen.add(key)
+            clauses.append(clause)
+        kept.append(" ".join(clauses))
+    return "\n".join(kept).strip()
+
+
+def _strip_trailing_emoji(text: str) -> str:
+    """去掉末尾的emoji"""
+    return _TRAILING_EMOJI.sub("", text).rstrip()
+
+
+def shorten_locally(text: str, max_length: int = MAX_TWEET_LENGTH) -> str:
+    """
+    用确定性规则缩短超长推文，按信息损失从小到大依次尝试，长度达标即停止
+
+    Args:
+        text: 推文文本
+        max_length: 最大长度
+
+    Returns:
+        缩短后的文本（规则处理不了时仍可能超长，需要LLM改写）
+    """
+    for step in (_normalize_whitespace, _drop_duplicate_clauses, _strip_trailing_emoji):
+        if len(text) <= max_length:
+            break
+        text = step(text)
+    return text